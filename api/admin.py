@@ -1,6 +1,17 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.utils import unquote
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.models import User
-from .models import Voucher, FlightInformation, Mautamer, VoucherMautamer, Hotel, Transportation
+from django.http import QueryDict
+from .models import (
+    Voucher, FlightInformation, Mautamer, VoucherMautamer, Hotel, Transportation, ArchivedVoucher,
+    HotelAllotment, HotelNight, VoucherChange, VoucherTemplate
+)
+from .journal import record_change, snapshot
+from .pagination import EstimatedCountPaginator
+from .sharding import locate, shard_for, shards, using_shard
+from .stays import rebuild_nights
 
 
 class FlightInformationInline(admin.StackedInline):
@@ -9,11 +20,150 @@ class FlightInformationInline(admin.StackedInline):
     max_num = 1
 
 
+class LargeTableMixin:
+    """Changelists of the big tables: estimated counts (api/pagination.py)"""
+    paginator = EstimatedCountPaginator
+    # The unfiltered total would be one more full COUNT(*) per filtered page
+    show_full_result_count = False
+
+
+def requested_shard(request):
+    """?shard= of a changelist, or of the changelist a form was opened from"""
+    alias = request.GET.get('shard')
+    if alias is None:
+        alias = QueryDict(request.GET.get('_changelist_filters', '')).get('shard')
+    return alias if alias in shards() else shards()[0]
+
+
+class ShardFilter(admin.SimpleListFilter):
+    """Shard a changelist reads, the first one unless another is picked"""
+    title = 'shard'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in shards()]
+
+    def value(self):
+        value = super().value()
+        return value if value in shards() else shards()[0]
+
+    def choices(self, changelist):
+        # No "All": a changelist is one queryset, on one database
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': self.value() == lookup,
+                'query_string': changelist.get_query_string({self.parameter_name: lookup}),
+                'display': title,
+            }
+
+    def queryset(self, request, queryset):
+        return queryset.using(self.value())
+
+
+class ShardedAdminMixin:
+    """
+    Admin of a sharded model. With DATABASE_SHARDS set a changelist shows
+    one shard at a time (ShardFilter), while the change, delete and history
+    pages find the row on whichever shard holds it. Each of these views runs
+    on that shard, template included, so inlines and related rows are read
+    there too. Autocompletes search the first shard, except the mautamers
+    of one agent (MautamerAdmin), which are searched on the agent's shard.
+    """
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if settings.DATABASE_SHARDS:
+            return [ShardFilter, *list_filter]
+        return list_filter
+
+    def object_shard(self, request, object_id):
+        pk = unquote(object_id) if object_id is not None else ''
+        return (pk.isdigit() and locate(self.model, int(pk))) or requested_shard(request)
+
+    def on_shard(self, alias, view, *args):
+        with using_shard(alias):
+            response = view(*args)
+            # A TemplateResponse reads its querysets when rendered, do it here
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+    def changelist_view(self, request, extra_context=None):
+        if not settings.DATABASE_SHARDS:
+            return super().changelist_view(request, extra_context)
+        return self.on_shard(
+            requested_shard(request), super().changelist_view, request, extra_context)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        if not settings.DATABASE_SHARDS:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        return self.on_shard(self.object_shard(request, object_id), super().changeform_view,
+                             request, object_id, form_url, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        if not settings.DATABASE_SHARDS:
+            return super().delete_view(request, object_id, extra_context)
+        return self.on_shard(self.object_shard(request, object_id), super().delete_view,
+                             request, object_id, extra_context)
+
+    def history_view(self, request, object_id, extra_context=None):
+        if not settings.DATABASE_SHARDS:
+            return super().history_view(request, object_id, extra_context)
+        return self.on_shard(self.object_shard(request, object_id), super().history_view,
+                             request, object_id, extra_context)
+
+
+class AgentMautamerSelect(AutocompleteSelect):
+    """
+    Mautamer autocomplete limited to one agent (MautamerAdmin reads ?agent=).
+    Labels of the already selected mautamers come from `labels`, so the
+    rows of an inline don't look them up one by one.
+    """
+
+    def __init__(self, *args, agent_id=None, labels=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.agent_id = agent_id
+        self.labels = labels or {}
+
+    def get_url(self):
+        url = super().get_url()
+        return f'{url}?agent={self.agent_id}' if self.agent_id else url
+
+    def optgroups(self, name, value, attr=None):
+        selected = [str(v) for v in value if str(v) not in self.choices.field.empty_values]
+        if not all(v in self.labels for v in selected):
+            return super().optgroups(name, value, attr)
+        default = (None, [], 0)
+        if not self.is_required:
+            default[1].append(self.create_option(name, '', '', False, 0))
+        for v in selected[:1]:
+            default[1].append(self.create_option(name, v, self.labels[v], True, len(default[1])))
+        return [default]
+
+
 class VoucherMautamerInline(admin.TabularInline):
     model = VoucherMautamer
     extra = 1
     autocomplete_fields = ['mautamer']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('voucher', 'mautamer__user')
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        if obj is not None:
+            # Search only this voucher's agent, labels of its rows in one query
+            # (get_formset runs several times per request)
+            if not hasattr(request, 'mautamer_labels'):
+                request.mautamer_labels = {
+                    str(mautamer.pk): str(mautamer) for mautamer in Mautamer.objects.filter(
+                        voucher_assignments__voucher=obj).select_related('user')}
+            field = formset.form.base_fields['mautamer']
+            field.widget.widget = AgentMautamerSelect(
+                field.widget.widget.field, self.admin_site,
+                agent_id=obj.user_id, labels=request.mautamer_labels)
+        return formset
+
 
 class HotelInline(admin.TabularInline):
     model = Hotel
@@ -25,36 +175,147 @@ class TransportationInline(admin.TabularInline):
     extra = 1
 
 
+def hotel_names(vouchers):
+    return set(Hotel.objects.filter(voucher__in=vouchers).values_list('hotel_name', flat=True))
+
+
+def rebuild_hotels(names):
+    """Admin writes skip book(), recount the nights of the hotels they touched"""
+    for hotel_name in sorted(names):
+        rebuild_nights(hotel_name)
+
+
+class VoucherSummaryMixin:
+    """Refresh the summary columns of the vouchers these rows belong to"""
+
+    def affected_vouchers(self, queryset):
+        return Voucher.objects.filter(id__in=list(
+            queryset.values_list('voucher_id', flat=True).distinct()))
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if obj.voucher_id:
+            Voucher.objects.filter(pk=obj.voucher_id).refresh_summaries()
+        if change and 'voucher' in form.changed_data and form.initial.get('voucher'):
+            Voucher.objects.filter(pk=form.initial['voucher']).refresh_summaries()
+
+    def delete_model(self, request, obj):
+        voucher_id = obj.voucher_id
+        super().delete_model(request, obj)
+        Voucher.objects.filter(pk=voucher_id).refresh_summaries()
+
+    def delete_queryset(self, request, queryset):
+        vouchers = self.affected_vouchers(queryset)
+        super().delete_queryset(request, queryset)
+        vouchers.refresh_summaries()
+
+
 @admin.register(Voucher)
-class VoucherAdmin(admin.ModelAdmin):
+class VoucherAdmin(ShardedAdminMixin, LargeTableMixin, admin.ModelAdmin):
     list_display = ['vNo', 'agentName', 'status', 'user', 'created_at']
     list_filter = ['status', 'created_at']
+    list_select_related = ['user']
     search_fields = ['vNo', 'agentName', 'user__username']
+    autocomplete_fields = ['user']
     inlines = [FlightInformationInline, VoucherMautamerInline,
                HotelInline, TransportationInline]
 
+    def save_model(self, request, obj, form, change):
+        if change:
+            # The form already changed obj, the journal diffs against the stored voucher
+            request.voucher_before = snapshot(Voucher.objects.get(pk=obj.pk))
+            request.hotels_before = hotel_names([obj.pk])
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.refresh_summary()
+        record_change(
+            form.instance, request.user,
+            VoucherChange.UPDATED if change else VoucherChange.CREATED,
+            getattr(request, 'voucher_before', None), snapshot(form.instance),
+            source=VoucherChange.ADMIN)
+        # Status and hotel rows both change the rooms held
+        rebuild_hotels(getattr(request, 'hotels_before', set()) | hotel_names([form.instance.pk]))
+
+    def delete_model(self, request, obj):
+        record_change(obj, request.user, VoucherChange.DELETED,
+                      before=snapshot(obj, parts=[]), source=VoucherChange.ADMIN)
+        names = hotel_names([obj.pk])
+        super().delete_model(request, obj)
+        rebuild_hotels(names)
+
+    def delete_queryset(self, request, queryset):
+        for voucher in queryset:
+            record_change(voucher, request.user, VoucherChange.DELETED,
+                          before=snapshot(voucher, parts=[]), source=VoucherChange.ADMIN)
+        names = hotel_names(list(queryset.values_list('pk', flat=True)))
+        super().delete_queryset(request, queryset)
+        rebuild_hotels(names)
+
 
 @admin.register(FlightInformation)
-class FlightInformationAdmin(admin.ModelAdmin):
+class FlightInformationAdmin(ShardedAdminMixin, LargeTableMixin, VoucherSummaryMixin,
+                             admin.ModelAdmin):
     list_display = ['voucher', 'departure_date',
                     'return_date', 'sector_from', 'sector_to']
+    list_select_related = ['voucher']
     search_fields = ['voucher__vNo']
+    autocomplete_fields = ['voucher']
 
 
 @admin.register(Mautamer)
-class MautamerAdmin(admin.ModelAdmin):
+class MautamerAdmin(ShardedAdminMixin, LargeTableMixin, admin.ModelAdmin):
     list_display = ['pax_name', 'passport', 'user', 'created_at']
     list_filter = ['user', 'created_at']
+    list_select_related = ['user']
     search_fields = ['pax_name', 'passport', 'user__username']
     ordering = ['user', 'pax_name']
+    autocomplete_fields = ['user']
+
+    def get_queryset(self, request):
+        # str() of a mautamer shows its agent, autocomplete results use it
+        return super().get_queryset(request).select_related('user')
+
+    def agent_scope(self, request):
+        agent = request.GET.get('agent', '')
+        return int(agent) if agent.isdigit() else None
+
+    def get_search_fields(self, request):
+        if self.agent_scope(request) is not None:
+            # Passport prefix or name within one agent, on the (user, ...) indexes
+            return ['^passport', 'pax_name']
+        return super().get_search_fields(request)
+
+    def get_search_results(self, request, queryset, search_term):
+        agent = self.agent_scope(request)
+        if agent is not None:
+            queryset = queryset.filter(user_id=agent)
+            alias = shard_for(agent)
+            if alias is not None:
+                queryset = queryset.using(alias)
+        return super().get_search_results(request, queryset, search_term)
+
+    def delete_queryset(self, request, queryset):
+        # Deleting a mautamer drops it from its vouchers as well
+        vouchers = Voucher.objects.filter(id__in=list(VoucherMautamer.objects.filter(
+            mautamer__in=queryset).values_list('voucher_id', flat=True).distinct()))
+        super().delete_queryset(request, queryset)
+        vouchers.refresh_summaries()
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Mautamer.objects.filter(pk=obj.pk))
 
 
 @admin.register(VoucherMautamer)
-class VoucherMautamerAdmin(admin.ModelAdmin):
+class VoucherMautamerAdmin(ShardedAdminMixin, LargeTableMixin, VoucherSummaryMixin,
+                           admin.ModelAdmin):
     list_display = ['voucher', 'mautamer', 'get_agent']
     list_filter = ['voucher__user']
+    list_select_related = ['voucher__user', 'mautamer__user']
     search_fields = ['voucher__vNo',
                      'mautamer__pax_name', 'mautamer__passport']
+    autocomplete_fields = ['voucher', 'mautamer']
 
     def get_agent(self, obj):
         return obj.voucher.user.username
@@ -62,13 +323,104 @@ class VoucherMautamerAdmin(admin.ModelAdmin):
 
 
 @admin.register(Hotel)
-class HotelAdmin(admin.ModelAdmin):
+class HotelAdmin(ShardedAdminMixin, LargeTableMixin, admin.ModelAdmin):
     list_display = ['hotel_name', 'city',
                     'checking_date', 'checkout_date', 'voucher']
+    list_select_related = ['voucher']
     search_fields = ['hotel_name', 'city', 'voucher__vNo']
+    autocomplete_fields = ['voucher']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        rebuild_hotels({obj.hotel_name, form.initial.get('hotel_name') or obj.hotel_name})
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        rebuild_hotels({obj.hotel_name})
+
+    def delete_queryset(self, request, queryset):
+        names = set(queryset.values_list('hotel_name', flat=True))
+        super().delete_queryset(request, queryset)
+        rebuild_hotels(names)
 
 
 @admin.register(Transportation)
-class TransportationAdmin(admin.ModelAdmin):
+class TransportationAdmin(ShardedAdminMixin, LargeTableMixin, admin.ModelAdmin):
     list_display = ['type_of_transfer', 'from_location', 'date', 'voucher']
+    list_select_related = ['voucher']
     search_fields = ['from_location', 'voucher__vNo']
+    autocomplete_fields = ['voucher']
+
+
+@admin.register(ArchivedVoucher)
+class ArchivedVoucherAdmin(LargeTableMixin, admin.ModelAdmin):
+    list_display = ['vNo', 'agentName', 'status', 'return_date', 'archived_at']
+    list_filter = ['status']
+    search_fields = ['vNo', 'agentName']
+    readonly_fields = [field.name for field in ArchivedVoucher._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(HotelAllotment)
+class HotelAllotmentAdmin(admin.ModelAdmin):
+    """Saving or deleting a block rebuilds that hotel's nightly capacity"""
+    list_display = ['hotel_name', 'start_date', 'end_date', 'rooms']
+    search_fields = ['hotel_name']
+    date_hierarchy = 'start_date'
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        rebuild_nights(obj.hotel_name)
+        if change and form.initial.get('hotel_name') not in (None, obj.hotel_name):
+            rebuild_nights(form.initial['hotel_name'])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        rebuild_nights(obj.hotel_name)
+
+    def delete_queryset(self, request, queryset):
+        hotel_names = set(queryset.values_list('hotel_name', flat=True))
+        super().delete_queryset(request, queryset)
+        for hotel_name in hotel_names:
+            rebuild_nights(hotel_name)
+
+
+@admin.register(HotelNight)
+class HotelNightAdmin(LargeTableMixin, admin.ModelAdmin):
+    list_display = ['hotel_name', 'night', 'booked', 'allotted']
+    search_fields = ['hotel_name']
+    date_hierarchy = 'night'
+    readonly_fields = ['hotel_name', 'night', 'booked', 'allotted']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(VoucherChange)
+class VoucherChangeAdmin(LargeTableMixin, admin.ModelAdmin):
+    """The journal is append-only, read here but never edited"""
+    list_display = ['vNo', 'action', 'source', 'actor', 'changed_at']
+    list_select_related = ['actor']
+    list_filter = ['action', 'source']
+    search_fields = ['vNo']
+    date_hierarchy = 'changed_at'
+    readonly_fields = [field.name for field in VoucherChange._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(VoucherTemplate)
+class VoucherTemplateAdmin(admin.ModelAdmin):
+    list_display = ['name', 'user', 'updated_at']
+    list_select_related = ['user']
+    search_fields = ['name', 'user__username']
+    autocomplete_fields = ['user']
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from .sharding import reserve_id_ranges
+
+        post_migrate.connect(reserve_id_ranges, sender=self, dispatch_uid='api-shard-id-ranges')
@@ -0,0 +1,70 @@
+"""
+Hot/cold split of vouchers.
+
+Vouchers whose return date is past a cutoff are copied into ArchivedVoucher
+as one document each and then deleted from the live tables (their flight,
+hotels, transport and passenger rows go with them). Batches are keyed by
+voucher id and the copy ignores rows already archived, so an interrupted
+run is simply started again. The rooms the vouchers held are released
+(api/stays.py), once: vouchers already archived by an interrupted run
+released theirs then.
+"""
+from django.db import router, transaction
+
+from .models import Voucher, ArchivedVoucher
+from .serializers import VoucherDetailSerializer
+from .stays import book, counted
+
+
+def archivable(cutoff):
+    return Voucher.objects.filter(return_date__lt=cutoff)
+
+
+def to_archive(voucher):
+    flight_info = voucher.flight_info
+    return ArchivedVoucher(
+        voucher_id=voucher.id,
+        user_id=voucher.user_id,
+        vNo=voucher.vNo,
+        agentName=voucher.agentName,
+        status=voucher.status,
+        groupName=voucher.groupName,
+        departure_date=flight_info.departure_date,
+        return_date=flight_info.return_date,
+        created_at=voucher.created_at,
+        data=VoucherDetailSerializer(voucher).data,
+    )
+
+
+def archive_batch(voucher_ids):
+    """Move the given vouchers into the archive, returns how many moved"""
+    vouchers = Voucher.objects.filter(id__in=voucher_ids).with_details()
+    rows = [to_archive(voucher) for voucher in vouchers]
+    if not rows:
+        return 0
+
+    archive_db = router.db_for_write(ArchivedVoucher)
+    live_db = router.db_for_write(Voucher)
+    archived = set(ArchivedVoucher.objects.using(archive_db).filter(
+        voucher_id__in=[row.voucher_id for row in rows]).values_list('voucher_id', flat=True))
+    held = [
+        (hotel.hotel_name, hotel.checking_date, hotel.checkout_date)
+        for voucher in vouchers if voucher.id not in archived
+        for hotel in counted(voucher.status, voucher.hotels.all())
+    ]
+    # Same database: one transaction. Separate archive: the copy commits
+    # first, a crash before the delete only leaves rows to delete next run.
+    with transaction.atomic(using=live_db):
+        with transaction.atomic(using=archive_db), transaction.atomic():
+            ArchivedVoucher.objects.using(archive_db).bulk_create(
+                rows, ignore_conflicts=True)
+            book([], held)
+        Voucher.objects.filter(id__in=[row.voucher_id for row in rows]).delete()
+    return len(rows)
+
+
+def archived_voucher(user, pk):
+    archived = ArchivedVoucher.objects.filter(voucher_id=pk)
+    if not user.is_staff:
+        archived = archived.filter(user=user)
+    return archived.first()
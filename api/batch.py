@@ -0,0 +1,212 @@
+"""
+Several API calls in one HTTP request.
+
+    POST api/batch/
+    {"requests": [
+        {"id": "voucher", "method": "GET", "path": "/vouchers/12/"},
+        {"id": "mautamers", "method": "GET", "path": "/api/agent/mautamers/"},
+        {"id": "sidebar", "method": "GET", "path": "/vouchers/?fields=id,vNo,status"}
+    ]}
+
+    {"responses": [{"id": "voucher", "status": 200, "headers": {...}, "body": {...}}, ...]}
+
+Every sub-request is resolved against backend/urls.py and handed straight
+to its DRF view in this process, in order. The batch is authenticated
+once: the views get its user and token as already authenticated
+(Request's forced authentication), so the token is verified and the user
+loaded a single time, and there is no middleware pass, routing or network
+round trip per call. Sub-requests run on the batch's shard and database
+connection; a GET of a read_from_replica view goes to a replica like a
+direct call would, until a write in the same batch.
+
+With BATCH_MAX_WORKERS above 1, consecutive GETs run concurrently on that
+many threads, each on its own database connection. Writes always run
+alone, in order, on the batch's thread. Only worth it on a database that
+serves reads in parallel (PostgreSQL, MySQL); with SQLite keep it at 1.
+
+Each sub-request succeeds or fails on its own. Streaming responses (the
+export) and non-API routes are not available in a batch.
+"""
+import contextvars
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+from rest_framework import serializers
+from rest_framework.views import APIView
+
+from .middleware import SAFE_METHODS, replica_for
+from .routers import read_database
+
+logger = logging.getLogger(__name__)
+
+METHODS = ['GET', 'POST', 'PUT', 'PATCH', 'DELETE']
+# Headers of the batch request the sub-requests don't inherit: they are
+# answered as plain JSON, each with its own body
+DROPPED_HEADERS = [
+    'CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_ACCEPT_ENCODING', 'HTTP_IF_NONE_MATCH',
+    'HTTP_IF_MODIFIED_SINCE', 'HTTP_X_HTTP_METHOD_OVERRIDE',
+]
+RESPONSE_HEADERS = ['Content-Type', 'ETag', 'Retry-After', 'Location']
+
+
+class SubRequestSerializer(serializers.Serializer):
+    id = serializers.CharField(max_length=100, required=False)
+    method = serializers.ChoiceField(choices=METHODS, default='GET')
+    path = serializers.RegexField(r'^/', max_length=2000)
+    body = serializers.JSONField(required=False)
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = SubRequestSerializer(many=True, allow_empty=False)
+
+    def validate_requests(self, value):
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(
+                f'At most {settings.BATCH_MAX_REQUESTS} requests per batch.')
+        return value
+
+
+class Result:
+    """Outcome of one sub-request, body as JSON bytes"""
+
+    def __init__(self, status, body, headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+    @classmethod
+    def error(cls, status, message):
+        return cls(status, json.dumps({'error': message}).encode(),
+                   {'Content-Type': 'application/json'})
+
+
+class Batch:
+    def __init__(self, request, items):
+        """`request` is the batch's DRF request, `items` its validated sub-requests"""
+        self.request = request
+        self.items = items
+
+    def run(self):
+        results = [None] * len(self.items)
+        wrote = False
+        reads = []
+        for index, item in enumerate(self.items):
+            if item['method'] in SAFE_METHODS:
+                reads.append(index)
+                continue
+            self.run_reads(reads, results, wrote)
+            reads = []
+            results[index] = self.call(item)
+            wrote = True
+        self.run_reads(reads, results, wrote)
+        return results
+
+    def run_reads(self, indexes, results, wrote):
+        workers = min(settings.BATCH_MAX_WORKERS, len(indexes))
+        if workers <= 1:
+            for index in indexes:
+                results[index] = self.call(self.items[index], replica=not wrote)
+            return
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch') as pool:
+            # Each task in a copy of this context: same shard and metrics
+            futures = {
+                index: pool.submit(contextvars.copy_context().run, self.call_in_thread,
+                                   self.items[index], not wrote)
+                for index in indexes
+            }
+            for index, future in futures.items():
+                results[index] = future.result()
+
+    def call_in_thread(self, item, replica):
+        try:
+            return self.call(item, replica)
+        finally:
+            # Connections are per thread, pool threads don't outlive the batch
+            connections.close_all()
+
+    def call(self, item, replica=True):
+        url = urlsplit(item['path'])
+        try:
+            match = resolve(url.path, urlconf=getattr(self.request, 'urlconf', None))
+        except Resolver404:
+            return Result.error(404, f"No route for {url.path}")
+        view_class = getattr(match.func, 'view_class', None)
+        if view_class is None or not issubclass(view_class, APIView) \
+                or view_class is getattr(self.request.resolver_match.func, 'view_class', None):
+            return Result.error(404, f"{url.path} is not available in a batch")
+
+        request = self.sub_request(item, url)
+        request.resolver_match = match
+        token = None
+        if replica:
+            database = replica_for(request, match.func)
+            if database is not None:
+                token = read_database.set(database)
+        try:
+            response = match.func(request, *match.args, **match.kwargs)
+            if response.streaming:
+                return Result.error(400, f"{url.path} streams its response, call it directly")
+            if hasattr(response, 'render'):
+                response.render()
+        except Exception:
+            logger.exception('Batch sub-request %s %s failed', item['method'], url.path)
+            return Result.error(500, 'Server error')
+        finally:
+            if token is not None:
+                read_database.reset(token)
+        return self.result(response)
+
+    def sub_request(self, item, url):
+        parent = self.request._request
+        environ = {key: value for key, value in parent.META.items()
+                   if key not in DROPPED_HEADERS and not key.startswith('wsgi.')}
+        body = b''
+        if 'body' in item:
+            body = json.dumps(item['body']).encode()
+            environ['CONTENT_TYPE'] = 'application/json'
+        environ.update({
+            'REQUEST_METHOD': item['method'],
+            'PATH_INFO': url.path,
+            'SCRIPT_NAME': '',
+            'QUERY_STRING': url.query,
+            'CONTENT_LENGTH': str(len(body)),
+            'HTTP_ACCEPT': 'application/json',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.url_scheme': parent.scheme,
+        })
+        request = WSGIRequest(environ)
+        # Authenticated once for the whole batch
+        request._force_auth_user = self.request.user
+        request._force_auth_token = self.request.auth
+        return request
+
+    def result(self, response):
+        headers = {name: response[name] for name in RESPONSE_HEADERS if name in response}
+        content = response.content
+        if not content:
+            body = b'null'
+        elif response.get('Content-Type', '').startswith('application/json'):
+            body = content
+        else:
+            body = json.dumps(content.decode(response.charset, 'replace')).encode()
+        return Result(response.status_code, body, headers)
+
+
+def render(items, results):
+    """The batch response body, sub-response bodies spliced in as they are"""
+    parts = []
+    for item, result in zip(items, results):
+        parts.append(b''.join([
+            b'{"id":', json.dumps(item.get('id')).encode(),
+            b',"status":', str(result.status).encode(),
+            b',"headers":', json.dumps(result.headers).encode(),
+            b',"body":', result.body, b'}',
+        ]))
+    return b'{"responses":[' + b','.join(parts) + b']}'
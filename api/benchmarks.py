@@ -0,0 +1,331 @@
+"""
+Endpoint load benchmarks.
+
+Seeds a scale (vouchers and mautamers) into the test database, drives every
+route in backend/urls.py through the Django test client and reports
+throughput, p50/p99 latency and SQL query count per endpoint. Used by the
+``benchmark`` management command. A new route needs a case in
+build_cases() (api/tests/test_benchmarks.py checks every name has one).
+"""
+import itertools
+import json
+import statistics
+import time
+from datetime import date, time as dtime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .cloning import source_detail, voucher_document
+from .journal import get_journal, record_change, snapshot
+from .models import (
+    Voucher, FlightInformation, Mautamer, VoucherMautamer, Hotel, Transportation, VoucherChange,
+    VoucherTemplate
+)
+
+PASSWORD = 'bench-pass-123'
+AGENT_COUNT = 5
+PASSENGERS_PER_VOUCHER = 2
+BATCH_SIZE = 2000
+
+
+def seed(scale):
+    """`scale` vouchers and `scale` mautamers spread over AGENT_COUNT agents"""
+    password = make_password(PASSWORD)
+    admin = User.objects.create(
+        username='bench-admin', password=password, is_staff=True, is_superuser=True)
+    agents = User.objects.bulk_create([
+        User(username=f'bench-agent-{i}', password=password)
+        for i in range(AGENT_COUNT)
+    ])
+
+    mautamers = Mautamer.objects.bulk_create([
+        Mautamer(user=agents[i % AGENT_COUNT], pax_name=f'Pax {i}', passport=f'BP{i:07d}')
+        for i in range(scale)
+    ], batch_size=BATCH_SIZE)
+    mautamers_by_agent = {agent.id: [] for agent in agents}
+    for mautamer in mautamers:
+        mautamers_by_agent[mautamer.user_id].append(mautamer)
+
+    start = date(2026, 1, 1)
+    vouchers = Voucher.objects.bulk_create([
+        Voucher(user=agents[i % AGENT_COUNT], vNo=f'BV{i:07d}',
+                agentName=agents[i % AGENT_COUNT].username, groupName=f'Group {i % 50}',
+                status=('pending', 'approved', 'rejected')[i % 3])
+        for i in range(scale)
+    ], batch_size=BATCH_SIZE)
+
+    flights, hotels, transports, passengers = [], [], [], []
+    for i, voucher in enumerate(vouchers):
+        departure = start + timedelta(days=i % 365)
+        flights.append(FlightInformation(
+            voucher=voucher, departure_date=departure, arrival_date=departure,
+            depart_time=dtime(9), arrival_time=dtime(14), nights=14,
+            return_date=departure + timedelta(days=14), return_time=dtime(18),
+            sector_from='LHE', sector_to='JED'))
+        hotels.append(Hotel(
+            voucher=voucher, city='Makkah', hotel_name=f'Makkah Hotel {i % 40}',
+            checking_date=departure, checkout_date=departure + timedelta(days=7),
+            nights=7, room_type='quad'))
+        hotels.append(Hotel(
+            voucher=voucher, city='Madinah', hotel_name=f'Madinah Hotel {i % 40}',
+            checking_date=departure + timedelta(days=7),
+            checkout_date=departure + timedelta(days=14), nights=7, room_type='quad'))
+        transports.append(Transportation(
+            voucher=voucher, date=departure, from_location='Jeddah Airport',
+            type_of_transfer='bus'))
+        pool = mautamers_by_agent[voucher.user_id]
+        for j in range(min(PASSENGERS_PER_VOUCHER, len(pool))):
+            passengers.append(VoucherMautamer(
+                voucher=voucher, mautamer=pool[(i // AGENT_COUNT + j) % len(pool)]))
+
+    FlightInformation.objects.bulk_create(flights, batch_size=BATCH_SIZE)
+    Hotel.objects.bulk_create(hotels, batch_size=BATCH_SIZE)
+    Transportation.objects.bulk_create(transports, batch_size=BATCH_SIZE)
+    VoucherMautamer.objects.bulk_create(passengers, batch_size=BATCH_SIZE)
+    Voucher.objects.refresh_summaries()
+
+    return admin, agents
+
+
+class Case:
+    """
+    One endpoint. `prepare` runs untimed before every request and returns
+    (path, data) so write endpoints get fresh targets.
+    """
+
+    def __init__(self, name, client, method, prepare):
+        self.name = name
+        self.client = client
+        self.method = method
+        self.prepare = prepare
+
+    def request(self):
+        path, data = self.prepare()
+        call = getattr(self.client, self.method.lower())
+        if self.method == 'GET':
+            response = call(path, data)
+        else:
+            response = call(path, json.dumps(data) if data is not None else None,
+                            content_type='application/json')
+        if response.streaming:
+            # The export does its work while the body is read
+            for _ in response.streaming_content:
+                pass
+        return response
+
+
+def voucher_payload(vno, mautamer_ids):
+    return {
+        'vNo': vno,
+        'agentName': 'Bench Agent',
+        'groupName': 'Bench Group',
+        'flight_info': {
+            'departure_date': '2026-03-01', 'arrival_date': '2026-03-01',
+            'depart_time': '09:00', 'arrival_time': '14:00', 'nights': 14,
+            'return_date': '2026-03-15', 'return_time': '18:00',
+            'sector_from': 'LHE', 'sector_to': 'JED',
+        },
+        'mautamer_ids': mautamer_ids,
+        'hotels': [
+            {'city': 'Makkah', 'hotel_name': 'Bench Makkah', 'checking_date': '2026-03-01',
+             'checkout_date': '2026-03-08', 'nights': 7, 'room_type': 'quad'},
+            {'city': 'Madinah', 'hotel_name': 'Bench Madinah', 'checking_date': '2026-03-08',
+             'checkout_date': '2026-03-15', 'nights': 7, 'room_type': 'quad'},
+        ],
+        'transportations': [
+            {'date': '2026-03-01', 'from_location': 'Jeddah Airport', 'type_of_transfer': 'bus'},
+        ],
+    }
+
+
+def build_cases(admin, agents):
+    agent = agents[0]
+    counter = itertools.count()
+
+    def bearer(user):
+        token = RefreshToken.for_user(user)
+        return str(token), str(token.access_token)
+
+    refresh, agent_access = bearer(agent)
+    _, admin_access = bearer(admin)
+    anonymous = Client(raise_request_exception=False)
+    agent_client = Client(
+        raise_request_exception=False, HTTP_AUTHORIZATION=f'Bearer {agent_access}')
+    admin_client = Client(
+        raise_request_exception=False, HTTP_AUTHORIZATION=f'Bearer {admin_access}')
+    session_admin = Client(raise_request_exception=False)
+    session_admin.force_login(admin)
+
+    def fresh_mautamers():
+        # New passengers per voucher, the same ones on every payload would overlap
+        n = next(counter)
+        return [m.id for m in Mautamer.objects.bulk_create([
+            Mautamer(user=agent, pax_name=f'Bench Pax {n}-{i}', passport=f'BX{n:06d}{i}')
+            for i in range(3)])]
+
+    mautamer_ids = fresh_mautamers()
+    sample_voucher = Voucher.objects.filter(user=agent).order_by('id').first()
+    updated_agent = agents[-1]
+    # Seeded rows skip the journal, give the sample voucher a history
+    record_change(sample_voucher, agent, VoucherChange.CREATED, after=snapshot(sample_voucher))
+    get_journal().flush()
+    template = VoucherTemplate.objects.create(
+        user=agent, name='Bench template',
+        data=voucher_document(source_detail(agent, sample_voucher.id)[1]))
+
+    def fixed(path, data=None):
+        return lambda: (path, data)
+
+    def new_voucher():
+        return Voucher.objects.create(
+            user=agent, vNo=f'BD{next(counter):07d}', agentName=agent.username)
+
+    return [
+        Case('register', anonymous, 'POST', lambda: (
+            reverse('register'),
+            {'username': f'bench-new-{next(counter)}', 'password': PASSWORD})),
+        Case('login', anonymous, 'POST', fixed(
+            reverse('login'), {'username': agent.username, 'password': PASSWORD})),
+        Case('token_refresh', anonymous, 'POST', fixed(
+            reverse('token_refresh'), {'refresh': refresh})),
+        Case('voucher_list', agent_client, 'GET', fixed(reverse('voucher-list-create'))),
+        Case('voucher_list_admin', admin_client, 'GET', fixed(reverse('voucher-list-create'))),
+        Case('voucher_create', agent_client, 'POST', lambda: (
+            reverse('voucher-list-create'),
+            voucher_payload(f'BC{next(counter):07d}', fresh_mautamers()))),
+        Case('voucher_create_numbered', agent_client, 'POST', lambda: (
+            reverse('voucher-list-create'),
+            {key: value for key, value in voucher_payload(None, fresh_mautamers()).items()
+             if key != 'vNo'})),
+        Case('voucher_clone', agent_client, 'POST', lambda: (
+            reverse('voucher-clone', args=[sample_voucher.id]),
+            {'days': 1 + next(counter), 'mautamer_ids': fresh_mautamers()})),
+        Case('voucher_history', agent_client, 'GET', fixed(
+            reverse('voucher-history', args=[sample_voucher.id]))),
+        Case('voucher_template_list', agent_client, 'GET', fixed(
+            reverse('voucher-template-list'))),
+        Case('voucher_template_create', agent_client, 'POST', lambda: (
+            reverse('voucher-template-list'),
+            {'name': f'Bench template {next(counter)}', 'voucher_id': sample_voucher.id})),
+        Case('voucher_template_detail', agent_client, 'GET', fixed(
+            reverse('voucher-template-detail', args=[template.id]))),
+        Case('voucher_template_apply', agent_client, 'POST', lambda: (
+            reverse('voucher-template-apply', args=[template.id]),
+            {'days': 1 + next(counter), 'mautamer_ids': fresh_mautamers()})),
+        Case('batch_editor_open', agent_client, 'POST', fixed(reverse('batch'), {'requests': [
+            {'id': 'voucher', 'path': reverse('voucher-detail', args=[sample_voucher.id])},
+            {'id': 'mautamers', 'path': reverse('agent-mautamer-list')},
+            {'id': 'sidebar', 'path': reverse('voucher-list-create') + '?fields=id,vNo,status'},
+        ]})),
+        Case('voucher_detail', agent_client, 'GET', fixed(
+            reverse('voucher-detail', args=[sample_voucher.id]))),
+        Case('voucher_detail_header', agent_client, 'GET', fixed(
+            reverse('voucher-detail', args=[sample_voucher.id]), {'fields': 'id,vNo,status'})),
+        Case('voucher_list_header', agent_client, 'GET', fixed(
+            reverse('voucher-list-create'), {'fields': 'id,vNo,status'})),
+        Case('voucher_update', agent_client, 'PUT', lambda: (
+            reverse('voucher-detail', args=[sample_voucher.id]),
+            voucher_payload(sample_voucher.vNo, mautamer_ids))),
+        Case('voucher_delete', agent_client, 'DELETE', lambda: (
+            reverse('voucher-detail', args=[new_voucher().id]), None)),
+        Case('admin_voucher_list', admin_client, 'GET', fixed(reverse('admin-voucher-list'))),
+        Case('voucher_status_update', admin_client, 'PATCH', lambda: (
+            reverse('voucher-status-update', args=[sample_voucher.id]),
+            {'status': ('approved', 'rejected')[next(counter) % 2]})),
+        Case('admin_agent_list', admin_client, 'GET', fixed(reverse('admin-agent-list'))),
+        Case('admin_agent_create', admin_client, 'POST', lambda: (
+            reverse('admin-agent-create'),
+            {'username': f'bench-created-{next(counter)}', 'password': PASSWORD,
+             'mautamers': [{'pax_name': f'New Pax {i}', 'passport': f'NP{i:07d}'}
+                           for i in range(5)]})),
+        Case('admin_agent_update', admin_client, 'PATCH', lambda: (
+            reverse('admin-agent-update', args=[updated_agent.id]),
+            {'username': f'bench-renamed-{next(counter)}'})),
+        Case('admin_agent_mautamer_upload', admin_client, 'POST', lambda: (
+            reverse('admin-agent-mautamer-upload', args=[updated_agent.id]),
+            {'mautamers': [
+                {'pax_name': f'Upload Pax {n}', 'passport': f'UP{n:08d}'}
+                for n in (next(counter) for _ in range(20))]})),
+        Case('admin_agent_export', admin_client, 'GET', fixed(
+            reverse('admin-agent-export', args=[agent.id]))),
+        Case('admin_mautamer_conflicts', admin_client, 'GET', fixed(
+            reverse('admin-mautamer-conflicts'))),
+        Case('admin_mautamer_duplicates', admin_client, 'GET', fixed(
+            reverse('admin-mautamer-duplicates'))),
+        Case('admin_metrics', admin_client, 'GET', fixed(reverse('admin-metrics'))),
+        Case('agent_mautamer_list', agent_client, 'GET', fixed(reverse('agent-mautamer-list'))),
+        Case('agent_export', agent_client, 'GET', fixed(reverse('agent-export'))),
+        Case('django_admin_voucher_changelist', session_admin, 'GET', fixed(
+            reverse('admin:api_voucher_changelist'))),
+    ]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class QueryCounter:
+    """execute_wrapper counting queries, unlike the debug log it has no cap"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run_case(case, iterations, max_seconds, warmup=1):
+    for _ in range(warmup):
+        case.request()
+
+    latencies, queries, errors = [], [], 0
+    budget_start = time.perf_counter()
+    while len(latencies) < iterations:
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            response = case.request()
+            latencies.append(time.perf_counter() - started)
+        queries.append(counter.count)
+        if response.status_code >= 400:
+            errors += 1
+        if time.perf_counter() - budget_start > max_seconds:
+            break
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / sum(latencies), 2),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'queries': int(statistics.median(queries)),
+    }
+
+
+def compare(baseline, current, max_slowdown, min_delta_ms):
+    """
+    Regressions of `current` against `baseline`: any increase in query
+    count, or p99 slower by more than `max_slowdown` times and `min_delta_ms`
+    """
+    regressions = []
+    for scale, endpoints in current['results'].items():
+        for name, result in endpoints.items():
+            before = baseline.get('results', {}).get(scale, {}).get(name)
+            if before is None:
+                continue
+            if result['queries'] > before['queries']:
+                regressions.append(
+                    f"{scale}/{name}: queries {before['queries']} -> {result['queries']}")
+            if (result['p99_ms'] > before['p99_ms'] * max_slowdown
+                    and result['p99_ms'] - before['p99_ms'] > min_delta_ms):
+                regressions.append(
+                    f"{scale}/{name}: p99 {before['p99_ms']}ms -> {result['p99_ms']}ms")
+    return regressions
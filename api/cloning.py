@@ -0,0 +1,138 @@
+"""
+New vouchers copied from an existing one or from a saved template.
+
+A copy starts from a voucher document - the detail format without ids,
+passengers, number or status - taken from a live voucher, an archived one
+(its stored detail) or a VoucherTemplate. Every date in it can be moved by
+an offset, then it is created through VoucherDetailSerializer like a
+posted voucher: same numbering, stay and passenger checks, capacity
+booking and summaries, one transaction, one bulk insert per table. The
+client sends only the changes instead of the whole voucher.
+"""
+from contextlib import nullcontext
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.http import Http404
+from rest_framework import serializers
+
+from .archive import archived_voucher
+from .journal import record_change, snapshot
+from .models import Voucher, VoucherChange
+from .sharding import for_agent, locate, using_shard
+from .serializers import (
+    FlightInformationSerializer, HotelSerializer, TransportationSerializer, VoucherDetailSerializer
+)
+
+DOCUMENT_FIELDS = ['agentName', 'groupName', 'flight_info', 'hotels', 'transportations']
+NESTED = {
+    'flight_info': FlightInformationSerializer,
+    'hotels': HotelSerializer,
+    'transportations': TransportationSerializer,
+}
+
+
+def date_fields(serializer_class):
+    return [name for name, field in serializer_class().fields.items()
+            if isinstance(field, serializers.DateField)]
+
+
+def source_detail(user, pk):
+    """
+    (owner, detail) of the voucher `pk` the user may read, live or
+    archived. Http404 otherwise.
+    """
+    shard = nullcontext()
+    if settings.DATABASE_SHARDS and user.is_staff:
+        alias = locate(Voucher, pk)
+        if alias is not None:
+            shard = using_shard(alias)
+    with shard:
+        vouchers = Voucher.objects.with_details()
+        if not user.is_staff:
+            vouchers = vouchers.filter(user=user)
+        voucher = vouchers.filter(pk=pk).first()
+        if voucher is not None:
+            return voucher.user, VoucherDetailSerializer(voucher).data
+
+    archived = archived_voucher(user, pk)
+    if archived is None:
+        raise Http404
+    return archived.user, archived.data
+
+
+def voucher_document(detail):
+    """Copyable part of a voucher in the detail format (live or archived)"""
+    document = {name: detail.get(name) for name in DOCUMENT_FIELDS}
+    for name in NESTED:
+        value = document[name]
+        if isinstance(value, list):
+            document[name] = [{k: v for k, v in row.items() if k != 'id'} for row in value]
+        elif value:
+            document[name] = {k: v for k, v in value.items() if k != 'id'}
+    if not document['flight_info']:
+        document.pop('flight_info')
+    return document
+
+
+def shift_dates(document, days):
+    """The document with every date `days` later (earlier when negative)"""
+    def shift(row, fields):
+        row = dict(row)
+        for name in fields:
+            if row.get(name):
+                row[name] = (date.fromisoformat(row[name]) + timedelta(days=days)).isoformat()
+        return row
+
+    if not days:
+        return document
+    document = dict(document)
+    for name, serializer_class in NESTED.items():
+        fields = date_fields(serializer_class)
+        if isinstance(document.get(name), list):
+            document[name] = [shift(row, fields) for row in document[name]]
+        elif document.get(name):
+            document[name] = shift(document[name], fields)
+    return document
+
+
+class CopyOptionsSerializer(serializers.Serializer):
+    """What a copy changes. days / departure_date move every date of it."""
+    days = serializers.IntegerField(required=False)
+    departure_date = serializers.DateField(
+        required=False, help_text="New flight departure, the other dates move with it")
+    vNo = serializers.CharField(max_length=50, required=False)
+    groupName = serializers.CharField(max_length=200, required=False, allow_null=True)
+    mautamer_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, help_text="Passengers of the copy")
+
+    def validate(self, attrs):
+        if 'days' in attrs and 'departure_date' in attrs:
+            raise serializers.ValidationError('Send either days or departure_date, not both.')
+        return attrs
+
+
+def copy_voucher(document, options, owner, actor):
+    """
+    Create a voucher for `owner` from `document` with the CopyOptionsSerializer
+    `options` applied. ValidationError as when posting the voucher.
+    """
+    days = options.get('days', 0)
+    if 'departure_date' in options:
+        departure = (document.get('flight_info') or {}).get('departure_date')
+        if not departure:
+            raise serializers.ValidationError(
+                {'departure_date': ['The voucher has no flight to move.']})
+        days = (options['departure_date'] - date.fromisoformat(departure)).days
+
+    data = dict(shift_dates(document, days))
+    data.update({name: options[name] for name in ('vNo', 'groupName', 'mautamer_ids')
+                 if name in options})
+    # Checked and saved on the owner's shard, also when staff copy an agent's voucher
+    with for_agent(owner.id):
+        serializer = VoucherDetailSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        voucher = serializer.save(user=owner)
+        voucher = Voucher.objects.with_details().get(pk=voucher.pk)
+    record_change(voucher, actor, VoucherChange.CREATED, after=snapshot(voucher))
+    return voucher
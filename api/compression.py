@@ -0,0 +1,156 @@
+"""
+Cached, precompressed bodies for the big list endpoints.
+
+A list view using CompressedListMixin first reads a cheap fingerprint of
+its rows (count and latest updated_at). The JSON body for that fingerprint
+is rendered and compressed once per Accept-Encoding (brotli when the
+``brotli`` package is installed, else gzip) and kept in a per-process LRU
+bounded by COMPRESSED_LIST_CACHE_BYTES. Later hits send the stored bytes
+as they are, and clients holding the same ETag get a 304.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+try:
+    import brotli
+except ImportError:
+    # Optional, gzip only without it
+    brotli = None
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class BodyCache:
+    """LRU of response bodies, evicting oldest first once over max_bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._bodies.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._bodies[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._bodies.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._bodies.clear()
+            self.size = 0
+
+
+@lru_cache(maxsize=None)
+def get_body_cache():
+    return BodyCache(settings.COMPRESSED_LIST_CACHE_BYTES)
+
+
+def choose_encoding(accept_encoding):
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = quality
+
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # mtime=0 so the same body always gives the same bytes
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+class CompressedListMixin:
+    """
+    For APIViews whose GET returns one JSON document. Subclasses implement
+    list_fingerprint(request), list_data(request) and, for per-user data,
+    cache_scope(request).
+    """
+
+    def cache_scope(self, request):
+        return None
+
+    def get(self, request):
+        if request.accepted_renderer.format != 'json':
+            # Browsable API
+            return Response(self.list_data(request))
+
+        key = hashlib.sha1(repr((
+            type(self).__name__,
+            self.cache_scope(request),
+            sorted(request.query_params.lists()),
+            self.list_fingerprint(request),
+        )).encode()).hexdigest()
+        etag = f'"{key}"'
+
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        else:
+            encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+            body = self.cached_body(request, key, encoding)
+            response = HttpResponse(body, content_type='application/json')
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        # Cached in the client too, but checked against the ETag every time
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ['Accept-Encoding', 'Authorization'])
+        return response
+
+    def cached_body(self, request, key, encoding):
+        cache = get_body_cache()
+        body = cache.get((key, encoding))
+        if body is not None:
+            return body
+
+        raw = cache.get((key, 'identity'))
+        if raw is None:
+            renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+            raw = renderer.render(self.list_data(request), 'application/json')
+            cache.set((key, 'identity'), raw)
+        if encoding == 'identity':
+            return raw
+        body = compress(raw, encoding)
+        cache.set((key, encoding), body)
+        return body
@@ -0,0 +1,83 @@
+"""
+Overlapping trips of the same mautamer.
+
+Every VoucherMautamer row carries its voucher's travel window
+(departure_date, return_date), kept in sync by refresh_summaries(). The
+trip_mautamer_return index orders each mautamer's trips by return date,
+so both checks below seek straight to the trips that can still overlap:
+
+- overlapping_trips(): trips returning after a new window starts, used by
+  VoucherDetailSerializer on create and update
+- find_conflicts(): one ordered pass over all trips for the admin audit
+
+Windows touching on the same day (return, then leave again) do not count.
+"""
+from bisect import bisect_right
+
+from .models import VoucherMautamer
+
+TRIP_FIELDS = [
+    'mautamer_id', 'mautamer__pax_name', 'mautamer__passport',
+    'voucher_id', 'voucher__vNo', 'departure_date', 'return_date',
+]
+
+
+def overlapping_trips(mautamer_ids, departure_date, return_date, exclude_voucher=None):
+    trips = VoucherMautamer.objects.filter(
+        mautamer_id__in=mautamer_ids,
+        return_date__gt=departure_date,
+        departure_date__lt=return_date,
+    )
+    if exclude_voucher is not None:
+        trips = trips.exclude(voucher_id=exclude_voucher)
+    return trips.order_by('mautamer_id', 'return_date').values(*TRIP_FIELDS)
+
+
+def find_conflicts(trips):
+    """
+    Pairs of overlapping trips. `trips` must be ordered by mautamer_id and
+    return_date; an earlier trip overlaps the current one exactly when it
+    returns after the current one departs, which bisect finds in the
+    return dates seen so far.
+    """
+    mautamer_id = None
+    seen, returns = [], []
+    for trip in trips:
+        if trip['mautamer_id'] != mautamer_id:
+            mautamer_id = trip['mautamer_id']
+            seen, returns = [], []
+        start = bisect_right(returns, trip['departure_date'])
+        for earlier in seen[start:]:
+            yield earlier, trip
+        seen.append(trip)
+        returns.append(trip['return_date'])
+
+
+def audit_trips(returning_after=None, agent=None):
+    trips = VoucherMautamer.objects.filter(
+        departure_date__isnull=False, return_date__isnull=False)
+    if returning_after is not None:
+        trips = trips.filter(return_date__gt=returning_after)
+    if agent is not None:
+        trips = trips.filter(mautamer__user_id=agent)
+    return trips.order_by('mautamer_id', 'return_date').values(*TRIP_FIELDS)
+
+
+def trip_data(trip):
+    return {
+        'voucher_id': trip['voucher_id'],
+        'vNo': trip['voucher__vNo'],
+        'departure_date': trip['departure_date'],
+        'return_date': trip['return_date'],
+    }
+
+
+def conflict_data(earlier, later):
+    return {
+        'mautamer': {
+            'id': later['mautamer_id'],
+            'pax_name': later['mautamer__pax_name'],
+            'passport': later['mautamer__passport'],
+        },
+        'vouchers': [trip_data(earlier), trip_data(later)],
+    }
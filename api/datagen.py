@@ -0,0 +1,362 @@
+"""
+Deterministic synthetic data at production scale.
+
+Rows are built chunk by chunk with primary keys assigned in memory, so every
+foreign key is known without reading anything back, and each chunk is one
+batched insert per table in one transaction. The same seed and options
+always produce the same data. Used by the ``generate_data`` command.
+
+Chunks are written with executemany over the model's own columns rather than
+bulk_create: at this volume bulk_create spends most of its time compiling SQL
+per value, several times longer than the database needs for the insert.
+
+The data keeps the rules the API enforces: no mautamer is on two trips that
+overlap (api/conflicts.py), and the hotel nights are rebuilt at the end
+(api/stays.py). Rows go straight to 'default', so it refuses to run while
+DATABASE_SHARDS is set; generate unsharded, then shard with rebalance_shards.
+"""
+import random
+from bisect import bisect
+from datetime import date, datetime, time, timedelta, timezone
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .models import (
+    Voucher, FlightInformation, Mautamer, VoucherMautamer, Hotel, Transportation, normalize_passport
+)
+from .stays import rebuild_nights
+
+FIRST_NAMES = [
+    'Muhammad', 'Ahmed', 'Ali', 'Hassan', 'Hussain', 'Usman', 'Bilal', 'Imran', 'Tariq',
+    'Zubair', 'Ayesha', 'Fatima', 'Khadija', 'Maryam', 'Zainab', 'Sana', 'Hira', 'Amna',
+    'Saima', 'Rabia', 'Abdullah', 'Hamza', 'Farhan', 'Naveed', 'Shahid', 'Asma', 'Nadia',
+]
+LAST_NAMES = [
+    'Khan', 'Ahmad', 'Malik', 'Butt', 'Chaudhry', 'Qureshi', 'Sheikh', 'Siddiqui', 'Raza',
+    'Hashmi', 'Iqbal', 'Javed', 'Mirza', 'Rana', 'Abbasi', 'Akhtar', 'Aslam', 'Bhatti',
+]
+# Few names, many vouchers - the same hotels show up again and again
+MAKKAH_HOTELS = [
+    'Swissotel Makkah', 'Hilton Suites Makkah', 'Pullman Zamzam', 'Al Safwah Royale Orchid',
+    'Makkah Towers', 'Anjum Hotel', 'Elaf Ajyad', 'Dar Al Eiman Royal', 'Le Meridien Towers',
+    'Al Kiswah Towers', 'Emaar Grand', 'Jabal Omar Marriott',
+]
+MADINAH_HOTELS = [
+    'Anwar Al Madinah Movenpick', 'Pullman Zamzam Madinah', 'Dallah Taibah', 'Al Eiman Royal',
+    'Shaza Al Madina', 'Crowne Plaza Madinah', 'Elaf Taiba', 'Millennium Al Aqeeq',
+    'Dar Al Taqwa', 'Al Haram Hotel',
+]
+AIRLINES = [('PK', 'PIA'), ('SV', 'Saudia'), ('ER', 'SereneAir'), ('PA', 'Airblue'), ('FZ', 'flydubai')]
+ORIGINS = ['LHE', 'KHI', 'ISB', 'MUX', 'PEW', 'SKT']
+DESTINATIONS = ['JED', 'MED']
+# Umrah traffic peaks around Ramadan and the winter holidays
+MONTH_WEIGHTS = [10, 9, 14, 16, 6, 3, 4, 5, 6, 8, 10, 13]
+NIGHTS = [7, 10, 14, 15, 21, 28]
+NIGHT_WEIGHTS = [10, 8, 30, 25, 15, 5]
+GROUP_SIZES = list(range(1, 13))
+GROUP_WEIGHTS = [12, 22, 10, 18, 8, 10, 4, 5, 2, 4, 1, 3]
+ROOM_TYPES = {1: 'single', 2: 'double', 3: 'triple', 4: 'quad'}
+STATUSES = ['pending', 'approved', 'rejected']
+STATUS_WEIGHTS = [15, 80, 5]
+# Tries per passenger to find a mautamer free on the trip's dates
+PASSENGER_ATTEMPTS = 10
+# Columns written per table, in the order the rows are built. Every
+# concrete field of the model, a new one has to be added here too.
+COLUMNS = {
+    Mautamer: ['id', 'user', 'pax_name', 'passport', 'passport_key', 'created_at', 'updated_at'],
+    Voucher: [
+        'id', 'user', 'vNo', 'agentName', 'status', 'groupName',
+        'created_at', 'updated_at', 'departure_date', 'arrival_date',
+        'return_date', 'nights', 'pax_count'],
+    FlightInformation: [
+        'id', 'voucher', 'departure_date', 'arrival_date', 'sector_from',
+        'sector_to', 'depart_time', 'arrival_time', 'departure_flight_no',
+        'departure_flight', 'departure_pnr', 'nights', 'return_date', 'return_time',
+        'return_flight_no', 'return_flight', 'return_sector_from', 'return_sector_to',
+        'return_pnr', 'shirka', 'iata', 'service_no'],
+    Hotel: [
+        'id', 'voucher', 'hotel_head', 'city', 'checking_date', 'checkout_date',
+        'nights', 'hotel_name', 'room_type'],
+    Transportation: ['id', 'voucher', 'date', 'from_location', 'type_of_transfer'],
+    VoucherMautamer: ['id', 'voucher', 'mautamer', 'departure_date', 'return_date'],
+}
+
+
+def next_id(model):
+    return (model.objects.aggregate(top=Max('id'))['top'] or 0) + 1
+
+
+class Table:
+    """Batched INSERT of plain tuples into `model`'s table, in COLUMNS order"""
+
+    def __init__(self, model):
+        self.model = model
+        fields = COLUMNS[model]
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+        placeholders = ', '.join(['%s'] * len(fields))
+        self.sql = f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})'
+        self.rows = []
+
+    def flush(self):
+        if self.rows:
+            with connection.cursor() as cursor:
+                cursor.executemany(self.sql, self.rows)
+            self.rows = []
+
+
+class Picker:
+    """Weighted choice with precomputed cumulative weights"""
+
+    def __init__(self, rng, values, weights):
+        self.rng = rng
+        self.values = values
+        self.cumulative = list(accumulate(weights))
+        self.total = self.cumulative[-1]
+
+    def __call__(self):
+        return self.values[bisect(self.cumulative, self.rng.random() * self.total)]
+
+
+class DataGenerator:
+    def __init__(self, vouchers, mautamers, agents, seed=1, prefix='gen',
+                 start=date(2024, 1, 1), days=730, chunk_size=5000, skew=1.1, log=None):
+        self.vouchers = vouchers
+        self.mautamers = mautamers
+        self.agents = agents
+        self.prefix = f'{prefix}{seed}'
+        self.start = start
+        self.days = days
+        self.chunk_size = chunk_size
+        self.log = log or (lambda message: None)
+        self.rng = random.Random(seed)
+
+        # Zipf-like agent sizes: a few big agents, a long tail of small ones
+        self.agent_weights = [1 / (rank + 1) ** skew for rank in range(agents)]
+        self.pick_agent = Picker(self.rng, list(range(agents)), self.agent_weights)
+        self.pick_nights = Picker(self.rng, NIGHTS, NIGHT_WEIGHTS)
+        self.pick_group = Picker(self.rng, GROUP_SIZES, GROUP_WEIGHTS)
+        self.pick_status = Picker(self.rng, STATUSES, STATUS_WEIGHTS)
+        self.pick_day = self._day_picker()
+        self._flights = {}
+        self._dates = {}
+        # Trip windows of every mautamer given a voucher so far
+        self._trips = {}
+        self.created_from = datetime.combine(
+            start - timedelta(days=60), time(), tzinfo=timezone.utc)
+
+    def _day_picker(self):
+        days = [self.start + timedelta(days=offset) for offset in range(self.days)]
+        weights = [MONTH_WEIGHTS[day.month - 1] for day in days]
+        return Picker(self.rng, days, weights)
+
+    def run(self):
+        if settings.DATABASE_SHARDS:
+            raise ValueError(
+                'DATABASE_SHARDS is set: generated rows would skip the shard map and the '
+                'shard id ranges. Generate without sharding, then use rebalance_shards')
+        if User.objects.filter(username__startswith=f'{self.prefix}-agent-').exists():
+            raise ValueError(
+                f"Data with prefix '{self.prefix}' already exists, use another seed or prefix")
+
+        agent_ids = self.create_agents()
+        pools = self.create_mautamers(agent_ids)
+        self.create_vouchers(agent_ids, pools)
+
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [
+                    User, Mautamer, Voucher, FlightInformation, Hotel,
+                    Transportation, VoucherMautamer]):
+                cursor.execute(sql)
+        for hotel_name in sorted({*MAKKAH_HOTELS, *MADINAH_HOTELS}):
+            rebuild_nights(hotel_name)
+
+    def create_agents(self):
+        password = make_password(f'{self.prefix}-password')
+        first_id = next_id(User)
+        User.objects.bulk_create([
+            User(id=first_id + i, username=f'{self.prefix}-agent-{i:04d}', password=password)
+            for i in range(self.agents)
+        ])
+        self.log(f'{self.agents} agents')
+        return [first_id + i for i in range(self.agents)]
+
+    def create_mautamers(self, agent_ids):
+        """
+        Each agent gets a contiguous id block sized by its weight, so picking
+        a group later is a sample from a range
+        """
+        total_weight = sum(self.agent_weights)
+        counts = [max(1, int(self.mautamers * weight / total_weight))
+                  for weight in self.agent_weights]
+        table = Table(Mautamer)
+        created_at = self.datetime(self.created_from)
+        next_pk = next_id(Mautamer)
+        pools = []
+        for agent_id, count in zip(agent_ids, counts):
+            pools.append(range(next_pk, next_pk + count))
+            for pk in range(next_pk, next_pk + count):
+                passport = self.passport()
+                table.rows.append((
+                    pk, agent_id,
+                    f'{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}',
+                    passport, normalize_passport(passport), created_at, created_at))
+                if len(table.rows) >= self.chunk_size:
+                    with transaction.atomic():
+                        table.flush()
+            next_pk += count
+        with transaction.atomic():
+            table.flush()
+        self.log(f'{next_pk - pools[0].start} mautamers')
+        return pools
+
+    def passport(self):
+        letters = ''.join(self.rng.choice('ABCDEFGHJKLMNPRSTUVWXYZ') for _ in range(2))
+        number = f'{self.rng.randrange(10 ** 7):07d}'
+        # Passports are typed by hand, a few come in lowercase or with a space
+        roll = self.rng.random()
+        if roll < 0.03:
+            return f'{letters.lower()}{number}'
+        if roll < 0.06:
+            return f'{letters} {number}'
+        return f'{letters}{number}'
+
+    def flight(self, day):
+        """Flights are shared, every day has a handful that many vouchers book"""
+        flights = self._flights.get(day)
+        if flights is None:
+            flights = self._flights[day] = []
+            for _ in range(self.rng.randint(2, 6)):
+                code, airline = self.rng.choice(AIRLINES)
+                depart = time(self.rng.randint(0, 23), self.rng.choice([0, 15, 30, 45]))
+                flights.append({
+                    'number': f'{code}-{self.rng.randint(100, 999)}',
+                    'airline': airline,
+                    'origin': self.rng.choice(ORIGINS),
+                    'destination': self.rng.choice(DESTINATIONS),
+                    'depart': connection.ops.adapt_timefield_value(depart),
+                    'arrive': connection.ops.adapt_timefield_value(
+                        time((depart.hour + 5) % 24, depart.minute)),
+                    'pnr': ''.join(self.rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ23456789')
+                                   for _ in range(6)),
+                })
+        return self.rng.choice(flights)
+
+    def create_vouchers(self, agent_ids, pools):
+        tables = {model: Table(model) for model in (
+            Voucher, FlightInformation, Hotel, Transportation, VoucherMautamer)}
+        ids = {model: next_id(model) for model in tables}
+
+        for chunk_start in range(0, self.vouchers, self.chunk_size):
+            chunk_end = min(chunk_start + self.chunk_size, self.vouchers)
+            for number in range(chunk_start, chunk_end):
+                self.build_voucher(number, agent_ids, pools, ids, tables)
+            with transaction.atomic():
+                for table in tables.values():
+                    table.flush()
+            self.log(f'{chunk_end} / {self.vouchers} vouchers')
+
+    def build_voucher(self, number, agent_ids, pools, ids, tables):
+        rng = self.rng
+        d = self.date
+        agent_index = self.pick_agent()
+        departure = self.pick_day()
+        nights = self.pick_nights()
+        return_date = departure + timedelta(days=nights)
+
+        # Booked a few weeks before departure
+        created_at = self.datetime(datetime.combine(
+            departure - timedelta(days=rng.randint(7, 60)),
+            time(rng.randint(8, 22), rng.randint(0, 59)), tzinfo=timezone.utc))
+        voucher_id = self.take(ids, Voucher)
+        status = self.pick_status()
+        group_name = f'Group {rng.randint(1, 500)}' if rng.random() < 0.7 else None
+
+        outbound = self.flight(departure)
+        inbound = self.flight(return_date)
+        tables[FlightInformation].rows.append((
+            self.take(ids, FlightInformation), voucher_id, d(departure), d(departure),
+            outbound['origin'], outbound['destination'], outbound['depart'],
+            outbound['arrive'], outbound['number'], outbound['airline'], outbound['pnr'],
+            nights, d(return_date), inbound['depart'], inbound['number'], inbound['airline'],
+            inbound['destination'], inbound['origin'], inbound['pnr'],
+            f'Shirka {rng.randint(1, 40)}', '', ''))
+
+        group = min(self.pick_group(), len(pools[agent_index]))
+        passengers = self.passengers(pools[agent_index], group, departure, return_date)
+        room_type = ROOM_TYPES.get(group, 'family')
+        transfer = 'bus' if group > 4 else rng.choice(['car', 'van', 'taxi'])
+
+        # Stays chain without gaps: Makkah first (Madinah when landing there)
+        makkah_nights = max(1, round(nights * rng.uniform(0.4, 0.7)))
+        stays = [('Makkah', MAKKAH_HOTELS, makkah_nights),
+                 ('Madinah', MADINAH_HOTELS, nights - makkah_nights)]
+        if outbound['destination'] == 'MED':
+            stays.reverse()
+        check_in = departure
+        from_location = f"{outbound['destination']} Airport"
+        for city, hotels, stay_nights in stays:
+            if stay_nights <= 0:
+                continue
+            check_out = check_in + timedelta(days=stay_nights)
+            tables[Hotel].rows.append((
+                self.take(ids, Hotel), voucher_id, city, city, d(check_in), d(check_out),
+                stay_nights, rng.choice(hotels), room_type))
+            tables[Transportation].rows.append((
+                self.take(ids, Transportation), voucher_id, d(check_in), from_location, transfer))
+            from_location = city
+            check_in = check_out
+        tables[Transportation].rows.append((
+            self.take(ids, Transportation), voucher_id, d(return_date), from_location, transfer))
+
+        for mautamer_id in passengers:
+            tables[VoucherMautamer].rows.append((
+                self.take(ids, VoucherMautamer), voucher_id, mautamer_id,
+                d(departure), d(return_date)))
+
+        # Summary columns known here already, no refresh pass afterwards
+        tables[Voucher].rows.append((
+            voucher_id, agent_ids[agent_index], f'{self.prefix}-{number + 1:08d}',
+            f'{self.prefix}-agent-{agent_index:04d}', status, group_name,
+            created_at, created_at, d(departure), d(departure), d(return_date),
+            nights, len(passengers)))
+
+    def passengers(self, pool, group, departure, return_date):
+        """
+        Up to `group` mautamers of the pool not travelling between departure
+        and return_date, fewer when the pool is busy on those dates
+        """
+        chosen = []
+        for _ in range(group * PASSENGER_ATTEMPTS):
+            if len(chosen) == group:
+                break
+            mautamer_id = pool[self.rng.randrange(len(pool))]
+            if mautamer_id in chosen or any(
+                    start < return_date and departure < end
+                    for start, end in self._trips.get(mautamer_id, ())):
+                continue
+            chosen.append(mautamer_id)
+        for mautamer_id in chosen:
+            self._trips.setdefault(mautamer_id, []).append((departure, return_date))
+        return chosen
+
+    def date(self, value):
+        adapted = self._dates.get(value)
+        if adapted is None:
+            adapted = self._dates[value] = connection.ops.adapt_datefield_value(value)
+        return adapted
+
+    def datetime(self, value):
+        return connection.ops.adapt_datetimefield_value(value)
+
+    @staticmethod
+    def take(ids, model):
+        pk = ids[model]
+        ids[model] = pk + 1
+        return pk
@@ -0,0 +1,238 @@
+"""
+Voucher change events for agents (server-sent events).
+
+Status changes and edits are published per agent (voucher.user_id) on a
+broker, and every open event stream of that agent receives them. The
+default broker is in-process; point VOUCHER_EVENTS_BROKER at another
+Broker subclass to swap it out.
+"""
+import asyncio
+import json
+import threading
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .tokens import raw_token_from_header, token_user_id
+
+STREAM_PATH = '/vouchers/events/'
+
+
+class Subscription:
+    """One open event stream. Events are handed over to its own event loop."""
+
+    def __init__(self, user_id, queue_size):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow client - drop, it refetches the list when it reconnects
+            pass
+
+    def deliver(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # Event loop already closed
+            pass
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class Broker(ABC):
+    """Interface every events backend implements"""
+
+    @abstractmethod
+    def subscribe(self, user_id):
+        """New Subscription to the user's events, called on the stream's event loop"""
+
+    @abstractmethod
+    def unsubscribe(self, subscription):
+        """Stop delivering to the subscription, it may already be gone"""
+
+    @abstractmethod
+    def publish(self, user_id, event):
+        """Deliver the event to every subscription of the user, from any thread"""
+
+
+class InMemoryBroker(Broker):
+    """
+    Single process pub/sub, subscribers are kept per user_id. Keys are
+    strings since the JWT carries user_id as a string.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(str(user_id), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(subscription.user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(str(user_id), ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+        return len(subscribers)
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    broker_class = import_string(settings.VOUCHER_EVENTS_BROKER)
+    return broker_class(queue_size=settings.VOUCHER_EVENTS_QUEUE_SIZE)
+
+
+def notify_voucher(voucher, event_type):
+    """Publish a voucher event to its agent once the transaction commits"""
+    event = {
+        'type': event_type,
+        'voucher_id': voucher.id,
+        'vNo': voucher.vNo,
+        'status': voucher.status,
+        'updated_at': voucher.updated_at.isoformat() if voucher.updated_at else None,
+    }
+    user_id = voucher.user_id
+    transaction.on_commit(lambda: get_broker().publish(user_id, event))
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def authenticate_scope(scope):
+    """
+    user_id from the JWT access token, without touching the database so an
+    idle stream holds no thread or connection. Browsers' EventSource cannot
+    send headers, so the token may also come as ?token=
+    """
+    raw_token = None
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            raw_token = raw_token_from_header(value.decode('latin1'))
+            break
+    if raw_token is None:
+        raw_token = parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+    if not raw_token:
+        return None
+    return token_user_id(raw_token)
+
+
+def cors_headers(scope):
+    origin = dict(scope.get('headers', [])).get(b'origin')
+    if origin is None:
+        return []
+    if settings.CORS_ALLOW_ALL_ORIGINS or origin.decode('latin1') in settings.CORS_ALLOWED_ORIGINS:
+        return [
+            (b'access-control-allow-origin', origin),
+            (b'access-control-allow-credentials', b'true'),
+        ]
+    return []
+
+
+class VoucherEventsApp:
+    """
+    ASGI wrapper serving the event stream (STREAM_PATH) directly and passing
+    every other request on to Django. Streams stay out of Django's request
+    handler so thousands of idle connections cost one coroutine each.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+            await self.stream(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    async def respond(self, scope, send, status, data):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json')] + cors_headers(scope),
+        })
+        await send({'type': 'http.response.body', 'body': json.dumps(data).encode()})
+
+    async def stream(self, scope, receive, send):
+        if scope['method'] != 'GET':
+            await self.respond(scope, send, 405, {'detail': 'Method not allowed'})
+            return
+
+        user_id = authenticate_scope(scope)
+        if user_id is None:
+            await self.respond(
+                scope, send, 401,
+                {'detail': 'Authentication credentials were not provided or are invalid'})
+            return
+
+        broker = get_broker()
+        subscription = broker.subscribe(user_id)
+        disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+        getter = None
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ] + cors_headers(scope),
+            })
+            await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+
+            while True:
+                if getter is None:
+                    getter = asyncio.ensure_future(subscription.get())
+                done, _ = await asyncio.wait(
+                    {getter, disconnect},
+                    timeout=settings.VOUCHER_EVENTS_KEEPALIVE,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if disconnect in done:
+                    break
+                if getter in done:
+                    body = format_event(getter.result())
+                    getter = None
+                else:
+                    # Comment line keeps proxies from closing idle connections
+                    body = ': keepalive\n\n'
+                await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+        finally:
+            if getter is not None:
+                getter.cancel()
+            disconnect.cancel()
+            broker.unsubscribe(subscription)
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
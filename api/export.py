@@ -0,0 +1,193 @@
+"""
+Full export of one agent's data, streamed.
+
+    ndjson   one JSON object per line: {"type": "mautamer", "data": {...}},
+             then {"type": "voucher", "data": {...}} in the voucher detail
+             format (archived vouchers too, with "archived": true)
+    csv      a zip with one CSV per table (mautamers, vouchers, flights,
+             voucher_mautamers, hotels, transportations)
+
+Tables are walked in id order, EXPORT_CHUNK_SIZE rows at a time, each
+chunk starting after the last id of the one before (no OFFSET). Only one
+chunk is in memory and every chunk costs a fixed number of queries: one
+per mautamer or CSV chunk, four per voucher chunk (vouchers with flight
+and user, then passengers, hotels and transport prefetched). Rows changed
+while an export runs show up as they are when their chunk is read.
+
+Under ASGI Django buffers a sync iterator whole before sending it, so
+there the view streams through threaded(): an async iterator that reads
+each chunk on the request's sync thread.
+"""
+import csv
+import io
+import json
+import zipfile
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Value
+from rest_framework.utils.encoders import JSONEncoder
+
+from .journal import plain
+from .models import (
+    ArchivedVoucher, FlightInformation, Hotel, Mautamer, Transportation, Voucher, VoucherMautamer
+)
+from .serializers import (
+    FlightInformationSerializer, HotelSerializer, MautamerSerializer, TransportationSerializer,
+    VoucherDetailSerializer
+)
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+FORMATS = [NDJSON, CSV]
+
+
+def chunks(queryset, size, key='pk'):
+    """Lists of up to `size` rows of the queryset in `key` order, one query each"""
+    queryset = queryset.order_by(key)
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(**{f'{key}__gt': last})
+        rows = list(page[:size])
+        if not rows:
+            return
+        yield rows
+        # values_list() rows carry the key first
+        last = rows[-1][0] if isinstance(rows[-1], tuple) else getattr(rows[-1], key)
+        if len(rows) < size:
+            return
+
+
+async def threaded(iterator):
+    """`iterator` as an async iterator, each item produced off the event loop"""
+    step = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    try:
+        while (item := await step(iterator, done)) is not done:
+            yield item
+    finally:
+        # Client gone early: let the generator clean up in its thread too
+        await sync_to_async(iterator.close, thread_sensitive=True)()
+
+
+class Exporter:
+    """
+    Export of the agent `user_id`. `database` is where the agent's live
+    rows are read from (its shard or replica, picked while the request was
+    routed); the archive is read where ArchiveRouter sends it.
+    """
+
+    def __init__(self, user_id, database, chunk_size=None):
+        self.user_id = user_id
+        self.database = database
+        self.chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+
+    def mautamers(self):
+        return Mautamer.objects.using(self.database).filter(user_id=self.user_id)
+
+    def vouchers(self):
+        return Voucher.objects.using(self.database).filter(user_id=self.user_id)
+
+    def archived(self):
+        return ArchivedVoucher.objects.filter(user_id=self.user_id)
+
+    def children(self, model):
+        return model.objects.using(self.database).filter(voucher__user_id=self.user_id)
+
+    def ndjson(self):
+        """Bytes of the NDJSON export, one chunk of lines at a time"""
+        def lines(kind, rows):
+            return ''.join(
+                json.dumps({'type': kind, 'data': row}, cls=JSONEncoder) + '\n' for row in rows
+            ).encode()
+
+        for rows in chunks(self.mautamers(), self.chunk_size):
+            yield lines('mautamer', MautamerSerializer(rows, many=True).data)
+        for rows in chunks(self.vouchers().with_details(), self.chunk_size):
+            yield lines('voucher', VoucherDetailSerializer(rows, many=True).data)
+        for rows in chunks(self.archived(), self.chunk_size, key='voucher_id'):
+            yield lines('voucher', [row.as_detail() for row in rows])
+
+    def tables(self):
+        """(file name, columns, queryset, rows of one archived voucher or None) per CSV"""
+        def from_data(name, columns):
+            def rows(archived):
+                value = archived.data.get(name) or []
+                for item in value if isinstance(value, list) else [value]:
+                    item = dict(item, voucher_id=archived.voucher_id)
+                    yield [item.get(column) for column in columns]
+            return rows
+
+        def voucher_row(archived):
+            yield [archived.voucher_id, archived.vNo, archived.agentName, archived.status,
+                   archived.groupName, archived.data.get('created_at'),
+                   archived.data.get('updated_at'), True]
+
+        mautamer_columns = ['id', 'pax_name', 'passport', 'created_at', 'updated_at']
+        voucher_columns = ['id', 'vNo', 'agentName', 'status', 'groupName',
+                           'created_at', 'updated_at']
+        pax_columns = ['id', 'voucher_id', 'mautamer_id', 'pax_name', 'passport']
+        flight_columns = ['voucher_id', *FlightInformationSerializer.Meta.fields]
+        hotel_columns = ['voucher_id', *HotelSerializer.Meta.fields]
+        transport_columns = ['voucher_id', *TransportationSerializer.Meta.fields]
+        return [
+            ('mautamers.csv', mautamer_columns, self.mautamers(), mautamer_columns, None),
+            ('vouchers.csv', [*voucher_columns, 'archived'], self.vouchers(),
+             [*voucher_columns, Value(False)], voucher_row),
+            ('flights.csv', flight_columns, self.children(FlightInformation),
+             flight_columns, from_data('flight_info', flight_columns)),
+            ('voucher_mautamers.csv', pax_columns, self.children(VoucherMautamer),
+             ['id', 'voucher_id', 'mautamer_id', 'mautamer__pax_name', 'mautamer__passport'],
+             from_data('mautamers', pax_columns)),
+            ('hotels.csv', hotel_columns, self.children(Hotel),
+             hotel_columns, from_data('hotels', hotel_columns)),
+            ('transportations.csv', transport_columns, self.children(Transportation),
+             transport_columns, from_data('transportations', transport_columns)),
+        ]
+
+    def csv_zip(self):
+        """Bytes of the zipped CSV export, written as the tables are read"""
+        output = ZipOutput()
+        with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, header, queryset, fields, archived_rows in self.tables():
+                # Size unknown until the end, zip64 headers so it may pass 4 GB
+                with archive.open(name, 'w', force_zip64=True) as entry:
+                    text = io.TextIOWrapper(entry, encoding='utf-8', newline='')
+                    writer = csv.writer(text)
+                    writer.writerow(header)
+                    for rows in self.csv_chunks(queryset, fields, archived_rows):
+                        writer.writerows([plain(value) for value in row] for row in rows)
+                        text.flush()
+                        yield output.take()
+                    text.detach()
+                yield output.take()
+        yield output.take()
+
+    def csv_chunks(self, queryset, fields, archived_rows):
+        # pk first for chunks(), dropped from the written row
+        values = queryset.values_list('pk', *fields)
+        for rows in chunks(values, self.chunk_size):
+            yield [row[1:] for row in rows]
+        if archived_rows is None:
+            return
+        for rows in chunks(self.archived(), self.chunk_size, key='voucher_id'):
+            yield [row for archived in rows for row in archived_rows(archived)]
+
+
+class ZipOutput(io.RawIOBase):
+    """Write-only, unseekable file zipfile writes into; take() empties it"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        return len(data)
+
+    def take(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
@@ -0,0 +1,138 @@
+"""
+Sparse fieldsets for the voucher endpoints.
+
+    ?fields=id,vNo,status                     only these fields
+    ?fields=vNo,flight_info.departure_date    nested fields with a dot
+    ?include=hotels,mautamers                 add relations with all their fields
+
+A fieldset is {field name: set of nested field names, or None for all}.
+sparse_queryset() selects only the columns behind the requested fields
+(only()) and joins or prefetches only the requested relations, so the
+SQL shrinks with the response. Without either parameter nothing changes.
+"""
+from django.db.models import Prefetch
+from rest_framework.exceptions import ValidationError
+from rest_framework.relations import RelatedField
+
+# Serializer field -> Voucher relation it reads
+PREFETCHED = {
+    'mautamers': 'voucher_mautamers',
+    'hotels': 'hotels',
+    'transportations': 'transportations',
+}
+JOINED = {'flight_info', 'user'}
+
+
+def readable(fields):
+    return {name: field for name, field in fields.items() if not field.write_only}
+
+
+def nested_fields(field):
+    return readable(getattr(field, 'child', field).fields)
+
+
+def parse_fieldset(params, serializer, default_fields=None):
+    """Fieldset for ?fields= / ?include=, None when neither is given"""
+    if not params.get('fields') and not params.get('include'):
+        return None
+
+    available = readable(serializer.fields)
+    relations = set(PREFETCHED) | {'flight_info'}
+    if params.get('fields'):
+        fieldset = {}
+    else:
+        fieldset = {name: None for name in default_fields or available if name not in relations}
+
+    for token in filter(None, params.get('fields', '').split(',')):
+        name, _, sub = token.strip().partition('.')
+        if name not in available:
+            raise ValidationError({'fields': [f'Unknown field: {name}']})
+        if not sub:
+            fieldset[name] = None
+            continue
+        if name not in relations or sub not in nested_fields(available[name]):
+            raise ValidationError({'fields': [f'Unknown field: {token}']})
+        if fieldset.get(name, set()) is not None:
+            fieldset.setdefault(name, set()).add(sub)
+
+    for name in filter(None, params.get('include', '').split(',')):
+        if name.strip() not in relations:
+            raise ValidationError({'include': [f"Use any of: {', '.join(sorted(relations))}"]})
+        fieldset[name.strip()] = None
+
+    fieldset['id'] = None
+    return fieldset
+
+
+def columns(fields, names, prefix=''):
+    """only() paths behind serializer fields; nested sources like mautamer.pax_name join"""
+    paths = []
+    for name in names:
+        path = prefix + fields[name].source.replace('.', '__')
+        if isinstance(fields[name], RelatedField):
+            # StringRelatedField renders str(user), which is the username
+            path += '__username'
+        paths.append(path)
+    return paths
+
+
+def sparse_queryset(queryset, fieldset, serializer):
+    """Queryset reading only what `fieldset` serializes"""
+    fields = readable(serializer.fields)
+    only = []
+    # Drop the default joins, they would load deferred columns
+    queryset = queryset.select_related(None).prefetch_related(None)
+    for name, subfields in fieldset.items():
+        if name in PREFETCHED:
+            relation = PREFETCHED[name]
+            nested = nested_fields(fields[name])
+            related = queryset.model._meta.get_field(relation).related_model
+            paths = columns(nested, subfields or nested)
+            rows = related.objects.only('id', 'voucher', *paths)
+            joins = {path.split('__')[0] for path in paths if '__' in path}
+            if joins:
+                rows = rows.select_related(*joins)
+            queryset = queryset.prefetch_related(Prefetch(relation, queryset=rows))
+        elif name == 'flight_info':
+            nested = nested_fields(fields[name])
+            queryset = queryset.select_related('flight_info')
+            only += columns(nested, subfields or nested, prefix='flight_info__')
+            only.append('flight_info__voucher')
+        elif name in JOINED:
+            queryset = queryset.select_related(name)
+            only += columns(fields, [name])
+        else:
+            only += columns(fields, [name])
+    return queryset.only(*only)
+
+
+class SparseFieldsetMixin:
+    """
+    For the generic voucher views: GET honours ?fields= / ?include=.
+    fieldset_serializer_class is the serializer the fields are picked from,
+    default_fields what ?include= alone starts from (all fields if unset).
+    """
+    fieldset_serializer_class = None
+    default_fields = None
+
+    def get_fieldset(self):
+        if self.request.method != 'GET':
+            return None
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = parse_fieldset(
+                self.request.query_params, self.fieldset_serializer_class(), self.default_fields)
+        return self._fieldset
+
+    def get_serializer_class(self):
+        if self.get_fieldset() is not None:
+            return self.fieldset_serializer_class
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        fieldset = self.get_fieldset()
+        if fieldset is not None:
+            kwargs['fieldset'] = fieldset
+        return super().get_serializer(*args, **kwargs)
+
+    def sparse(self, queryset):
+        return sparse_queryset(queryset, self.get_fieldset(), self.fieldset_serializer_class())
@@ -0,0 +1,87 @@
+"""
+Query parameters for the voucher lists.
+
+Every filter maps onto a column of Voucher (travel dates are the summary
+columns, no join to flight_info) and every ordering onto an index in
+Voucher.Meta.indexes, so the database does the filtering and sorting.
+
+    ?status=pending,approved
+    ?agent=12                   admin only, agent user id
+    ?group=Group 7              exact groupName
+    ?created_after=2026-01-01   created_before, departure_after,
+                                departure_before, return_after, return_before
+    ?ordering=-departure_date   one of ORDERINGS
+"""
+from datetime import date, datetime, time
+
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import Voucher
+
+# ordering parameter -> order_by(), id breaks ties so pages are stable
+ORDERINGS = {
+    'created_at': ['created_at', 'id'],
+    '-created_at': ['-created_at', '-id'],
+    'departure_date': ['departure_date', 'id'],
+    '-departure_date': ['-departure_date', '-id'],
+    'return_date': ['return_date', 'id'],
+    '-return_date': ['-return_date', '-id'],
+    'vNo': ['vNo'],
+    '-vNo': ['-vNo'],
+}
+DEFAULT_ORDERING = '-created_at'
+
+STATUSES = {value for value, _ in Voucher.STATUS_CHOICES}
+
+# parameter -> (lookup, end of day for datetimes)
+DATE_FILTERS = {
+    'created_after': ('created_at__gte', False),
+    'created_before': ('created_at__lte', True),
+    'departure_after': ('departure_date__gte', None),
+    'departure_before': ('departure_date__lte', None),
+    'return_after': ('return_date__gte', None),
+    'return_before': ('return_date__lte', None),
+}
+
+
+def parse_date(name, value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError({name: ['Date has wrong format. Use YYYY-MM-DD.']})
+
+
+def filter_vouchers(queryset, params, allow_agent=False):
+    """Apply the list query parameters to `queryset`, ValidationError on bad input"""
+    filters = {}
+
+    if params.get('status'):
+        statuses = params['status'].split(',')
+        unknown = set(statuses) - STATUSES
+        if unknown:
+            raise ValidationError({'status': [f"Unknown status: {', '.join(sorted(unknown))}"]})
+        filters['status__in'] = statuses
+
+    if allow_agent and params.get('agent'):
+        if not params['agent'].isdigit():
+            raise ValidationError({'agent': ['Agent must be a user id.']})
+        filters['user_id'] = int(params['agent'])
+
+    if params.get('group'):
+        filters['groupName'] = params['group']
+
+    for name, (lookup, end_of_day) in DATE_FILTERS.items():
+        if not params.get(name):
+            continue
+        value = parse_date(name, params[name])
+        if end_of_day is not None:
+            value = timezone.make_aware(
+                datetime.combine(value, time.max if end_of_day else time.min))
+        filters[lookup] = value
+
+    ordering = params.get('ordering', DEFAULT_ORDERING)
+    if ordering not in ORDERINGS:
+        raise ValidationError({'ordering': [f"Use one of: {', '.join(ORDERINGS)}"]})
+
+    return queryset.filter(**filters).order_by(*ORDERINGS[ordering])
@@ -0,0 +1,237 @@
+"""
+Append-only change journal of vouchers.
+
+Every write through the API or the Django admin records who changed what
+as one VoucherChange row with field-level diffs:
+
+    {"status": ["pending", "approved"],
+     "flight_info.return_date": ["2026-03-15", "2026-03-18"],
+     "hotels": {"added": [{...}], "removed": [{...}]}}
+
+Entries are built in the request but not inserted there. Once the write's
+transaction commits they go into a per-process buffer, and a background
+writer thread inserts them with one bulk_create per batch, every
+VOUCHER_JOURNAL_FLUSH_INTERVAL seconds or as soon as a batch is full. A
+crash loses at most what was buffered since the last flush (one interval,
+never more than VOUCHER_JOURNAL_MAX_PENDING entries: when the buffer is
+that full the caller flushes itself). Normal shutdown flushes at exit.
+"""
+import atexit
+import logging
+import os
+import threading
+from datetime import date, datetime, time
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import VoucherChange
+
+logger = logging.getLogger(__name__)
+
+VOUCHER_FIELDS = ['vNo', 'agentName', 'status', 'groupName']
+# Nested parts of a voucher a snapshot can read
+NESTED = ['flight_info', 'mautamers', 'hotels', 'transportations']
+
+
+def plain(value):
+    """JSON-ready value, dates and times as ISO strings"""
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def row_data(obj):
+    return {
+        field.attname: plain(getattr(obj, field.attname))
+        for field in obj._meta.concrete_fields
+        if field.attname not in ('id', 'voucher_id')
+    }
+
+
+def snapshot(voucher, parts=NESTED):
+    """
+    State of a voucher as plain data. Only the nested `parts` are read;
+    prefetched relations (Voucher.objects.with_details()) cost no queries.
+    """
+    data = {name: plain(getattr(voucher, name)) for name in VOUCHER_FIELDS}
+    if 'flight_info' in parts:
+        try:
+            data['flight_info'] = row_data(voucher.flight_info)
+        except ObjectDoesNotExist:
+            data['flight_info'] = None
+    if 'mautamers' in parts:
+        data['mautamers'] = sorted(row.mautamer_id for row in voucher.voucher_mautamers.all())
+    if 'hotels' in parts:
+        data['hotels'] = [row_data(hotel) for hotel in voucher.hotels.all()]
+    if 'transportations' in parts:
+        data['transportations'] = [row_data(row) for row in voucher.transportations.all()]
+    return data
+
+
+def blank(data):
+    """Empty counterpart of a snapshot, with the same parts"""
+    return {name: [] if isinstance(value, list) else None for name, value in data.items()}
+
+
+def rows_diff(before, after):
+    """Rows added and removed, compared as whole rows (children are replaced on edit)"""
+    remaining = list(before)
+    added = []
+    for row in after:
+        if row in remaining:
+            remaining.remove(row)
+        else:
+            added.append(row)
+    return {'added': added, 'removed': remaining}
+
+
+def diff(before, after):
+    """Field-level changes between two snapshots, parts missing on either side are skipped"""
+    changes = {}
+    for name in VOUCHER_FIELDS:
+        if name in before and name in after and before[name] != after[name]:
+            changes[name] = [before.get(name), after[name]]
+
+    if 'flight_info' in before and 'flight_info' in after:
+        old, new = before['flight_info'] or {}, after['flight_info'] or {}
+        for name in sorted(set(old) | set(new)):
+            if old.get(name) != new.get(name):
+                changes[f'flight_info.{name}'] = [old.get(name), new.get(name)]
+
+    if 'mautamers' in before and 'mautamers' in after:
+        old, new = set(before['mautamers']), set(after['mautamers'])
+        if old != new:
+            changes['mautamers'] = {'added': sorted(new - old), 'removed': sorted(old - new)}
+
+    for name in ('hotels', 'transportations'):
+        if name in before and name in after:
+            rows = rows_diff(before[name], after[name])
+            if rows['added'] or rows['removed']:
+                changes[name] = rows
+    return changes
+
+
+class Journal:
+    """Per-process buffer of VoucherChange rows and the thread writing them"""
+
+    def __init__(self, batch_size, flush_interval, max_pending):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer = None
+        self._pid = os.getpid()
+        atexit.register(self.flush)
+
+    def record(self, entry):
+        if self._pid != os.getpid():
+            # Forked worker: the parent's writer thread did not come along
+            self._pid = os.getpid()
+            self._writer = None
+            self._pending = []
+
+        with self._lock:
+            self._pending.append(entry)
+            pending = len(self._pending)
+
+        if not settings.VOUCHER_JOURNAL_BACKGROUND:
+            if pending >= self.batch_size:
+                self.flush()
+            return
+        if pending >= self.max_pending:
+            # Writer is falling behind, write in the caller instead of growing
+            self.flush()
+            return
+        self._start_writer()
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Insert everything buffered so far, returns how many rows were written"""
+        with self._flush_lock:
+            with self._lock:
+                entries, self._pending = self._pending, []
+            if not entries:
+                return 0
+            try:
+                VoucherChange.objects.bulk_create(entries, batch_size=self.batch_size)
+            except DatabaseError:
+                logger.exception('Writing %d voucher journal entries failed', len(entries))
+                with self._lock:
+                    # Retried on the next flush, oldest dropped past max_pending
+                    self._pending = (entries + self._pending)[-self.max_pending:]
+                return 0
+            return len(entries)
+
+    def _start_writer(self):
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(
+                    target=self._run, name='voucher-journal', daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            close_old_connections()
+            self.flush()
+
+
+@lru_cache(maxsize=None)
+def get_journal():
+    return Journal(
+        batch_size=settings.VOUCHER_JOURNAL_BATCH_SIZE,
+        flush_interval=settings.VOUCHER_JOURNAL_FLUSH_INTERVAL,
+        max_pending=settings.VOUCHER_JOURNAL_MAX_PENDING,
+    )
+
+
+def record_change(voucher, actor, action, before=None, after=None, source=VoucherChange.API):
+    """
+    Journal a change of `voucher` made by `actor` once the current
+    transaction commits. Updates that changed nothing are not recorded.
+    """
+    # Created: everything from nothing, deleted: everything to nothing
+    if before is None:
+        before = blank(after or {})
+    if after is None:
+        after = blank(before)
+    changes = diff(before, after)
+    if action != VoucherChange.CREATED and action != VoucherChange.DELETED and not changes:
+        return
+    entry = VoucherChange(
+        voucher_id=voucher.pk,
+        agent_id=voucher.user_id,
+        vNo=voucher.vNo,
+        actor_id=getattr(actor, 'pk', None),
+        source=source,
+        action=action,
+        changes=changes,
+        changed_at=timezone.now(),
+    )
+    transaction.on_commit(lambda: get_journal().record(entry))
+
+
+def payload_parts(data):
+    """Nested parts of a voucher an API payload replaces"""
+    parts = [name for name in ('flight_info', 'hotels', 'transportations') if name in data]
+    if 'mautamer_ids' in data:
+        parts.append('mautamers')
+    return parts
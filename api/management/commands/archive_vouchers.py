@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.archive import archivable, archive_batch
+from api.sharding import each_shard, shards, using_shard
+
+
+class Command(BaseCommand):
+    help = (
+        'Move vouchers whose return date is before the cutoff, with their '
+        'flight, hotels, transport and passengers, into the archive. '
+        'Incremental and safe to re-run after an interruption.'
+    )
+
+    def add_arguments(self, parser):
+        cutoff = parser.add_mutually_exclusive_group()
+        cutoff.add_argument('--before', type=date.fromisoformat,
+                            help='Archive vouchers returning before this date (YYYY-MM-DD)')
+        cutoff.add_argument('--older-than-days', type=int, default=30,
+                            help='Archive vouchers that returned more than N days ago')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--limit', type=int,
+                            help='Stop after archiving this many vouchers')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        cutoff = options['before'] or (
+            timezone.localdate() - timedelta(days=options['older_than_days']))
+
+        if options['dry_run']:
+            count = sum(pending.count() for pending in each_shard(archivable(cutoff)))
+            self.stdout.write(f'{count} vouchers returning before {cutoff}')
+            return
+
+        moved = 0
+        # Each shard in turn when sharded (api/sharding.py)
+        for shard in shards() or [None]:
+            with using_shard(shard):
+                moved = self.archive(cutoff, options, moved)
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {moved} vouchers returning before {cutoff}'))
+
+    def archive(self, cutoff, options, moved):
+        pending = archivable(cutoff).order_by('id')
+        limit = options['limit']
+        last_id = 0
+        while limit is None or moved < limit:
+            size = options['batch_size'] if limit is None else min(
+                options['batch_size'], limit - moved)
+            ids = list(pending.filter(id__gt=last_id).values_list('id', flat=True)[:size])
+            if not ids:
+                break
+            moved += archive_batch(ids)
+            last_id = ids[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{moved} archived (up to id {last_id})')
+        return moved
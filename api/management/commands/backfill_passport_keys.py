@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, router, transaction
+
+from api.export import chunks
+from api.models import Mautamer, normalize_passport
+from api.sharding import shards, using_shard
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill Mautamer.passport_key for rows written before it existed (or '
+        'after the normalization changed). Batched by id, safe to re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        updated = 0
+        # Each shard in turn when sharded (api/sharding.py)
+        for shard in shards() or [None]:
+            with using_shard(shard):
+                updated += self.backfill(options)
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} passport keys'))
+
+    def backfill(self, options):
+        alias = router.db_for_write(Mautamer)
+        connection = connections[alias]
+        quote = connection.ops.quote_name
+        # Plain UPDATE per row: only the key changes, and bulk_update's CASE
+        # building costs more than the writes
+        sql = (f'UPDATE {quote(Mautamer._meta.db_table)} SET {quote("passport_key")} = %s '
+               f'WHERE {quote("id")} = %s')
+
+        updated = 0
+        rows = Mautamer.objects.using(alias).values_list('id', 'passport', 'passport_key')
+        for batch in chunks(rows, options['batch_size']):
+            stale = [(new_key, pk) for pk, passport, key in batch
+                     if (new_key := normalize_passport(passport)) != key]
+            if stale:
+                with transaction.atomic(using=alias), connection.cursor() as cursor:
+                    cursor.executemany(sql, stale)
+                updated += len(stale)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{updated} updated, up to id {batch[-1][0]}')
+        return updated
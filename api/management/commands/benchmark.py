@@ -0,0 +1,97 @@
+import json
+import platform
+import subprocess
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases
+)
+
+from api.benchmarks import seed, build_cases, run_case, compare
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every API route at several data scales on a throwaway test '
+        'database. Writes throughput, p50/p99 latency and query count per '
+        'endpoint as JSON; with --baseline, fails on regressions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='10,1000,100000',
+                            help='Comma separated voucher/mautamer counts')
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Timed requests per endpoint')
+        parser.add_argument('--max-seconds', type=float, default=10.0,
+                            help='Time budget per endpoint, at least one request runs')
+        parser.add_argument('--only', default='',
+                            help='Comma separated endpoint names to run')
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--baseline', help='Earlier output to compare against')
+        parser.add_argument('--max-slowdown', type=float, default=1.5,
+                            help='Allowed p99 ratio against the baseline')
+        parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                            help='p99 changes smaller than this are noise')
+
+    def handle(self, *args, **options):
+        scales = [int(scale) for scale in options['scales'].split(',') if scale]
+        only = {name for name in options['only'].split(',') if name}
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        # Every route is timed doing its work, not being throttled (api/throttling.py)
+        unthrottled = override_settings(
+            REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}})
+        unthrottled.enable()
+        try:
+            results = {}
+            for scale in scales:
+                call_command('flush', interactive=False, verbosity=0)
+                self.stdout.write(f'Seeding scale {scale}...')
+                admin, agents = seed(scale)
+                results[str(scale)] = {}
+                for case in build_cases(admin, agents):
+                    if only and case.name not in only:
+                        continue
+                    result = run_case(case, options['iterations'], options['max_seconds'])
+                    results[str(scale)][case.name] = result
+                    self.stdout.write(
+                        f"  {case.name:<34} p50 {result['p50_ms']:>10.2f}ms  "
+                        f"p99 {result['p99_ms']:>10.2f}ms  {result['queries']:>7} queries  "
+                        f"{result['throughput_rps']:>8.1f} req/s")
+        finally:
+            unthrottled.disable()
+            teardown_databases(old_config, verbosity=0)
+
+        report = {'meta': self.meta(options), 'results': results}
+        with open(options['output'], 'w') as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+            handle.write('\n')
+        self.stdout.write(f"Wrote {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)
+            regressions = compare(
+                baseline, report, options['max_slowdown'], options['min_delta_ms'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(regression)
+                raise CommandError(f'{len(regressions)} regression(s) against baseline')
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True).stdout.strip()
+        except OSError:
+            commit = ''
+        return {
+            'commit': commit,
+            'python': platform.python_version(),
+            'iterations': options['iterations'],
+            'max_seconds': options['max_seconds'],
+        }
@@ -0,0 +1,82 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.startup import memory_kb
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare worker startup: each worker importing the app (no preload), '
+        'forking from a master that loaded it, and forking from a master that '
+        'also warmed it. Reports time to the first response and per-worker '
+        'memory (private and proportional share, Linux only).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True,
+                            help='Existing user the first request authenticates as')
+        parser.add_argument('--path', default='/api/agent/mautamers/')
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' not found")
+        token = str(AccessToken.for_user(user))
+        self.env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'backend.settings'))
+        self.cwd = settings.BASE_DIR
+        self.verbosity = options['verbosity']
+
+        rows = [
+            ('no preload', self.cold(options['path'], token, options['workers'])),
+            ('preload', self.forked('fork', options['path'], token, options['workers'])),
+            ('preload + warm', self.forked('preload', options['path'], token, options['workers'])),
+        ]
+        self.stdout.write(f"{'mode':<16}{'first request ms':>18}{'private KB':>12}"
+                          f"{'PSS KB':>10}{'total PSS KB':>14}")
+        for name, workers in rows:
+            statuses = {worker['status'] for worker in workers}
+            if statuses != {'200 OK'}:
+                raise CommandError(f'{name}: first requests returned {statuses}')
+            self.stdout.write(
+                f"{name:<16}"
+                f"{statistics.median(w['first_request_ms'] for w in workers):>18.1f}"
+                f"{statistics.median(w.get('private_kb', 0) for w in workers):>12}"
+                f"{statistics.median(w.get('pss_kb', 0) for w in workers):>10}"
+                f"{sum(w.get('pss_kb', 0) for w in workers):>14}")
+
+    def cold(self, path, token, workers):
+        processes = [
+            subprocess.Popen(
+                [sys.executable, '-m', 'api.startup', 'cold', path, token],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=self.env, cwd=self.cwd)
+            for _ in range(workers)
+        ]
+        results = []
+        for process in processes:
+            result = json.loads(process.stdout.readline())
+            result.update(memory_kb(process.pid) or {})
+            results.append(result)
+        for process in processes:
+            process.communicate()
+        return results
+
+    def forked(self, mode, path, token, workers):
+        output = subprocess.run(
+            [sys.executable, '-m', 'api.startup', mode, path, token, str(workers)],
+            capture_output=True, env=self.env, cwd=self.cwd, check=True).stdout
+        report = json.loads(output)
+        if self.verbosity > 1:
+            self.stdout.write(f"{mode}: master load {report['load_ms']} ms, "
+                              f"warm steps {report['warm_steps']}")
+        return report['workers']
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Voucher, VoucherMautamer, SUMMARY_FIELDS, summary_expressions
+from api.sharding import shards, using_shard
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the stored voucher summary columns (and the travel window on '
+        'passenger rows) with the rows they are computed from, and with --fix '
+        'recompute the ones that drifted'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        # Each shard in turn when sharded (api/sharding.py)
+        mismatched = {}
+        for shard in shards() or [None]:
+            with using_shard(shard):
+                mismatched[shard] = sorted(
+                    set(self.stale_vouchers(options)) | set(self.stale_trips(options)))
+        total = sum(len(ids) for ids in mismatched.values())
+
+        if not total:
+            self.stdout.write(self.style.SUCCESS('All voucher summaries are up to date'))
+            return
+
+        if not options['fix']:
+            raise CommandError(f'{total} vouchers have stale summaries, rerun with --fix')
+
+        for shard, ids in mismatched.items():
+            with using_shard(shard):
+                for start in range(0, len(ids), options['batch_size']):
+                    Voucher.objects.filter(
+                        id__in=ids[start:start + options['batch_size']]).refresh_summaries()
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {total} voucher summaries'))
+
+    def stale_vouchers(self, options):
+        expected = {f'expected_{name}': expr for name, expr in summary_expressions().items()}
+        vouchers = Voucher.objects.order_by('id').annotate(**expected).values(
+            'id', 'vNo', *SUMMARY_FIELDS, *expected)
+
+        last_id = 0
+        while True:
+            batch = list(vouchers.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            for row in batch:
+                drifted = [name for name in SUMMARY_FIELDS
+                           if row[name] != row[f'expected_{name}']]
+                if drifted:
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f"{row['vNo']}: {', '.join(drifted)}")
+                    yield row['id']
+            last_id = batch[-1]['id']
+
+    def stale_trips(self, options):
+        trips = VoucherMautamer.objects.order_by('id').values(
+            'id', 'voucher_id', 'departure_date', 'return_date',
+            'voucher__departure_date', 'voucher__return_date')
+        last_id = 0
+        while True:
+            batch = list(trips.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            for row in batch:
+                if (row['departure_date'], row['return_date']) != (
+                        row['voucher__departure_date'], row['voucher__return_date']):
+                    yield row['voucher_id']
+            last_id = batch[-1]['id']
@@ -0,0 +1,48 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.datagen import DataGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate deterministic synthetic agents, mautamers and vouchers (with '
+        'flights, hotels, transport and passengers) in chunked bulk inserts'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vouchers', type=int, default=100000)
+        parser.add_argument('--mautamers', type=int,
+                            help='Defaults to twice the number of vouchers')
+        parser.add_argument('--agents', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--prefix', default='gen',
+                            help='Prefix for usernames and voucher numbers')
+        parser.add_argument('--start', type=date.fromisoformat, default=date(2024, 1, 1),
+                            help='First departure date (YYYY-MM-DD)')
+        parser.add_argument('--days', type=int, default=730,
+                            help='Departures are spread over this many days')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Zipf exponent of agent sizes, 0 gives equal agents')
+
+    def handle(self, *args, **options):
+        generator = DataGenerator(
+            vouchers=options['vouchers'],
+            mautamers=options['mautamers'] or options['vouchers'] * 2,
+            agents=options['agents'],
+            seed=options['seed'],
+            prefix=options['prefix'],
+            start=options['start'],
+            days=options['days'],
+            chunk_size=options['chunk_size'],
+            skew=options['skew'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        try:
+            generator.run()
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {options['vouchers']} vouchers for {options['agents']} agents"))
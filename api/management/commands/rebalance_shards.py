@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import AgentShard
+from api.sharding import agent_sizes, copy_user, move_agent, plan_moves, shards
+
+
+class Command(BaseCommand):
+    help = (
+        'Show how agents and their rows are spread over DATABASE_SHARDS and move '
+        'agents between shards: one agent with --agent/--to, or the moves that '
+        'even out the shards with --balance (printed only, unless --apply)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--init', action='store_true',
+                            help='Map agents not in the shard map yet to the first shard, '
+                                 'where their rows are when sharding is switched on')
+        parser.add_argument('--agent', type=int, help='User id of the agent to move')
+        parser.add_argument('--to', help='Shard to move --agent to')
+        parser.add_argument('--balance', action='store_true')
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Allowed spread between shards, share of the average')
+        parser.add_argument('--apply', action='store_true', help='Carry out the --balance moves')
+        parser.add_argument('--wait', type=float, default=None,
+                            help='Seconds between blocking an agent and copying its rows '
+                                 '(default SHARD_MAP_CACHE_SECONDS)')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_SHARDS:
+            raise CommandError('DATABASE_SHARDS is empty, sharding is off')
+        wait = settings.SHARD_MAP_CACHE_SECONDS if options['wait'] is None else options['wait']
+
+        if options['init']:
+            self.init()
+        if options['agent'] is not None or options['to']:
+            if options['agent'] is None or options['to'] not in shards():
+                raise CommandError(f"--agent needs --to, one of: {', '.join(shards())}")
+            self.move(options['agent'], options['to'], wait)
+        if options['balance']:
+            moves = plan_moves(options['tolerance'])
+            if not moves:
+                self.stdout.write('Shards are balanced')
+            for user_id, source, target, rows in moves:
+                self.stdout.write(f'agent {user_id}: {source} -> {target} ({rows} rows)')
+                if options['apply']:
+                    self.move(user_id, target, wait)
+        self.show()
+
+    def init(self):
+        mapped = set(AgentShard.objects.values_list('user_id', flat=True))
+        first = shards()[0]
+        agents = [user_id for user_id in User.objects.values_list('id', flat=True)
+                  if user_id not in mapped]
+        for user_id in agents:
+            copy_user(user_id, first)
+        AgentShard.objects.bulk_create(
+            [AgentShard(user_id=user_id, alias=first) for user_id in agents],
+            ignore_conflicts=True)
+        self.stdout.write(f'Mapped {len(agents)} agents to {first}')
+
+    def move(self, user_id, target, wait):
+        if not AgentShard.objects.filter(user_id=user_id).exists():
+            raise CommandError(f'Agent {user_id} is not in the shard map')
+        copied = move_agent(user_id, target, wait=wait)
+        self.stdout.write(self.style.SUCCESS(f'Moved agent {user_id} to {target}: {copied} rows'))
+
+    def show(self):
+        for alias, agents in agent_sizes().items():
+            mapped = AgentShard.objects.filter(alias=alias).count()
+            self.stdout.write(
+                f'{alias}: {mapped} agents mapped, {len(agents)} with rows, '
+                f'{sum(agents.values())} vouchers + mautamers')
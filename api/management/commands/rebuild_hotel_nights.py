@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.models import HotelAllotment, HotelNight
+from api.stays import rebuild_nights
+
+
+class Command(BaseCommand):
+    help = (
+        'Recount booked rooms per hotel per night from the hotel allotments and '
+        'the stays of live vouchers (after imports or direct edits of Hotel rows)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hotel', action='append', dest='hotels',
+                            help='Only this hotel name, can be repeated')
+
+    def handle(self, *args, **options):
+        # Hotels with nights but no allotment left get their nights removed
+        hotels = options['hotels'] or sorted(
+            set(HotelAllotment.objects.values_list('hotel_name', flat=True))
+            | set(HotelNight.objects.values_list('hotel_name', flat=True).distinct()))
+        for hotel_name in hotels:
+            nights = rebuild_nights(hotel_name)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{hotel_name}: {nights} nights')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(hotels)} hotels'))
@@ -0,0 +1,41 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from api.passports import duplicate_report
+
+
+class Command(BaseCommand):
+    help = (
+        'List travellers (same normalized passport) registered by several '
+        'agents, with every agent\'s mautamer row. Run backfill_passport_keys '
+        'first on data from before passport keys existed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-agents', type=int, default=2)
+        parser.add_argument('--csv', action='store_true',
+                            help='One CSV row per mautamer instead of the text report')
+
+    def handle(self, *args, **options):
+        duplicates = duplicate_report(options['min_agents'])
+        if options['csv']:
+            writer = csv.writer(self.stdout)
+            writer.writerow(['passport_key', 'agents', 'mautamer_id', 'agent_id', 'agent',
+                             'pax_name', 'passport'])
+            for duplicate in duplicates:
+                for mautamer in duplicate['mautamers']:
+                    writer.writerow([duplicate['passport_key'], duplicate['agents'],
+                                     *mautamer.values()])
+            return
+
+        travellers = 0
+        for duplicate in duplicates:
+            travellers += 1
+            self.stdout.write(f"{duplicate['passport_key']}: {duplicate['agents']} agents")
+            for mautamer in duplicate['mautamers']:
+                self.stdout.write(
+                    f"  #{mautamer['id']} {mautamer['agent']}: "
+                    f"{mautamer['pax_name']} ({mautamer['passport']})")
+        self.stdout.write(self.style.SUCCESS(
+            f"{travellers} travellers registered by {options['min_agents']} or more agents"))
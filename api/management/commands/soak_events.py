@@ -0,0 +1,128 @@
+import asyncio
+import resource
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.events import get_broker
+
+
+class Command(BaseCommand):
+    help = (
+        'Open many idle voucher event streams against the ASGI app in this '
+        'process, push one event through all of them and report timings/memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True,
+                            help='Existing agent the streams authenticate as')
+        parser.add_argument('--connections', type=int, default=2000)
+        parser.add_argument('--timeout', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' not found")
+
+        token = str(AccessToken.for_user(user))
+        results = asyncio.run(self.soak(
+            user.id, token, options['connections'], options['timeout']))
+
+        for key, value in results.items():
+            self.stdout.write(f'{key}: {value}')
+        if results['received'] != options['connections']:
+            raise CommandError('Not every stream received the event')
+        self.stdout.write(self.style.SUCCESS('All streams received the event'))
+
+    async def soak(self, user_id, token, connections, timeout):
+        from backend.asgi import application
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        disconnect = asyncio.Event()
+        connected = asyncio.Semaphore(0)
+        received = asyncio.Semaphore(0)
+
+        async def client():
+            sent_request = False
+            got_event = False
+
+            async def receive():
+                nonlocal sent_request
+                if not sent_request:
+                    sent_request = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                nonlocal got_event
+                if message['type'] == 'http.response.start':
+                    if message['status'] != 200:
+                        raise CommandError(f"Stream rejected: {message['status']}")
+                    return
+                body = message.get('body', b'')
+                if body.startswith(b'retry:'):
+                    connected.release()
+                elif body.startswith(b'event:') and not got_event:
+                    got_event = True
+                    received.release()
+
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': '/vouchers/events/',
+                'raw_path': b'/vouchers/events/',
+                'query_string': b'',
+                'root_path': '',
+                'headers': [
+                    (b'host', b'localhost'),
+                    (b'authorization', f'Bearer {token}'.encode()),
+                ],
+                'client': ('127.0.0.1', 0),
+                'server': ('127.0.0.1', 5000),
+            }
+            await application(scope, receive, send)
+
+        async def wait_for(semaphore, count):
+            for _ in range(count):
+                await semaphore.acquire()
+
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(client()) for _ in range(connections)]
+        await asyncio.wait_for(wait_for(connected, connections), timeout)
+        connect_time = time.perf_counter() - started
+        rss_connected = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        started = time.perf_counter()
+        get_broker().publish(user_id, {
+            'type': 'status', 'voucher_id': 0, 'vNo': 'SOAK',
+            'status': 'approved', 'updated_at': None,
+        })
+        count = 0
+        try:
+            for _ in range(connections):
+                await asyncio.wait_for(received.acquire(), timeout)
+                count += 1
+        except asyncio.TimeoutError:
+            pass
+        fanout_time = time.perf_counter() - started
+
+        disconnect.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        return {
+            'connections': connections,
+            'received': count,
+            'connect_seconds': round(connect_time, 3),
+            'fanout_seconds': round(fanout_time, 3),
+            'peak_rss_kb_before': rss_before,
+            'peak_rss_kb_connected': rss_connected,
+            'rss_kb_per_connection': round(
+                (rss_connected - rss_before) / max(connections, 1), 2),
+        }
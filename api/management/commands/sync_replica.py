@@ -0,0 +1,34 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database over the local stand-in replicas '
+        'in DATABASE_REPLICAS (development only, real replicas replicate themselves)'
+    )
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('DATABASE_REPLICAS is empty')
+
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError('Only SQLite primaries can be copied this way')
+
+        primary.ensure_connection()
+        for alias in settings.DATABASE_REPLICAS:
+            replica_settings = connections[alias].settings_dict
+            if replica_settings['ENGINE'] != primary.settings_dict['ENGINE']:
+                raise CommandError(f"Replica '{alias}' is not an SQLite database")
+            connections[alias].close()
+            target = sqlite3.connect(replica_settings['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(
+                f"Copied {primary.settings_dict['NAME']} to {replica_settings['NAME']}"))
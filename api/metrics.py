@@ -0,0 +1,129 @@
+"""
+In-process request metrics.
+
+PerformanceMiddleware (api/middleware.py) fills a RequestMetrics for every
+request and observes it into the histograms below, per route name. The
+admin metrics endpoint renders them in Prometheus text format.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+current_metrics = ContextVar('current_metrics', default=None)
+# Inside a timed serializer, nested ones are part of its time
+in_serializer = ContextVar('in_serializer', default=False)
+
+
+class RequestMetrics:
+    __slots__ = ('route', 'queries', 'db_time', 'serialize_time', 'render_time')
+
+    def __init__(self):
+        self.route = 'unmatched'
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+
+
+def add_render_time(seconds):
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics.render_time += seconds
+
+
+@contextmanager
+def serializer_timer():
+    """Adds the block to the request's serializer time, the outermost one only"""
+    metrics = current_metrics.get()
+    if metrics is None or in_serializer.get():
+        yield
+        return
+    token = in_serializer.set(True)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        in_serializer.reset(token)
+        metrics.serialize_time += time.perf_counter() - started
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """Fixed-bucket histogram with one series per label set"""
+
+    def __init__(self, name, documentation, buckets, label_names=('route', 'method')):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [per-bucket counts..., +Inf count], sum
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            snapshot = [(labels, list(counts), total)
+                        for labels, (counts, total) in sorted(self._series.items())]
+        for labels, counts, total in snapshot:
+            label_text = ','.join(
+                f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Wall time per request', TIME_BUCKETS)
+DB_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL queries per request',
+    (0, 1, 2, 5, 10, 20, 50, 100, 200, 500))
+DB_DURATION = Histogram(
+    'http_request_db_seconds', 'SQL time per request', TIME_BUCKETS)
+SERIALIZE_DURATION = Histogram(
+    'http_request_serialize_seconds',
+    'Serializer to_representation time per request, queries it makes included', TIME_BUCKETS)
+RENDER_DURATION = Histogram(
+    'http_request_render_seconds', 'Response rendering time per request', TIME_BUCKETS)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Response body size',
+    (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216))
+
+REGISTRY = [
+    REQUEST_DURATION, DB_QUERIES, DB_DURATION, SERIALIZE_DURATION, RENDER_DURATION, RESPONSE_SIZE,
+]
+
+
+def render_metrics():
+    return '\n'.join(histogram.render() for histogram in REGISTRY) + '\n'
@@ -0,0 +1,185 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.http import JsonResponse
+
+from .metrics import (
+    RequestMetrics, current_metrics,
+    REQUEST_DURATION, DB_QUERIES, DB_DURATION, SERIALIZE_DURATION, RENDER_DURATION, RESPONSE_SIZE
+)
+from .routers import read_database, pick_replica
+from .sharding import current_shard, get_shard_map
+from .tokens import raw_token_from_header, token_user_id
+
+slow_query_logger = logging.getLogger('api.slow_queries')
+
+
+class PerformanceMiddleware:
+    """
+    Records wall time, SQL count/time, serializer time (queries made while
+    serializing included), rendering time and response size for every
+    request. Adds them as a Server-Timing header and observes them into
+    the per-route histograms in api/metrics.py. SQL slower than
+    SLOW_QUERY_THRESHOLD_MS is logged to the 'api.slow_queries' logger.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(
+                        QueryRecorder(metrics, connection.alias)))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        total = time.perf_counter() - started
+
+        labels = (metrics.route, request.method)
+        REQUEST_DURATION.observe(labels, total)
+        DB_QUERIES.observe(labels, metrics.queries)
+        DB_DURATION.observe(labels, metrics.db_time)
+        SERIALIZE_DURATION.observe(labels, metrics.serialize_time)
+        RENDER_DURATION.observe(labels, metrics.render_time)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(labels, len(response.content))
+
+        response['Server-Timing'] = (
+            f'total;dur={total * 1000:.1f}, '
+            f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries", '
+            f'serialize;dur={metrics.serialize_time * 1000:.1f}, '
+            f'render;dur={metrics.render_time * 1000:.1f}'
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.route = request.resolver_match.view_name
+        return None
+
+
+class QueryRecorder:
+    """connection.execute_wrapper counting queries and logging slow ones"""
+
+    def __init__(self, metrics, alias):
+        self.metrics = metrics
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.metrics.queries += 1
+            self.metrics.db_time += duration
+            if duration * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+                slow_query_logger.warning(
+                    'Slow query (%.1f ms, db=%s, route=%s): %s; params=%r',
+                    duration * 1000, self.alias, self.metrics.route, sql, params)
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def request_user_id(request):
+    """JWT user id of the request without a database lookup, or None"""
+    raw_token = raw_token_from_header(request.META.get('HTTP_AUTHORIZATION', ''))
+    return token_user_id(raw_token) if raw_token else None
+
+
+def pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+class ReplicaMiddleware:
+    """
+    Sends reads of views marked read_from_replica to a replica in
+    DATABASE_REPLICAS. After a successful write the user's reads stay on the
+    primary for REPLICA_PIN_SECONDS, so they always see their own changes.
+    Pins live in the cache; use a shared cache with several workers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        token = read_database.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_database.reset(token)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            user_id = request_user_id(request)
+            if user_id is None and getattr(request, 'user', None) is not None \
+                    and request.user.is_authenticated:
+                user_id = request.user.pk
+            if user_id is not None:
+                cache.set(pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        replica = replica_for(request, view_func)
+        if replica is not None:
+            read_database.set(replica)
+        return None
+
+
+def replica_for(request, view_func):
+    """Replica to read from for this request, None for the primary"""
+    if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+        return None
+    view_class = getattr(view_func, 'view_class', None)
+    if not getattr(view_class, 'read_from_replica', False):
+        return None
+    user_id = request_user_id(request)
+    if user_id is not None and cache.get(pin_key(user_id)):
+        return None
+    return pick_replica()
+
+
+class ShardMiddleware:
+    """
+    With DATABASE_SHARDS set, the request's own data (its user's mautamers
+    and vouchers) is read and written on that user's shard (api/sharding.py).
+    Writes of an agent whose rows are being moved get a 503 until it's done.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_SHARDS:
+            return self.get_response(request)
+
+        user_id = request_user_id(request)
+        if user_id is None and getattr(request, 'user', None) is not None \
+                and request.user.is_authenticated:
+            user_id = request.user.pk
+        alias, moving = get_shard_map().get(user_id) if user_id is not None else (None, False)
+        if moving and request.method not in SAFE_METHODS:
+            response = JsonResponse(
+                {'error': 'Agent data is being moved, please retry shortly'}, status=503)
+            response['Retry-After'] = '5'
+            return response
+
+        token = current_shard.set(alias)
+        try:
+            return self.get_response(request)
+        finally:
+            current_shard.reset(token)
+
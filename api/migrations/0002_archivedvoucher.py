@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedVoucher',
+            fields=[
+                ('voucher_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('vNo', models.CharField(db_index=True, max_length=50)),
+                ('agentName', models.CharField(max_length=200)),
+                ('status', models.CharField(max_length=20)),
+                ('groupName', models.CharField(blank=True, max_length=200, null=True)),
+                ('departure_date', models.DateField(null=True)),
+                ('return_date', models.DateField(db_index=True)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.JSONField()),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='archived_vouchers', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-return_date'],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:39
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_summaries(apps, schema_editor):
+    Voucher = apps.get_model('api', 'Voucher')
+    FlightInformation = apps.get_model('api', 'FlightInformation')
+    VoucherMautamer = apps.get_model('api', 'VoucherMautamer')
+    flight = FlightInformation.objects.filter(voucher=OuterRef('pk'))
+    pax = VoucherMautamer.objects.filter(voucher=OuterRef('pk')).order_by().values(
+        'voucher').annotate(count=Count('id')).values('count')
+    Voucher.objects.using(schema_editor.connection.alias).update(
+        departure_date=Subquery(flight.values('departure_date')[:1]),
+        arrival_date=Subquery(flight.values('arrival_date')[:1]),
+        return_date=Subquery(flight.values('return_date')[:1]),
+        nights=Coalesce(Subquery(flight.values('nights')[:1]), 0),
+        pax_count=Coalesce(Subquery(pax), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_archivedvoucher'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voucher',
+            name='arrival_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='voucher',
+            name='departure_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='voucher',
+            name='nights',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='voucher',
+            name='pax_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='voucher',
+            name='return_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(fields=['status', 'departure_date'], name='voucher_status_departure'),
+        ),
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(fields=['return_date'], name='voucher_return_date'),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:43
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_trip_windows(apps, schema_editor):
+    Voucher = apps.get_model('api', 'Voucher')
+    VoucherMautamer = apps.get_model('api', 'VoucherMautamer')
+    voucher = Voucher.objects.filter(pk=OuterRef('voucher_id'))
+    VoucherMautamer.objects.using(schema_editor.connection.alias).update(
+        departure_date=Subquery(voucher.values('departure_date')[:1]),
+        return_date=Subquery(voucher.values('return_date')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_voucher_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vouchermautamer',
+            name='departure_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='vouchermautamer',
+            name='return_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='vouchermautamer',
+            index=models.Index(fields=['mautamer', 'return_date', 'departure_date'], name='trip_mautamer_return'),
+        ),
+        migrations.RunPython(backfill_trip_windows, migrations.RunPython.noop),
+    ]
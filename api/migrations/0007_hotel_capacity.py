@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_mautamer_trip_window'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotelAllotment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hotel_name', models.CharField(db_index=True, max_length=200)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField(help_text='Last night is the day before this')),
+                ('rooms', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['hotel_name', 'start_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='HotelNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hotel_name', models.CharField(max_length=200)),
+                ('night', models.DateField()),
+                ('allotted', models.PositiveIntegerField(default=0)),
+                ('booked', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['hotel_name', 'night'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='hotel',
+            index=models.Index(fields=['hotel_name', 'checking_date'], name='hotel_name_checkin'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='hotelnight',
+            unique_together={('hotel_name', 'night')},
+        ),
+    ]
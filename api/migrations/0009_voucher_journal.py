@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_list_fingerprints'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoucherChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('voucher_id', models.BigIntegerField()),
+                ('vNo', models.CharField(max_length=50)),
+                ('source', models.CharField(choices=[('api', 'API'), ('admin', 'Admin')], max_length=10)),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('status', 'Status changed'), ('deleted', 'Deleted')], max_length=10)),
+                ('changes', models.JSONField(default=dict)),
+                ('changed_at', models.DateTimeField()),
+                ('actor', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('agent', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['voucher_id', 'changed_at', 'id'],
+                'indexes': [models.Index(fields=['voucher_id', 'changed_at'], name='change_voucher_time')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_voucher_journal'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mautamer',
+            index=models.Index(fields=['user', 'pax_name'], name='mautamer_user_name'),
+        ),
+        migrations.AddIndex(
+            model_name='mautamer',
+            index=models.Index(fields=['user', 'passport'], name='mautamer_user_passport'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_agent_shards'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mautamer',
+            name='passport_key',
+            field=models.CharField(default='', editable=False, max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='mautamer',
+            index=models.Index(fields=['passport_key', 'user'], name='mautamer_passport_key'),
+        ),
+    ]
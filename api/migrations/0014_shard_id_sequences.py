@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_voucher_templates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardIdSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=50)),
+                ('table', models.CharField(max_length=100)),
+                ('next_value', models.BigIntegerField()),
+            ],
+            options={
+                'unique_together': {('alias', 'table')},
+            },
+        ),
+    ]
@@ -1,8 +1,77 @@
-from django.db import models
+import re
+import unicodedata
+
+from django.db import models, router
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 
-class Mautamer(models.Model):
+def normalize_passport(passport):
+    """
+    Passport number as a lookup key: "ab 1234567", "AB-1234567" and
+    "AB1234567" are all "AB1234567"
+    """
+    return re.sub(r'[^0-9A-Z]', '', unicodedata.normalize('NFKC', passport or '').upper())
+
+
+class ShardedQuerySet(models.QuerySet):
+    """
+    Manager of the sharded models. With DATABASE_SHARDS set, new rows get
+    their ids from the shard's own range (api/sharding.py), here on the bulk
+    path and in ShardedModel.save() for single rows.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .sharding import assign_ids
+
+        objs = list(objs)
+        self._for_write = True
+        assign_ids(self.model, self.db, objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class ShardedModel(models.Model):
+    objects = ShardedQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            from .sharding import assign_ids
+
+            using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+            if assign_ids(type(self), using, [self]):
+                kwargs['force_insert'] = True
+        super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
+
+
+class MautamerQuerySet(ShardedQuerySet):
+    """Fills passport_key on the bulk write paths, save() does it for single rows"""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for mautamer in objs:
+            mautamer.passport_key = normalize_passport(mautamer.passport)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if 'passport' in fields:
+            objs = list(objs)
+            for mautamer in objs:
+                mautamer.passport_key = normalize_passport(mautamer.passport)
+            fields = [*fields, 'passport_key']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        if isinstance(kwargs.get('passport'), str):
+            kwargs['passport_key'] = normalize_passport(kwargs['passport'])
+        return super().update(**kwargs)
+
+
+class Mautamer(ShardedModel):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='mautamers',
         help_text="Agent jiske liye ye mautamer hai",
@@ -11,16 +80,79 @@ class Mautamer(models.Model):
     )
     pax_name = models.CharField(max_length=200)
     passport = models.CharField(max_length=50)
+    # normalize_passport(passport), same traveller ko agents ke across dhoondne ke liye
+    passport_key = models.CharField(max_length=50, default='', editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = MautamerQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.pax_name} - {self.passport} ({self.user.username if self.user else 'No User'})"
 
+    def save(self, *args, **kwargs):
+        self.passport_key = normalize_passport(self.passport)
+        if kwargs.get('update_fields') is not None and 'passport' in kwargs['update_fields']:
+            kwargs['update_fields'] = [*kwargs['update_fields'], 'passport_key']
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['pax_name']
+        indexes = [
+            # Fingerprint of an agent's list (api/compression.py)
+            models.Index(fields=['user', 'updated_at'], name='mautamer_user_updated'),
+            # Admin changelist order and per-agent autocomplete (api/admin.py)
+            models.Index(fields=['user', 'pax_name'], name='mautamer_user_name'),
+            models.Index(fields=['user', 'passport'], name='mautamer_user_passport'),
+            # Duplicate checks on upload and the cross-agent report (api/passports.py)
+            models.Index(fields=['passport_key', 'user'], name='mautamer_passport_key'),
+        ]
+
+
+SUMMARY_FIELDS = ['departure_date', 'arrival_date', 'return_date', 'nights', 'pax_count']
 
 
-class Voucher(models.Model):
+def summary_expressions():
+    """Voucher summary columns computed from the flight and passenger rows"""
+    flight = FlightInformation.objects.filter(voucher=OuterRef('pk'))
+    pax = VoucherMautamer.objects.filter(voucher=OuterRef('pk')).order_by().values(
+        'voucher').annotate(count=Count('id')).values('count')
+    return {
+        'departure_date': Subquery(flight.values('departure_date')[:1]),
+        'arrival_date': Subquery(flight.values('arrival_date')[:1]),
+        'return_date': Subquery(flight.values('return_date')[:1]),
+        'nights': Coalesce(Subquery(flight.values('nights')[:1]), 0),
+        'pax_count': Coalesce(Subquery(pax), 0),
+    }
+
+
+class VoucherQuerySet(ShardedQuerySet):
+    def refresh_summaries(self):
+        """
+        Recompute the summary columns of these vouchers in one UPDATE, then
+        copy their travel window onto their passenger rows
+        """
+        # updated_at too, cached list bodies are keyed on it
+        updated = self.order_by().update(updated_at=timezone.now(), **summary_expressions())
+        voucher = Voucher.objects.filter(pk=OuterRef('voucher_id'))
+        VoucherMautamer.objects.filter(voucher__in=self.order_by().values('pk')).update(
+            departure_date=Subquery(voucher.values('departure_date')[:1]),
+            return_date=Subquery(voucher.values('return_date')[:1]),
+        )
+        return updated
+
+    def with_details(self):
+        """Everything VoucherDetailSerializer reads, in a fixed number of queries"""
+        return self.select_related('user', 'flight_info').prefetch_related(
+            models.Prefetch(
+                'voucher_mautamers',
+                queryset=VoucherMautamer.objects.select_related('mautamer')),
+            'hotels',
+            'transportations',
+        )
+
+
+class Voucher(ShardedModel):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('approved', 'Approved'),
@@ -37,14 +169,38 @@ class Voucher(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Summary of flight_info and voucher_mautamers so lists and date filters
+    # read one table. Kept in sync by refresh_summaries() on every write,
+    # check_voucher_summaries verifies them.
+    departure_date = models.DateField(null=True, blank=True, editable=False)
+    arrival_date = models.DateField(null=True, blank=True, editable=False)
+    return_date = models.DateField(null=True, blank=True, editable=False)
+    nights = models.IntegerField(default=0, editable=False)
+    pax_count = models.IntegerField(default=0, editable=False)
+
+    objects = VoucherQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.vNo} - {self.agentName}"
 
+    def refresh_summary(self):
+        Voucher.objects.filter(pk=self.pk).refresh_summaries()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'departure_date'], name='voucher_status_departure'),
+            models.Index(fields=['return_date'], name='voucher_return_date'),
+            # List filters and orderings (api/filters.py)
+            models.Index(fields=['user', 'created_at'], name='voucher_user_created'),
+            models.Index(fields=['created_at'], name='voucher_created'),
+            models.Index(fields=['departure_date'], name='voucher_departure'),
+            models.Index(fields=['groupName'], name='voucher_group'),
+            models.Index(fields=['updated_at'], name='voucher_updated'),
+        ]
 
 
-class VoucherMautamer(models.Model):
+class VoucherMautamer(ShardedModel):
     """
     Junction table between Voucher and Mautamer
     Voucher mein selected mautamers ko store karta hai
@@ -53,16 +209,23 @@ class VoucherMautamer(models.Model):
         Voucher, on_delete=models.CASCADE, related_name='voucher_mautamers')
     mautamer = models.ForeignKey(
         Mautamer, on_delete=models.CASCADE, related_name='voucher_assignments')
+    # Voucher ka travel window, overlapping trips dhoondne ke liye (api/conflicts.py)
+    departure_date = models.DateField(null=True, blank=True, editable=False)
+    return_date = models.DateField(null=True, blank=True, editable=False)
 
     class Meta:
         unique_together = ['voucher', 'mautamer']
         ordering = ['id']
+        indexes = [
+            models.Index(fields=['mautamer', 'return_date', 'departure_date'],
+                         name='trip_mautamer_return'),
+        ]
 
     def __str__(self):
         return f"{self.voucher.vNo} - {self.mautamer.pax_name}"
 
 
-class FlightInformation(models.Model):
+class FlightInformation(ShardedModel):
     voucher = models.OneToOneField(
         Voucher, on_delete=models.CASCADE, related_name='flight_info')
 
@@ -96,7 +259,7 @@ class FlightInformation(models.Model):
         return f"Flight Info - {self.voucher.vNo}"
 
 
-class Hotel(models.Model):
+class Hotel(ShardedModel):
     ROOM_TYPE_CHOICES = [
         ('single', 'Single Room'),
         ('double', 'Double Room'),
@@ -121,9 +284,50 @@ class Hotel(models.Model):
 
     class Meta:
         ordering = ['checking_date']
+        indexes = [
+            # Rebuilding HotelNight for one hotel (api/stays.py)
+            models.Index(fields=['hotel_name', 'checking_date'], name='hotel_name_checkin'),
+        ]
+
 
+class HotelAllotment(models.Model):
+    """
+    Rooms held at a hotel for a date range (checkout of end_date).
+    Hotels without an allotment are not capacity checked.
+    """
+    hotel_name = models.CharField(max_length=200, db_index=True)
+    start_date = models.DateField()
+    end_date = models.DateField(help_text="Last night is the day before this")
+    rooms = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.hotel_name}: {self.rooms} rooms {self.start_date} - {self.end_date}"
 
-class Transportation(models.Model):
+    class Meta:
+        ordering = ['hotel_name', 'start_date']
+
+
+class HotelNight(models.Model):
+    """
+    Rooms allotted and booked per hotel per night, built from HotelAllotment
+    and the Hotel rows of live vouchers (api/stays.py). One row per allotted
+    night, so a stay is checked with one range read.
+    """
+    hotel_name = models.CharField(max_length=200)
+    night = models.DateField()
+    allotted = models.PositiveIntegerField(default=0)
+    booked = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.hotel_name} {self.night}: {self.booked}/{self.allotted}"
+
+    class Meta:
+        unique_together = ['hotel_name', 'night']
+        ordering = ['hotel_name', 'night']
+
+
+class Transportation(ShardedModel):
     TRANSFER_TYPE_CHOICES = [
         ('bus', 'Bus'),
         ('car', 'Car'),
@@ -144,3 +348,145 @@ class Transportation(models.Model):
 
     class Meta:
         ordering = ['date']
+
+
+class ArchivedVoucher(models.Model):
+    """
+    Completed voucher moved out of the live tables by archive_vouchers.
+    Keeps the original voucher id and the full detail payload (flight,
+    hotels, transport, passengers) as one read-only document.
+    """
+    voucher_id = models.BigIntegerField(primary_key=True)
+    # No FK constraint - the archive can live in its own database
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False,
+        related_name='archived_vouchers')
+    vNo = models.CharField(max_length=50, db_index=True)
+    agentName = models.CharField(max_length=200)
+    status = models.CharField(max_length=20)
+    groupName = models.CharField(max_length=200, blank=True, null=True)
+    departure_date = models.DateField(null=True)
+    return_date = models.DateField(db_index=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.JSONField()
+
+    def __str__(self):
+        return f"{self.vNo} - {self.agentName} (archived)"
+
+    def as_detail(self):
+        return dict(self.data, archived=True)
+
+    class Meta:
+        ordering = ['-return_date']
+
+
+class VoucherSequence(models.Model):
+    """
+    Next free voucher number per prefix. Workers reserve whole blocks from
+    it (api/numbering.py), so the row is touched once per block.
+    """
+    prefix = models.CharField(max_length=20, unique=True)
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.prefix}: {self.next_value}"
+
+
+class VoucherChange(models.Model):
+    """
+    One entry of the voucher change journal (api/journal.py). Append-only:
+    rows are bulk inserted by the journal writer and never updated. No FK
+    to the voucher so the history outlives deleted and archived vouchers.
+    """
+    API = 'api'
+    ADMIN = 'admin'
+    SOURCE_CHOICES = [(API, 'API'), (ADMIN, 'Admin')]
+
+    CREATED = 'created'
+    UPDATED = 'updated'
+    STATUS = 'status'
+    DELETED = 'deleted'
+    ACTION_CHOICES = [
+        (CREATED, 'Created'),
+        (UPDATED, 'Updated'),
+        (STATUS, 'Status changed'),
+        (DELETED, 'Deleted'),
+    ]
+
+    voucher_id = models.BigIntegerField()
+    vNo = models.CharField(max_length=50)
+    # Owner of the voucher, for agents reading their own history
+    agent = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False,
+        related_name='+')
+    actor = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, related_name='+')
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    changes = models.JSONField(default=dict)
+    # When the change was made, not when the writer inserted it
+    changed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.vNo} {self.action} at {self.changed_at:%Y-%m-%d %H:%M}"
+
+    class Meta:
+        ordering = ['voucher_id', 'changed_at', 'id']
+        indexes = [
+            models.Index(fields=['voucher_id', 'changed_at'], name='change_voucher_time'),
+        ]
+
+
+class AgentShard(models.Model):
+    """
+    Shard map: the database holding an agent's mautamers and vouchers when
+    DATABASE_SHARDS is set (api/sharding.py). Lives in 'default'.
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    alias = models.CharField(max_length=50, db_index=True)
+    # Set by rebalance_shards while the agent's rows are copied, writes wait
+    moving = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.alias}{' (moving)' if self.moving else ''}"
+
+
+class ShardIdSequence(models.Model):
+    """
+    Next free id of a sharded table on one shard (api/sharding.py). Workers
+    reserve whole blocks from it, so the row is touched once per block.
+    Lives in 'default'.
+    """
+    alias = models.CharField(max_length=50)
+    table = models.CharField(max_length=100)
+    next_value = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.alias}.{self.table}: {self.next_value}"
+
+    class Meta:
+        unique_together = ['alias', 'table']
+
+
+class VoucherTemplate(models.Model):
+    """
+    Saved voucher an agent creates new ones from (api/cloning.py): agent,
+    group, flight, hotels and transport as one document, without passengers.
+    Independent of the voucher it was taken from.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='voucher_templates')
+    name = models.CharField(max_length=200)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.user.username})"
+
+    class Meta:
+        ordering = ['name']
+        unique_together = ['user', 'name']
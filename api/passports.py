@@ -0,0 +1,71 @@
+"""
+Same traveller registered by several agents.
+
+Mautamer.passport is kept as typed; passport_key is its normalized form
+(models.normalize_passport), set on every write and by
+backfill_passport_keys for older rows. The mautamer_passport_key index
+(passport_key, user) lets the database group by key straight off the
+index, so duplicates are found by one grouped query instead of comparing
+mautamers pairwise:
+
+    SELECT passport_key, COUNT(DISTINCT user_id) FROM api_mautamer
+    WHERE passport_key != '' GROUP BY passport_key HAVING COUNT(DISTINCT user_id) >= 2
+
+When sharded every agent is on one shard, so each shard's per-key counts
+are added up; the shards' results come in key order and are merged as
+they stream.
+"""
+import heapq
+from itertools import groupby, islice
+from operator import itemgetter
+
+from django.db.models import Count
+
+from .models import Mautamer
+from .sharding import each_shard, fan_out
+
+RECORD_FIELDS = ['id', 'user_id', 'user__username', 'pax_name', 'passport', 'passport_key']
+
+
+def duplicate_keys(min_agents=2):
+    """(passport_key, agent count) of keys used by at least `min_agents` agents, by key"""
+    grouped = Mautamer.objects.exclude(passport_key='').order_by('passport_key').values(
+        'passport_key').annotate(agents=Count('user', distinct=True))
+    parts = each_shard(grouped)
+    if len(parts) == 1:
+        yield from parts[0].filter(agents__gte=min_agents).values_list(
+            'passport_key', 'agents').iterator()
+        return
+    merged = heapq.merge(
+        *(part.values_list('passport_key', 'agents').iterator() for part in parts),
+        key=itemgetter(0))
+    for key, rows in groupby(merged, key=itemgetter(0)):
+        agents = sum(count for _, count in rows)
+        if agents >= min_agents:
+            yield key, agents
+
+
+def duplicate_report(min_agents=2, batch_size=500):
+    """
+    Travellers registered by several agents with their mautamer rows, one
+    dict per passport key. Rows are read batch_size keys at a time.
+    """
+    keys = duplicate_keys(min_agents)
+    while True:
+        batch = dict(islice(keys, batch_size))
+        if not batch:
+            return
+        records = fan_out(Mautamer.objects.filter(passport_key__in=list(batch)).order_by(
+            'passport_key', 'user_id', 'id').values(*RECORD_FIELDS))
+        for key, rows in groupby(records, key=itemgetter('passport_key')):
+            yield {
+                'passport_key': key,
+                'agents': batch[key],
+                'mautamers': [{
+                    'id': row['id'],
+                    'agent_id': row['user_id'],
+                    'agent': row['user__username'],
+                    'pax_name': row['pax_name'],
+                    'passport': row['passport'],
+                } for row in rows],
+            }
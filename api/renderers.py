@@ -0,0 +1,16 @@
+import time
+
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import add_render_time
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer that reports its time to the request metrics"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            add_render_time(time.perf_counter() - started)
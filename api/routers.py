@@ -0,0 +1,61 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+ARCHIVE_MODEL = 'api.archivedvoucher'
+
+# Replica alias picked for the current request, None means primary
+read_database = ContextVar('read_database', default=None)
+
+
+class ArchiveRouter:
+    """
+    Sends ArchivedVoucher to settings.ARCHIVE_DATABASE. With 'default' the
+    archive is just another table in the main database; with another alias
+    (e.g. a second SQLite file) only the archive table is migrated there.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower == ARCHIVE_MODEL:
+            return settings.ARCHIVE_DATABASE
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if settings.ARCHIVE_DATABASE == 'default':
+            return None
+        if f'{app_label}.{model_name}' == ARCHIVE_MODEL:
+            return db == settings.ARCHIVE_DATABASE
+        if db == settings.ARCHIVE_DATABASE:
+            return False
+        return None
+
+
+class ReplicaRouter:
+    """
+    Reads go to the replica ReplicaMiddleware picked for the request (only
+    for views with read_from_replica), everything else to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def pick_replica():
+    return random.choice(settings.DATABASE_REPLICAS)
@@ -1,10 +1,30 @@
 from django.contrib.auth.models import User
+from django.db import IntegrityError, router, transaction
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from .models import Voucher, FlightInformation, Mautamer, VoucherMautamer, Hotel, Transportation
+from .models import (
+    Voucher, FlightInformation, Mautamer, VoucherMautamer, Hotel, Transportation, ArchivedVoucher,
+    VoucherChange, VoucherTemplate
+)
+from .numbering import next_voucher_number
+from .conflicts import overlapping_trips
+from .stays import stay_errors, voucher_stays, counted, book
+from .sharding import atomic, each_shard, for_agent
+from .metrics import serializer_timer
 
+# Retries when a hand-picked vNo took an allocated number after its block was reserved
+NUMBER_ATTEMPTS = 3
 
-class RegisterSerializer(serializers.ModelSerializer):
+
+class TimedMixin:
+    """Reports its to_representation time to the request metrics (api/metrics.py)"""
+
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+
+class RegisterSerializer(TimedMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
     class Meta:
@@ -29,7 +49,7 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         return data
 
 
-class MautamerSerializer(serializers.ModelSerializer):
+class MautamerSerializer(TimedMixin, serializers.ModelSerializer):
     """Agent ke mautamers ki list dikhane ke liye"""
     class Meta:
         model = Mautamer
@@ -37,7 +57,7 @@ class MautamerSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at']
 
 
-class VoucherMautamerSerializer(serializers.ModelSerializer):
+class VoucherMautamerSerializer(TimedMixin, serializers.ModelSerializer):
     """Voucher mein selected mautamers ko show karne ke liye"""
     pax_name = serializers.CharField(
         source='mautamer.pax_name', read_only=True)
@@ -51,7 +71,7 @@ class VoucherMautamerSerializer(serializers.ModelSerializer):
         fields = ['id', 'mautamer_id', 'pax_name', 'passport']
 
 
-class FlightInformationSerializer(serializers.ModelSerializer):
+class FlightInformationSerializer(TimedMixin, serializers.ModelSerializer):
     class Meta:
         model = FlightInformation
         fields = [
@@ -63,7 +83,7 @@ class FlightInformationSerializer(serializers.ModelSerializer):
         ]
 
 
-class HotelSerializer(serializers.ModelSerializer):
+class HotelSerializer(TimedMixin, serializers.ModelSerializer):
     class Meta:
         model = Hotel
         fields = [
@@ -72,13 +92,30 @@ class HotelSerializer(serializers.ModelSerializer):
         ]
 
 
-class TransportationSerializer(serializers.ModelSerializer):
+class TransportationSerializer(TimedMixin, serializers.ModelSerializer):
     class Meta:
         model = Transportation
         fields = ['id', 'date', 'from_location', 'type_of_transfer']
 
 
-class VoucherListSerializer(serializers.ModelSerializer):
+class FieldsetMixin:
+    """Pass fieldset= (api/fieldsets.py) to serialize only the requested fields"""
+
+    def __init__(self, *args, fieldset=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fieldset is None:
+            return
+        for name in list(self.fields):
+            if name not in fieldset:
+                self.fields.pop(name)
+            elif fieldset[name]:
+                nested = getattr(self.fields[name], 'child', self.fields[name])
+                for subname in list(nested.fields):
+                    if subname not in fieldset[name]:
+                        nested.fields.pop(subname)
+
+
+class VoucherListSerializer(TimedMixin, serializers.ModelSerializer):
     """For listing vouchers - minimal data"""
     user = serializers.StringRelatedField(read_only=True)
 
@@ -89,7 +126,7 @@ class VoucherListSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'created_at', 'updated_at']
 
 
-class VoucherDetailSerializer(serializers.ModelSerializer):
+class VoucherDetailSerializer(TimedMixin, FieldsetMixin, serializers.ModelSerializer):
     """For detailed voucher view with all nested data"""
     flight_info = FlightInformationSerializer(required=False)
     mautamers = VoucherMautamerSerializer(
@@ -112,6 +149,24 @@ class VoucherDetailSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
         read_only_fields = ['user', 'created_at', 'updated_at']
+        # Left out, the server allocates one (api/numbering.py). Uniqueness
+        # is checked in validate_vNo, the model's validator only sees one shard.
+        extra_kwargs = {'vNo': {'required': False, 'validators': []}}
+
+    def validate_vNo(self, value):
+        # Archived vouchers left the live table, their numbers stay taken
+        if self.instance is not None and value == self.instance.vNo:
+            return value
+        taken = any(vouchers.exists() for vouchers in each_shard(Voucher.objects.filter(vNo=value)))
+        if taken or ArchivedVoucher.objects.filter(vNo=value).exists():
+            raise serializers.ValidationError('voucher with this vNo already exists.')
+        return value
+
+    def validate_hotels(self, value):
+        errors = stay_errors(value)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return value
 
     def create(self, validated_data):
         flight_info_data = validated_data.pop('flight_info', None)
@@ -119,28 +174,26 @@ class VoucherDetailSerializer(serializers.ModelSerializer):
         hotels_data = validated_data.pop('hotels', [])
         transportations_data = validated_data.pop('transportations', [])
 
-        voucher = Voucher.objects.create(**validated_data)
+        # Allocated before the transaction so a rollback cannot undo a block reservation
+        vno = None if 'vNo' in validated_data else next_voucher_number()
 
-        if flight_info_data:
-            FlightInformation.objects.create(
-                voucher=voucher, **flight_info_data)
+        with atomic(Voucher):
+            if vno is None:
+                voucher = Voucher.objects.create(**validated_data)
+            else:
+                voucher = self._create_numbered(vno, validated_data)
 
-        user = validated_data.get('user')
-        for mautamer_id in mautamer_ids:
-            try:
-                mautamer = Mautamer.objects.get(id=mautamer_id, user=user)
-                VoucherMautamer.objects.create(
-                    voucher=voucher, mautamer=mautamer)
-            except Mautamer.DoesNotExist:
-                pass
+            if flight_info_data:
+                FlightInformation.objects.create(
+                    voucher=voucher, **flight_info_data)
 
-        for hotel_data in hotels_data:
-            Hotel.objects.create(voucher=voucher, **hotel_data)
-
-        for transportation_data in transportations_data:
-            Transportation.objects.create(
-                voucher=voucher, **transportation_data)
+            self._check_trips(mautamer_ids, flight_info_data or {})
+            self._create_mautamers(voucher, mautamer_ids, validated_data.get('user'))
+            self._create_hotels(voucher, hotels_data)
+            self._create_transportations(voucher, transportations_data)
+            book(counted(voucher.status, self._stays(hotels_data)))
 
+            voucher.refresh_summary()
         return voucher
 
     def update(self, instance, validated_data):
@@ -149,53 +202,164 @@ class VoucherDetailSerializer(serializers.ModelSerializer):
         hotels_data = validated_data.pop('hotels', None)
         transportations_data = validated_data.pop('transportations', None)
 
-        instance.vNo = validated_data.get('vNo', instance.vNo)
-        instance.agentName = validated_data.get(
-            'agentName', instance.agentName)
-        instance.status = validated_data.get('status', instance.status)
-        instance.groupName = validated_data.get(
-            'groupName', instance.groupName)
-        instance.save()
-
-        if flight_info_data:
-            FlightInformation.objects.update_or_create(
-                voucher=instance,
-                defaults=flight_info_data
-            )
-
-        if mautamer_ids is not None:
-            instance.voucher_mautamers.all().delete()
-            for mautamer_id in mautamer_ids:
-                try:
-                    mautamer = Mautamer.objects.get(
-                        id=mautamer_id, user=instance.user)
-                    VoucherMautamer.objects.create(
-                        voucher=instance, mautamer=mautamer)
-                except Mautamer.DoesNotExist:
-                    pass
-
-        if hotels_data is not None:
-            instance.hotels.all().delete()
-            for hotel_data in hotels_data:
-                Hotel.objects.create(voucher=instance, **hotel_data)
-
-        if transportations_data is not None:
-            instance.transportations.all().delete()
-            for transportation_data in transportations_data:
-                Transportation.objects.create(
-                    voucher=instance, **transportation_data)
+        with atomic(Voucher):
+            previous_status = instance.status
+            instance.vNo = validated_data.get('vNo', instance.vNo)
+            instance.agentName = validated_data.get(
+                'agentName', instance.agentName)
+            instance.status = validated_data.get('status', instance.status)
+            instance.groupName = validated_data.get(
+                'groupName', instance.groupName)
+            instance.save()
+            self._check_trips(mautamer_ids, flight_info_data or {}, instance)
+
+            if flight_info_data:
+                FlightInformation.objects.update_or_create(
+                    voucher=instance,
+                    defaults=flight_info_data
+                )
+
+            if mautamer_ids is not None:
+                instance.voucher_mautamers.all().delete()
+                self._create_mautamers(instance, mautamer_ids, instance.user_id)
 
-        return instance
+            if hotels_data is not None or instance.status != previous_status:
+                stays = voucher_stays(instance)
+                new_stays = stays if hotels_data is None else self._stays(hotels_data)
+                book(counted(instance.status, new_stays), counted(previous_status, stays))
 
+            if hotels_data is not None:
+                instance.hotels.all().delete()
+                self._create_hotels(instance, hotels_data)
+
+            if transportations_data is not None:
+                instance.transportations.all().delete()
+                self._create_transportations(instance, transportations_data)
+
+            if flight_info_data or mautamer_ids is not None:
+                instance.refresh_summary()
+        return instance
 
-class VoucherStatusUpdateSerializer(serializers.ModelSerializer):
+    def _create_numbered(self, vno, validated_data):
+        for attempt in range(NUMBER_ATTEMPTS):
+            try:
+                with transaction.atomic(using=router.db_for_write(Voucher)):
+                    return Voucher.objects.create(vNo=vno, **validated_data)
+            except IntegrityError:
+                if attempt == NUMBER_ATTEMPTS - 1 or not Voucher.objects.filter(vNo=vno).exists():
+                    raise
+            vno = next_voucher_number()
+
+    def _check_trips(self, mautamer_ids, flight_info, instance=None):
+        """
+        Same mautamer cannot be on two trips at once. Runs in the write
+        transaction after the voucher row is written, with the mautamers
+        locked, so concurrent writes with the same people check one after the
+        other like book() does for rooms.
+        """
+        departure_date = flight_info.get('departure_date')
+        return_date = flight_info.get('return_date')
+        if instance is not None:
+            departure_date = departure_date or instance.departure_date
+            return_date = return_date or instance.return_date
+            if mautamer_ids is None and flight_info:
+                mautamer_ids = list(instance.voucher_mautamers.values_list(
+                    'mautamer_id', flat=True))
+        if not (mautamer_ids and departure_date and return_date):
+            return
+
+        list(Mautamer.objects.select_for_update().filter(
+            id__in=mautamer_ids).values_list('id', flat=True))
+        trips = overlapping_trips(
+            mautamer_ids, departure_date, return_date,
+            exclude_voucher=instance.pk if instance is not None else None)
+        conflicts = [
+            f"{trip['mautamer__pax_name']} ({trip['mautamer__passport']}) is on voucher "
+            f"{trip['voucher__vNo']} from {trip['departure_date']} to {trip['return_date']}"
+            for trip in trips
+        ]
+        if conflicts:
+            raise serializers.ValidationError({'mautamer_ids': conflicts})
+
+    @staticmethod
+    def _stays(hotels_data):
+        return [(hotel['hotel_name'], hotel['checking_date'], hotel['checkout_date'])
+                for hotel in hotels_data]
+
+    def _create_mautamers(self, voucher, mautamer_ids, user):
+        # Sirf agent ke apne mautamers, unknown ids skip. One query for the
+        # lookup and one insert, whatever the number of passengers.
+        owned = set(Mautamer.objects.filter(
+            id__in=mautamer_ids, user=user).values_list('id', flat=True))
+        VoucherMautamer.objects.bulk_create([
+            VoucherMautamer(voucher=voucher, mautamer_id=mautamer_id)
+            for mautamer_id in dict.fromkeys(mautamer_ids)
+            if mautamer_id in owned
+        ])
+
+    def _create_hotels(self, voucher, hotels_data):
+        Hotel.objects.bulk_create([
+            Hotel(voucher=voucher, **hotel_data) for hotel_data in hotels_data
+        ])
+
+    def _create_transportations(self, voucher, transportations_data):
+        Transportation.objects.bulk_create([
+            Transportation(voucher=voucher, **transportation_data)
+            for transportation_data in transportations_data
+        ])
+
+
+class VoucherStatusUpdateSerializer(TimedMixin, serializers.ModelSerializer):
     """For admin to update status only"""
     class Meta:
         model = Voucher
         fields = ['status']
 
+    def update(self, instance, validated_data):
+        # Rejecting frees the voucher's rooms, un-rejecting needs them back
+        with atomic(Voucher):
+            previous_status = instance.status
+            instance = super().update(instance, validated_data)
+            if instance.status != previous_status:
+                stays = voucher_stays(instance)
+                book(counted(instance.status, stays), counted(previous_status, stays))
+        return instance
+
+
+class VoucherChangeSerializer(TimedMixin, serializers.ModelSerializer):
+    """One journal entry of a voucher's history"""
+    actor = serializers.SlugRelatedField(slug_field='username', read_only=True)
+
+    class Meta:
+        model = VoucherChange
+        fields = ['id', 'action', 'source', 'actor', 'changes', 'changed_at']
+
+
+class VoucherTemplateSerializer(TimedMixin, serializers.ModelSerializer):
+    """Saved voucher template, taken from the voucher voucher_id (api/cloning.py)"""
+    voucher_id = serializers.IntegerField(write_only=True, required=False)
+
+    class Meta:
+        model = VoucherTemplate
+        fields = ['id', 'name', 'voucher_id', 'data', 'created_at', 'updated_at']
+        read_only_fields = ['data', 'created_at', 'updated_at']
+
+    def validate_name(self, value):
+        templates = VoucherTemplate.objects.filter(user=self.context['request'].user, name=value)
+        if self.instance is not None:
+            templates = templates.exclude(pk=self.instance.pk)
+        if templates.exists():
+            raise serializers.ValidationError('You already have a template with this name.')
+        return value
+
+    def validate(self, attrs):
+        # Renaming keeps the document, sending a voucher retakes it
+        if self.instance is None and 'voucher_id' not in attrs:
+            raise serializers.ValidationError({'voucher_id': ['This field is required.']})
+        return attrs
+
 
-class AgentCreateSerializer(serializers.ModelSerializer):
+class AgentCreateSerializer(TimedMixin, serializers.ModelSerializer):
     """Admin agent create karne ke liye with mautamers"""
     password = serializers.CharField(write_only=True)
     mautamers = serializers.ListField(
@@ -217,12 +381,16 @@ class AgentCreateSerializer(serializers.ModelSerializer):
             password=validated_data['password']
         )
 
-        for mautamer_data in mautamers_data:
-            if 'pax_name' in mautamer_data and 'passport' in mautamer_data:
-                Mautamer.objects.create(
+        # New agent's shard when sharded
+        with for_agent(user.id):
+            Mautamer.objects.bulk_create([
+                Mautamer(
                     user=user,
                     pax_name=mautamer_data['pax_name'],
                     passport=mautamer_data['passport']
                 )
+                for mautamer_data in mautamers_data
+                if 'pax_name' in mautamer_data and 'passport' in mautamer_data
+            ], batch_size=500)
 
         return user
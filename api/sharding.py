@@ -0,0 +1,498 @@
+"""
+Optional per-agent sharding.
+
+With DATABASE_SHARDS empty (the default) everything lives in 'default' and
+nothing here does anything. With e.g. ['default', 'shard2', 'shard3'] every
+agent (user_id) is mapped to one shard in AgentShard, and that agent's
+mautamers, vouchers and voucher children live only there. Users, the shard
+map, the change journal, voucher numbering, hotel capacity and the archive
+stay in 'default'; agent users are also copied to their shard so the
+foreign keys there hold. Staff are not agents and get no shard: their own
+rows stay in 'default', and the views and admin pages where they work on
+agents pick the agent's shard (AgentShardMixin, api/admin.py).
+
+- ShardRouter sends the sharded models to the database of the instance
+  they belong to, else to current_shard: the agent of the request
+  (ShardMiddleware), or what for_agent()/AgentShardMixin chose.
+- Views reading every agent use each_shard()/fan_out() and merge.
+- Every shard gives out ids from its own range, so ids are unique across
+  shards and stay the same when an agent moves. New rows get them from
+  IdAllocator (ShardedQuerySet / ShardedModel in models.py), not from the
+  table's counter: SQLite and MySQL continue after the highest id in the
+  table, which after an agent moved in from a later shard is in that
+  shard's range.
+- rebalance_shards moves agents between shards.
+"""
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import Count, F, Max
+
+from .models import (
+    AgentShard, FlightInformation, Hotel, Mautamer, ShardIdSequence, Transportation, Voucher,
+    VoucherMautamer
+)
+
+# Copied in this order when an agent moves, parents before children
+SHARDED_MODELS = [
+    (Mautamer, 'user_id'),
+    (Voucher, 'user_id'),
+    (FlightInformation, 'voucher__user_id'),
+    (VoucherMautamer, 'voucher__user_id'),
+    (Hotel, 'voucher__user_id'),
+    (Transportation, 'voucher__user_id'),
+]
+SHARDED = {model._meta.label_lower for model, _ in SHARDED_MODELS}
+# Ids of shard n start at n * SHARD_ID_SPAN
+SHARD_ID_SPAN = 10 ** 12
+
+current_shard = ContextVar('current_shard', default=None)
+
+
+def shards():
+    return list(settings.DATABASE_SHARDS)
+
+
+def is_sharded(model):
+    return bool(settings.DATABASE_SHARDS) and model._meta.label_lower in SHARDED
+
+
+class ShardMap:
+    """AgentShard rows cached per process for SHARD_MAP_CACHE_SECONDS"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """
+        (alias, moving) of the agent, mapping agents seen for the first time.
+        (None, False) for staff and unknown users.
+        """
+        user_id = int(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is not None and entry[2] > now:
+            return entry[:2]
+
+        row = AgentShard.objects.using(DEFAULT_DB_ALIAS).filter(
+            user_id=user_id).values_list('alias', 'moving').first()
+        if row is None:
+            row = assign_shard(user_id)
+            if row is None:
+                return None, False
+        with self._lock:
+            self._entries[user_id] = (*row, now + settings.SHARD_MAP_CACHE_SECONDS)
+        return row
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(int(user_id), None)
+
+
+@lru_cache(maxsize=None)
+def get_shard_map():
+    return ShardMap()
+
+
+def shard_for(user_id):
+    """Database of an agent's rows, None when not sharded"""
+    if not settings.DATABASE_SHARDS or user_id is None:
+        return None
+    return get_shard_map().get(user_id)[0]
+
+
+def copy_user(user_id, alias):
+    """Agent's user row on its shard, only the foreign keys there need it"""
+    if alias == DEFAULT_DB_ALIAS:
+        return True
+    user = User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id).first()
+    if user is None:
+        return False
+    User.objects.using(alias).bulk_create([user], ignore_conflicts=True)
+    return True
+
+
+def assign_shard(user_id):
+    """
+    Map a new agent to the shard with the fewest agents. Staff stay unmapped,
+    (None, False); None when there is no such user.
+    """
+    is_staff = User.objects.using(DEFAULT_DB_ALIAS).filter(
+        pk=user_id).values_list('is_staff', flat=True).first()
+    if is_staff is None:
+        return None
+    if is_staff:
+        return None, False
+    mapped = Counter(dict(AgentShard.objects.using(DEFAULT_DB_ALIAS).filter(
+        user__is_staff=False).values_list('alias').annotate(count=Count('user')).order_by()))
+    alias = min(shards(), key=lambda name: mapped[name])
+    if not copy_user(user_id, alias):
+        return None
+    AgentShard.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+        [AgentShard(user_id=user_id, alias=alias)], ignore_conflicts=True)
+    # Another worker may have mapped the agent first
+    return AgentShard.objects.using(DEFAULT_DB_ALIAS).filter(
+        user_id=user_id).values_list('alias', 'moving').first()
+
+
+@contextmanager
+def using_shard(alias):
+    token = current_shard.set(alias)
+    try:
+        yield
+    finally:
+        current_shard.reset(token)
+
+
+def for_agent(user_id):
+    """Route the sharded models to the agent's shard inside the block"""
+    alias = shard_for(user_id)
+    return using_shard(alias) if alias is not None else nullcontext()
+
+
+def each_shard(queryset):
+    """The queryset on every shard, or just the queryset when not sharded"""
+    if not is_sharded(queryset.model):
+        return [queryset]
+    return [queryset.using(alias) for alias in shards()]
+
+
+def sort_key(name):
+    def key(row):
+        value = row[name] if isinstance(row, dict) else getattr(row, name)
+        return (value is None, value)
+    return key
+
+
+def fan_out(queryset):
+    """Rows of the queryset from every shard, merged in its ordering"""
+    parts = each_shard(queryset)
+    if len(parts) == 1:
+        return list(parts[0])
+    rows = [row for part in parts for row in part]
+    ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+    # Stable sorts from the last ordering field to the first
+    for name in reversed(ordering):
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        rows.sort(key=sort_key('id' if name == 'pk' else name), reverse=descending)
+    return rows
+
+
+def locate(model, pk):
+    """Shard holding the row, trying the one its id was issued by first"""
+    candidates = shards()
+    issued = pk // SHARD_ID_SPAN
+    if issued < len(candidates):
+        candidates.insert(0, candidates.pop(issued))
+    for alias in candidates:
+        if model._base_manager.using(alias).filter(pk=pk).exists():
+            return alias
+    return None
+
+
+@contextmanager
+def atomic(model):
+    """transaction.atomic on 'default' and on the shard `model` writes to"""
+    alias = router.db_for_write(model)
+    with transaction.atomic():
+        if alias in (None, DEFAULT_DB_ALIAS):
+            yield
+        else:
+            with transaction.atomic(using=alias):
+                yield
+
+
+class ShardRouter:
+    """
+    Sharded models go where the instance they relate to lives, else to
+    current_shard. Everything else is left to the other routers.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if isinstance(instance, User):
+            # Related managers of an agent, e.g. agent.mautamers
+            return shard_for(instance.pk)
+        if instance is not None and is_sharded(type(instance)):
+            if instance._state.db:
+                return instance._state.db
+            if getattr(instance, 'user_id', None):
+                return shard_for(instance.user_id)
+            # Children of a voucher (or mautamer) loaded through it
+            for name in ('voucher', 'mautamer'):
+                if hasattr(instance, f'{name}_id') \
+                        and instance._meta.get_field(name).is_cached(instance):
+                    return getattr(instance, name)._state.db
+        return current_shard.get()
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        sharded = [is_sharded(type(obj)) for obj in (obj1, obj2)]
+        if all(sharded):
+            return obj1._state.db == obj2._state.db
+        if any(sharded):
+            # Agent users live in 'default' and are copied to their shard
+            return isinstance(obj1, User) or isinstance(obj2, User)
+        return None
+
+
+class AgentShardMixin:
+    """
+    For views where staff work on one agent's data: the request runs on the
+    shard of the agent (`agent_id`) or the voucher (`pk`) in the URL.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not settings.DATABASE_SHARDS or not request.user.is_staff:
+            return
+        if 'agent_id' in kwargs:
+            alias = shard_for(kwargs['agent_id'])
+        elif 'pk' in kwargs:
+            alias = locate(Voucher, kwargs['pk'])
+        else:
+            return
+        if alias is not None:
+            self.shard_token = current_shard.set(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, 'shard_token', None)
+        if token is not None:
+            current_shard.reset(token)
+            self.shard_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def range_start(alias):
+    return settings.DATABASE_SHARDS.index(alias) * SHARD_ID_SPAN
+
+
+def table_counter(connection, table):
+    """Last id the table's own counter issued, None when unknown"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT pg_sequence_last_value(pg_get_serial_sequence(%s, 'id'))", [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT AUTO_INCREMENT - 1 FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def first_free_id(model, alias):
+    """
+    Where a shard's sequence starts: past every id the table holds or its
+    counter issued in the shard's range, so deleted and archived vouchers'
+    ids are not given out again
+    """
+    start = range_start(alias)
+    end = start + SHARD_ID_SPAN
+    taken = [start, model._base_manager.using(alias).filter(
+        pk__gt=start, pk__lt=end).aggregate(top=Max('pk'))['top'] or 0]
+    counter = table_counter(connections[alias], model._meta.db_table)
+    if counter is not None and counter < end:
+        taken.append(counter)
+    return max(taken) + 1
+
+
+class IdAllocator:
+    """
+    Ids of new sharded rows. Each worker process reserves blocks of
+    SHARD_ID_BLOCK_SIZE per shard and table from ShardIdSequence in one
+    short transaction and hands them out from memory, like voucher numbers
+    (api/numbering.py).
+    """
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self._free = {}
+        self._lock = threading.Lock()
+
+    def allocate(self, alias, model, count):
+        key = (alias, model._meta.db_table)
+        with self._lock:
+            free = self._free.get(key, [])
+            ids, self._free[key] = free[:count], free[count:]
+            if len(ids) == count:
+                return ids
+            block = self.reserve(alias, model, max(count - len(ids), self.block_size))
+        needed = count - len(ids)
+        ids += block[:needed]
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # A rollback gives the block back to the sequence, keep the
+            # rest only once the reservation is committed
+            transaction.on_commit(
+                lambda: self.release(key, block[needed:]), using=DEFAULT_DB_ALIAS)
+        else:
+            self.release(key, block[needed:])
+        return ids
+
+    def release(self, key, ids):
+        with self._lock:
+            self._free[key] = self._free.get(key, []) + ids
+
+    def reserve(self, alias, model, size):
+        table = model._meta.db_table
+        sequences = ShardIdSequence.objects.using(DEFAULT_DB_ALIAS).filter(
+            alias=alias, table=table)
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            if not sequences.update(next_value=F('next_value') + size):
+                ShardIdSequence.objects.using(DEFAULT_DB_ALIAS).get_or_create(
+                    alias=alias, table=table,
+                    defaults={'next_value': first_free_id(model, alias)})
+                sequences.update(next_value=F('next_value') + size)
+            end = sequences.values_list('next_value', flat=True).get()
+        return list(range(end - size, end))
+
+    def clear(self):
+        with self._lock:
+            self._free.clear()
+
+
+@lru_cache(maxsize=None)
+def get_id_allocator():
+    return IdAllocator(settings.SHARD_ID_BLOCK_SIZE)
+
+
+def assign_ids(model, alias, objs):
+    """Give the new rows among `objs` ids of `alias`, returns how many got one"""
+    if not is_sharded(model) or alias not in settings.DATABASE_SHARDS:
+        return 0
+    new = [obj for obj in objs if obj.pk is None]
+    if new:
+        for obj, pk in zip(new, get_id_allocator().allocate(alias, model, len(new))):
+            obj.pk = pk
+    return len(new)
+
+
+def reserve_id_ranges(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    post_migrate: start the sharded tables of shard n at n * SHARD_ID_SPAN.
+    Tables already past their start are left alone. Only rows inserted
+    outside the ORM (api/datagen.py) still take ids from these counters.
+    """
+    if using not in settings.DATABASE_SHARDS:
+        return
+    start = range_start(using)
+    if not start:
+        return
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for model, _ in SHARDED_MODELS:
+            table = model._meta.db_table
+            cursor.execute(f'SELECT MAX(id) FROM {connection.ops.quote_name(table)}')
+            if (cursor.fetchone()[0] or 0) >= start:
+                continue
+            if connection.vendor == 'sqlite':
+                cursor.execute('DELETE FROM sqlite_sequence WHERE name = %s', [table])
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)',
+                               [table, start])
+            elif connection.vendor == 'postgresql':
+                cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)",
+                               [table, start])
+            elif connection.vendor == 'mysql':
+                cursor.execute(
+                    f'ALTER TABLE {connection.ops.quote_name(table)} AUTO_INCREMENT = {start + 1}')
+
+
+def agent_sizes():
+    """{alias: {user_id: rows}} counting each agent's vouchers and mautamers"""
+    sizes = {alias: Counter() for alias in shards()}
+    for alias in sizes:
+        for model in (Voucher, Mautamer):
+            sizes[alias].update(dict(model.objects.using(alias).values_list(
+                'user_id').annotate(rows=Count('id')).order_by()))
+    return sizes
+
+
+def plan_moves(tolerance=0.1):
+    """
+    Moves (user_id, source, target, rows) bringing every shard within
+    `tolerance` of the average rows, largest agents that fit first.
+    """
+    sizes = agent_sizes()
+    loads = {alias: sum(agents.values()) for alias, agents in sizes.items()}
+    average = sum(loads.values()) / len(loads)
+    moves = []
+    while True:
+        heaviest = max(loads, key=loads.get)
+        lightest = min(loads, key=loads.get)
+        gap = loads[heaviest] - loads[lightest]
+        if gap <= tolerance * average:
+            return moves
+        # An agent smaller than the gap narrows it
+        fitting = [(rows, user_id) for user_id, rows in sizes[heaviest].items() if rows < gap]
+        if not fitting:
+            return moves
+        rows, user_id = max(fitting)
+        del sizes[heaviest][user_id]
+        sizes[lightest][user_id] = rows
+        loads[heaviest] -= rows
+        loads[lightest] += rows
+        moves.append((user_id, heaviest, lightest, rows))
+
+
+def move_agent(user_id, target, wait=0, batch_size=500):
+    """
+    Copy an agent's rows to `target`, switch the map, delete them from the
+    old shard. Writes of the agent get a 503 meanwhile (ShardMiddleware);
+    `wait` gives other workers' cached map entries time to expire first.
+    Re-running after a crash picks up where it stopped. Rows keep their
+    ids; new rows on `target` still get ids of its own range (IdAllocator).
+    Returns rows copied.
+    """
+    mapping = AgentShard.objects.using(DEFAULT_DB_ALIAS).get(user_id=user_id)
+    source = mapping.alias
+    if source == target:
+        return 0
+
+    AgentShard.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).update(moving=True)
+    get_shard_map().invalidate(user_id)
+    time.sleep(wait)
+
+    copy_user(user_id, target)
+    copied = 0
+    with transaction.atomic(using=target):
+        for model, owner in SHARDED_MODELS:
+            rows = model._base_manager.using(source).filter(**{owner: user_id}).order_by('pk')
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                batch.append(row)
+                if len(batch) == batch_size:
+                    model._base_manager.using(target).bulk_create(batch, ignore_conflicts=True)
+                    copied += len(batch)
+                    batch = []
+            model._base_manager.using(target).bulk_create(batch, ignore_conflicts=True)
+            copied += len(batch)
+
+    AgentShard.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).update(
+        alias=target, moving=False)
+    get_shard_map().invalidate(user_id)
+
+    with transaction.atomic(using=source):
+        # Children go with the vouchers
+        Voucher._base_manager.using(source).filter(user_id=user_id).delete()
+        Mautamer._base_manager.using(source).filter(user_id=user_id).delete()
+    return copied
@@ -0,0 +1,228 @@
+"""
+Worker startup: warm-up before forking and the startup benchmark.
+
+gunicorn.conf.py loads the application once in the master (preload_app),
+calls warm() and prepare_fork(), and every forked worker calls
+after_fork(). Work done in the master - imports, URL resolver, serializer
+field maps, JWT backend, templates - is shared copy-on-write by all
+workers; gc.freeze() keeps the collector from touching (and so copying)
+those pages. Database connections are opened and checked in the master to
+fail fast and fill the backend caches, then closed: a socket must never be
+shared across a fork, each worker opens its own.
+
+Run as ``python -m api.startup cold|preload ...`` this module is the probe
+process for the ``benchmark_startup`` command.
+"""
+import gc
+import inspect
+import io
+import json
+import os
+import sys
+import time
+
+TEMPLATES = ['admin/change_list.html', 'admin/change_form.html', 'rest_framework/api.html']
+
+
+def warm():
+    """Load everything the first request would, seconds per step"""
+    from django.db import connections
+    from django.template import TemplateDoesNotExist
+    from django.template.loader import get_template
+    from django.urls import get_resolver
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework_simplejwt.tokens import AccessToken, UntypedToken
+
+    from api import serializers
+
+    timings = {}
+
+    def step(name, func):
+        started = time.perf_counter()
+        func()
+        timings[name] = round(time.perf_counter() - started, 4)
+
+    def urls():
+        def compile_patterns(patterns):
+            for pattern in patterns:
+                # Route regexes compile lazily on first match
+                pattern.pattern.regex
+                compile_patterns(getattr(pattern, 'url_patterns', []))
+
+        resolver = get_resolver()
+        resolver.reverse_dict
+        compile_patterns(resolver.url_patterns)
+
+    def serializer_fields():
+        for _, serializer_class in inspect.getmembers(serializers, inspect.isclass):
+            if (issubclass(serializer_class, serializers.serializers.Serializer)
+                    and serializer_class.__module__ == serializers.__name__):
+                serializer_class().fields
+        JSONRenderer().render({'warm': True})
+
+    def tokens():
+        UntypedToken(str(AccessToken()))
+
+    def templates():
+        for name in TEMPLATES:
+            try:
+                get_template(name)
+            except TemplateDoesNotExist:
+                pass
+
+    def databases():
+        for alias in used_databases():
+            connections[alias].ensure_connection()
+            connections[alias].introspection.django_table_names(only_existing=True)
+
+    step('urls', urls)
+    step('serializers', serializer_fields)
+    step('tokens', tokens)
+    step('templates', templates)
+    step('databases', databases)
+    return timings
+
+
+def used_databases():
+    """Aliases the app talks to, not every entry of DATABASES"""
+    from django.conf import settings
+
+    return dict.fromkeys([
+        'default', settings.ARCHIVE_DATABASE, *settings.DATABASE_REPLICAS,
+        *settings.DATABASE_SHARDS,
+    ])
+
+
+def prepare_fork():
+    from django.db import connections
+
+    connections.close_all()
+    gc.collect()
+    # Objects alive now move to a generation the collector never scans
+    gc.freeze()
+
+
+def after_fork():
+    from django.db import connections
+
+    for alias in used_databases():
+        connections[alias].ensure_connection()
+
+
+def memory_kb(pid):
+    """Pss and private memory of a process (Linux smaps_rollup), None elsewhere"""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as rollup:
+            values = dict(line.split(':', 1) for line in rollup if ':' in line)
+    except OSError:
+        return None
+    kb = {key: int(value.split()[0]) for key, value in values.items()
+          if value.strip().endswith('kB')}
+    return {
+        'pss_kb': kb.get('Pss', 0),
+        'private_kb': kb.get('Private_Clean', 0) + kb.get('Private_Dirty', 0),
+        'rss_kb': kb.get('Rss', 0),
+    }
+
+
+def first_request(application, path, token):
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '5000',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost',
+        'HTTP_AUTHORIZATION': f'Bearer {token}',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0),
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    status = []
+    body = application(environ, lambda s, headers, exc_info=None: status.append(s))
+    b''.join(body)
+    if hasattr(body, 'close'):
+        body.close()
+    return status[0]
+
+
+def probe_cold(path, token):
+    """One worker importing the app itself, as without preload"""
+    started = time.perf_counter()
+    from backend.wsgi import application
+    imported = time.perf_counter()
+    status = first_request(application, path, token)
+    done = time.perf_counter()
+    report({
+        'status': status,
+        'import_ms': round((imported - started) * 1000, 1),
+        'first_request_ms': round((done - started) * 1000, 1),
+    })
+    # Stay alive until the benchmark has read our memory
+    sys.stdin.read()
+
+
+def probe_preload(path, token, workers, warmed):
+    """Master loading (and warming) the app once, then forking workers"""
+    started = time.perf_counter()
+    from backend.wsgi import application
+    timings = warm() if warmed else {}
+    prepare_fork()
+    loaded = time.perf_counter()
+
+    children = []
+    for _ in range(workers):
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            forked = time.perf_counter()
+            after_fork()
+            status = first_request(application, path, token)
+            os.write(write_end, json.dumps({
+                'status': status,
+                'first_request_ms': round((time.perf_counter() - forked) * 1000, 1),
+            }).encode())
+            os.close(write_end)
+            # Hold the memory until the master has measured it
+            time.sleep(3600)
+            os._exit(0)
+        os.close(write_end)
+        children.append((pid, read_end))
+
+    results = []
+    for pid, read_end in children:
+        with os.fdopen(read_end) as pipe:
+            result = json.loads(pipe.read())
+        result.update(memory_kb(pid) or {})
+        results.append(result)
+    master_memory = memory_kb(os.getpid())
+    for pid, _ in children:
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+
+    report({
+        'load_ms': round((loaded - started) * 1000, 1),
+        'warm_steps': timings,
+        'master': master_memory,
+        'workers': results,
+    })
+
+
+def report(data):
+    sys.stdout.write(json.dumps(data) + '\n')
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    mode, path, token = sys.argv[1:4]
+    if mode == 'cold':
+        probe_cold(path, token)
+    else:
+        probe_preload(path, token, int(sys.argv[4]), mode == 'preload')
@@ -0,0 +1,133 @@
+"""
+Hotel stays of a voucher: consistency and room capacity.
+
+stay_errors() checks the stays sent with a voucher: nights match the dates
+and the stays chain check-out to check-in without gaps or overlaps. Rows
+with the same dates are rooms of one stay (e.g. a quad and a double).
+
+Capacity is kept per hotel per night in HotelNight, built from the
+HotelAllotment blocks. Every voucher write calls book() with the stays
+before and after, which reads the affected nights in one range query,
+checks them and applies the difference in one UPDATE. Hotels and nights
+without an allotment are not limited. Rejected vouchers hold no rooms.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from rest_framework.exceptions import ValidationError
+
+from .models import Hotel, HotelAllotment, HotelNight
+from .sharding import each_shard
+
+REJECTED = 'rejected'
+
+
+def stay_errors(hotels):
+    """Problems with the stays of one voucher. Fills in nights when left at 0."""
+    errors = []
+    ranges = set()
+    for hotel in hotels:
+        nights = (hotel['checkout_date'] - hotel['checking_date']).days
+        if nights <= 0:
+            errors.append(f"{hotel['hotel_name']}: checkout must be after check-in")
+            continue
+        if not hotel.get('nights'):
+            hotel['nights'] = nights
+        elif hotel['nights'] != nights:
+            errors.append(
+                f"{hotel['hotel_name']}: {hotel['nights']} nights but "
+                f"{hotel['checking_date']} to {hotel['checkout_date']} is {nights}")
+        ranges.add((hotel['checking_date'], hotel['checkout_date']))
+
+    ranges = sorted(ranges)
+    for (_, previous_out), (check_in, _) in zip(ranges, ranges[1:]):
+        if check_in < previous_out:
+            errors.append(f'Stays overlap: check-in {check_in} before checkout {previous_out}')
+        elif check_in > previous_out:
+            errors.append(f'Gap between stays: checkout {previous_out}, next check-in {check_in}')
+    return errors
+
+
+def voucher_stays(voucher):
+    return list(voucher.hotels.values_list('hotel_name', 'checking_date', 'checkout_date'))
+
+
+def counted(status, stays):
+    return [] if status == REJECTED else stays
+
+
+def night_demand(stays):
+    """Rooms per (hotel_name, night) for (hotel_name, check-in, checkout) stays"""
+    demand = Counter()
+    for hotel_name, check_in, checkout in stays:
+        for offset in range((checkout - check_in).days):
+            demand[(hotel_name, check_in + timedelta(days=offset))] += 1
+    return demand
+
+
+def book(stays, previous=()):
+    """
+    Move the rooms a voucher holds from `previous` stays to `stays`.
+    ValidationError if a night would go over its allotment. Must run inside
+    the voucher write's transaction, the nights stay locked until it ends.
+    """
+    delta = night_demand(stays)
+    delta.subtract(night_demand(previous))
+    delta = {key: rooms for key, rooms in delta.items() if rooms}
+    if not delta:
+        return
+
+    nights = [night for _, night in delta]
+    rows = [
+        row for row in HotelNight.objects.select_for_update().filter(
+            hotel_name__in={hotel_name for hotel_name, _ in delta},
+            night__gte=min(nights), night__lte=max(nights))
+        if (row.hotel_name, row.night) in delta
+    ]
+    if not rows:
+        return
+
+    full = {}
+    for row in rows:
+        if row.booked + delta[(row.hotel_name, row.night)] > row.allotted:
+            full.setdefault(row.hotel_name, []).append(row.night)
+    if full:
+        raise ValidationError({'hotels': [
+            f"{hotel_name} has no rooms left on {', '.join(str(night) for night in sorted(dates))}"
+            for hotel_name, dates in full.items()
+        ]})
+
+    HotelNight.objects.filter(pk__in=[row.pk for row in rows]).update(booked=F('booked') + Case(
+        *[When(pk=row.pk, then=Value(delta[(row.hotel_name, row.night)])) for row in rows],
+        default=Value(0),
+    ))
+
+
+def rebuild_nights(hotel_name):
+    """Recreate a hotel's HotelNight rows from its allotments and live bookings"""
+    allotted = Counter()
+    for start, end, rooms in HotelAllotment.objects.filter(
+            hotel_name=hotel_name).values_list('start_date', 'end_date', 'rooms'):
+        for offset in range((end - start).days):
+            allotted[start + timedelta(days=offset)] += rooms
+
+    booked = Counter()
+    if allotted:
+        stays = Hotel.objects.filter(
+            hotel_name=hotel_name,
+            checking_date__lte=max(allotted), checkout_date__gt=min(allotted),
+        ).exclude(voucher__status=REJECTED).values_list(
+            'hotel_name', 'checking_date', 'checkout_date')
+        # Capacity is shared by all agents, whatever shard they are on
+        stays = [stay for shard_stays in each_shard(stays) for stay in shard_stays]
+        booked = Counter({night: rooms for (_, night), rooms in night_demand(stays).items()})
+
+    with transaction.atomic():
+        HotelNight.objects.filter(hotel_name=hotel_name).delete()
+        HotelNight.objects.bulk_create([
+            HotelNight(hotel_name=hotel_name, night=night, allotted=rooms, booked=booked[night])
+            for night, rooms in sorted(allotted.items())
+        ])
+    return len(allotted)
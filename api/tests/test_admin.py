@@ -0,0 +1,77 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from api.models import Voucher
+from api.pagination import EstimatedCountPaginator
+
+from .utils import make_mautamers, make_voucher
+
+SMALL = 2
+LARGE = 12
+
+
+class AdminScaleTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.agent = User.objects.create(username='agent')
+        self.client.force_login(self.admin)
+
+    def assertConstantQueries(self, url, grow):
+        grow(SMALL)
+        # First request fills the content type cache
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        grow(LARGE)
+        with self.assertNumQueries(len(small)):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_changelists(self):
+        def grow(size):
+            for _ in range(size - Voucher.objects.count()):
+                make_voucher(User.objects.create(username=f'agent{Voucher.objects.count()}'),
+                             children=2)
+
+        for model in ('voucher', 'mautamer', 'vouchermautamer', 'hotel', 'flightinformation'):
+            with self.subTest(model=model):
+                self.assertConstantQueries(reverse(f'admin:api_{model}_changelist'), grow)
+
+    def test_voucher_change_form(self):
+        voucher = make_voucher(self.agent)
+        url = reverse('admin:api_voucher_change', args=[voucher.id])
+        self.assertConstantQueries(url, lambda size: [
+            voucher.voucher_mautamers.create(mautamer=mautamer)
+            for mautamer in make_mautamers(self.agent, size - voucher.voucher_mautamers.count(),
+                                           prefix='G')
+        ])
+
+    def test_autocomplete_scoped_to_agent(self):
+        voucher = make_voucher(self.agent)
+        own = make_mautamers(self.agent, 2, prefix='P')
+        make_mautamers(User.objects.create(username='other'), 2, prefix='P')
+
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'api', 'model_name': 'vouchermautamer', 'field_name': 'mautamer',
+            'term': 'P', 'agent': voucher.user_id,
+        })
+        ids = {int(result['id']) for result in response.json()['results']}
+        self.assertTrue({mautamer.id for mautamer in own} <= ids)
+        self.assertEqual(ids, set(self.agent.mautamers.values_list('id', flat=True)))
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=3)
+    def test_estimated_and_capped_counts(self):
+        for _ in range(5):
+            make_voucher(self.agent)
+        ids = list(Voucher.objects.order_by('id').values_list('id', flat=True))
+        Voucher.objects.filter(id=ids[2]).delete()
+        # Rowid span: an upper bound after deletes
+        self.assertEqual(EstimatedCountPaginator(Voucher.objects.all(), 100).count,
+                         ids[-1] - ids[0] + 1)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(EstimatedCountPaginator(Voucher.objects.all(), 100).count, 4)
+        self.assertEqual(
+            EstimatedCountPaginator(Voucher.objects.filter(user=self.agent), 100).count, 3)
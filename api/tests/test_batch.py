@@ -0,0 +1,112 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.journal import get_journal
+
+from .utils import make_mautamers, make_voucher
+
+
+@override_settings(VOUCHER_JOURNAL_BACKGROUND=False)
+class BatchTests(APITestCase):
+    def setUp(self):
+        self.agent = User.objects.create(username='agent')
+        self.voucher = make_voucher(self.agent, children=2)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.agent)}')
+
+    def batch(self, *requests):
+        return self.client.post(reverse('batch'), {'requests': list(requests)}, format='json')
+
+    def test_editor_opening_in_one_call(self):
+        voucher_path = reverse('voucher-detail', args=[self.voucher.id])
+        response = self.batch(
+            {'id': 'voucher', 'path': voucher_path},
+            {'id': 'mautamers', 'method': 'GET', 'path': reverse('agent-mautamer-list')},
+            {'id': 'sidebar', 'path': reverse('voucher-list-create') + '?fields=id,vNo'},
+        )
+        self.assertEqual(response.status_code, 200)
+        voucher, mautamers, sidebar = response.json()['responses']
+
+        self.assertEqual((voucher['id'], voucher['status']), ('voucher', 200))
+        self.assertEqual(voucher['body'], self.client.get(voucher_path).json())
+        self.assertEqual(mautamers['status'], 200)
+        self.assertEqual(mautamers['headers']['Content-Type'], 'application/json')
+        self.assertEqual(sidebar['body'], [{'id': self.voucher.id, 'vNo': self.voucher.vNo}])
+
+    def test_authenticated_once(self):
+        path = reverse('voucher-detail', args=[self.voucher.id])
+        counts = []
+        for size in (1, 5):
+            with CaptureQueriesContext(connection) as queries:
+                self.batch(*[{'path': path}] * size)
+            counts.append(len(queries))
+        with CaptureQueriesContext(connection) as direct:
+            self.client.get(path)
+        # Four more detail reads, without the user lookup of each
+        self.assertEqual(counts[1] - counts[0], 4 * (len(direct) - 1))
+
+    def test_errors_per_item(self):
+        response = self.batch(
+            {'id': 'missing', 'path': '/nowhere/'},
+            {'id': 'bad', 'method': 'POST', 'path': reverse('voucher-list-create'), 'body': {}},
+            {'id': 'admin', 'path': reverse('admin-voucher-list')},
+            {'id': 'nested', 'method': 'POST', 'path': reverse('batch'), 'body': {'requests': []}},
+            {'id': 'stream', 'path': reverse('agent-export')},
+            {'id': 'ok', 'path': reverse('voucher-detail', args=[self.voucher.id])},
+        )
+        self.assertEqual(response.status_code, 200)
+        statuses = {item['id']: item['status'] for item in response.json()['responses']}
+        self.assertEqual(statuses, {
+            'missing': 404, 'bad': 400, 'admin': 403, 'nested': 404, 'stream': 400, 'ok': 200})
+
+    def test_writes_in_order(self):
+        path = reverse('voucher-detail', args=[self.voucher.id])
+        response = self.batch(
+            {'method': 'PATCH', 'path': path, 'body': {'groupName': 'Renamed'}},
+            {'path': path + '?fields=groupName'},
+            {'method': 'DELETE', 'path': path},
+            {'path': path},
+            {'method': 'GET', 'path': reverse('voucher-list-create')},
+        )
+        responses = response.json()['responses']
+        self.assertEqual([item['status'] for item in responses], [200, 200, 204, 404, 200])
+        self.assertEqual(responses[1]['body'], {'id': self.voucher.id, 'groupName': 'Renamed'})
+        self.assertIsNone(responses[2]['body'])
+        self.assertEqual(responses[4]['body'], [])
+
+    def test_limits(self):
+        self.assertEqual(self.batch().status_code, 400)
+        with override_settings(BATCH_MAX_REQUESTS=2):
+            self.assertEqual(self.batch(*[{'path': '/vouchers/'}] * 3).status_code, 400)
+        self.assertEqual(self.batch({'path': 'vouchers/'}).status_code, 400)
+        self.assertEqual(self.batch({'method': 'HEAD', 'path': '/vouchers/'}).status_code, 400)
+
+        self.client.credentials()
+        self.assertEqual(self.batch({'path': '/vouchers/'}).status_code, 401)
+
+
+@override_settings(BATCH_MAX_WORKERS=3, VOUCHER_JOURNAL_BACKGROUND=False)
+class ConcurrentBatchTests(APITransactionTestCase):
+    def test_reads_on_workers(self):
+        # The PATCH commits here, journal it before the tables go
+        self.addCleanup(get_journal().flush)
+        agent = User.objects.create(username='agent')
+        vouchers = [make_voucher(agent) for _ in range(3)]
+        make_mautamers(agent, 2)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(agent)}')
+
+        paths = [reverse('voucher-detail', args=[v.id]) for v in vouchers]
+        response = self.client.post(reverse('batch'), {'requests': [
+            *[{'path': path} for path in paths],
+            {'method': 'PATCH', 'path': paths[0], 'body': {'groupName': 'After'}},
+            {'path': paths[0] + '?fields=groupName'},
+            {'path': reverse('agent-mautamer-list')},
+        ]}, format='json')
+        responses = response.json()['responses']
+        self.assertEqual([item['status'] for item in responses], [200] * 6)
+        self.assertEqual([item['body']['vNo'] for item in responses[:3]], [v.vNo for v in vouchers])
+        self.assertEqual(responses[4]['body']['groupName'], 'After')
@@ -0,0 +1,80 @@
+from urllib.parse import urlsplit
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import resolve
+
+from api.benchmarks import build_cases, compare, run_case, seed
+from api.journal import get_journal
+from api.throttling import get_buckets
+from backend.urls import urlpatterns
+
+
+def report(**endpoints):
+    return {'results': {'100': {
+        name: {'queries': queries, 'p99_ms': p99_ms}
+        for name, (queries, p99_ms) in endpoints.items()
+    }}}
+
+
+class CompareTests(SimpleTestCase):
+    baseline = report(list=(3, 20.0), detail=(5, 2.0))
+
+    def check(self, current, max_slowdown=1.5, min_delta_ms=5):
+        return compare(self.baseline, current, max_slowdown, min_delta_ms)
+
+    def test_unchanged_or_faster_passes(self):
+        self.assertEqual(self.check(self.baseline), [])
+        self.assertEqual(self.check(report(list=(2, 10.0), detail=(5, 1.0))), [])
+
+    def test_slowdown_needs_both_ratio_and_delta(self):
+        # 1.4x and 8 ms slower: under max_slowdown
+        self.assertEqual(self.check(report(list=(3, 28.0))), [])
+        # 4x and 6 ms slower
+        self.assertEqual(self.check(report(detail=(5, 8.0))), ['100/detail: p99 2.0ms -> 8.0ms'])
+        # 2.5x but only 3 ms slower: under min_delta_ms
+        self.assertEqual(self.check(report(detail=(5, 5.0))), [])
+        # 1.75x and 15 ms slower: both exceeded
+        self.assertEqual(self.check(report(list=(3, 35.0))), ['100/list: p99 20.0ms -> 35.0ms'])
+
+    def test_limits_are_strict(self):
+        self.assertEqual(self.check(report(list=(3, 30.0)), min_delta_ms=10), [])
+        self.assertEqual(self.check(report(list=(3, 30.0)), max_slowdown=1.4, min_delta_ms=9),
+                         ['100/list: p99 20.0ms -> 30.0ms'])
+
+    def test_any_extra_query_fails(self):
+        self.assertEqual(self.check(report(list=(4, 20.0), detail=(6, 40.0))), [
+            '100/list: queries 3 -> 4',
+            '100/detail: queries 5 -> 6',
+            '100/detail: p99 2.0ms -> 40.0ms',
+        ])
+
+    def test_new_endpoints_and_scales_skipped(self):
+        current = report(export=(50, 900.0))
+        current['results']['1000'] = {'list': {'queries': 9, 'p99_ms': 500.0}}
+        self.assertEqual(self.check(current), [])
+
+
+@override_settings(VOUCHER_JOURNAL_BACKGROUND=False,
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BenchmarkCaseTests(TestCase):
+    def setUp(self):
+        get_buckets().clear()
+        self.addCleanup(get_buckets().clear)
+        self.addCleanup(get_journal().flush)
+        # The sample voucher's journal entry is written on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cases = build_cases(*seed(10))
+
+    def test_every_route_has_a_case(self):
+        routes = {pattern.name for pattern in urlpatterns if getattr(pattern, 'name', None)}
+        covered = {resolve(urlsplit(case.prepare()[0]).path).url_name for case in self.cases}
+        self.assertEqual(routes - covered, set())
+        self.assertEqual(len({case.name for case in self.cases}), len(self.cases))
+
+    def test_cases_run_without_errors(self):
+        for case in self.cases:
+            with self.subTest(case=case.name):
+                result = run_case(case, iterations=2, max_seconds=5)
+                self.assertEqual(result['errors'], 0)
+                self.assertEqual(result['requests'], 2)
+                self.assertGreater(result['queries'], 0)
@@ -0,0 +1,125 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.archive import archive_batch
+from api.models import Voucher, VoucherTemplate
+from api.cloning import shift_dates, voucher_document
+
+from .utils import make_mautamers, make_voucher
+
+
+@override_settings(VOUCHER_JOURNAL_BACKGROUND=False)
+class VoucherCloneTests(APITestCase):
+    def setUp(self):
+        self.agent = User.objects.create(username='agent')
+        self.voucher = make_voucher(self.agent, children=2)
+        self.login(self.agent)
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    def clone(self, pk=None, **data):
+        return self.client.post(
+            reverse('voucher-clone', args=[pk or self.voucher.id]), data, format='json')
+
+    def test_clone_shifted_with_new_passengers(self):
+        passengers = [m.id for m in make_mautamers(self.agent, 2, prefix='N')]
+        response = self.clone(days=30, groupName='April group', mautamer_ids=passengers)
+        self.assertEqual(response.status_code, 201, response.content)
+
+        copy = response.json()
+        self.assertNotEqual(copy['vNo'], self.voucher.vNo)
+        self.assertEqual(copy['status'], 'pending')
+        self.assertEqual(copy['groupName'], 'April group')
+        self.assertEqual(copy['flight_info']['departure_date'], '2026-03-31')
+        self.assertEqual(copy['flight_info']['return_date'], '2026-04-14')
+        self.assertEqual(copy['flight_info']['depart_time'], '09:00:00')
+        self.assertEqual([h['checking_date'] for h in copy['hotels']], ['2026-03-31'] * 2)
+        self.assertEqual([t['date'] for t in copy['transportations']], ['2026-03-31', '2026-04-01'])
+        self.assertEqual(sorted(m['mautamer_id'] for m in copy['mautamers']), passengers)
+
+        voucher = Voucher.objects.get(pk=copy['id'])
+        self.assertEqual((voucher.departure_date, voucher.pax_count), (date(2026, 3, 31), 2))
+        # The source is untouched
+        self.assertEqual(self.voucher.hotels.count(), 2)
+
+    def test_departure_date_and_checks(self):
+        response = self.clone(departure_date='2026-05-01')
+        self.assertEqual(response.json()['flight_info']['return_date'], '2026-05-15')
+
+        # Same passengers on the same dates overlap
+        passengers = list(self.voucher.voucher_mautamers.values_list('mautamer_id', flat=True))
+        response = self.clone(mautamer_ids=passengers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('mautamer_ids', response.json())
+        self.assertEqual(self.clone(days=1, departure_date='2026-05-01').status_code, 400)
+
+    def test_queries_do_not_grow_with_rows(self):
+        small = make_voucher(self.agent, children=1)
+        large = make_voucher(self.agent, children=10)
+        counts = []
+        for source in (small, large):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.clone(source.id, days=7).status_code, 201)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_other_agents_and_archived(self):
+        other = User.objects.create(username='other')
+        self.login(other)
+        self.assertEqual(self.clone().status_code, 404)
+
+        self.login(self.agent)
+        archive_batch([self.voucher.id])
+        response = self.clone(days=365)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['flight_info']['departure_date'], '2027-03-01')
+
+    def test_templates(self):
+        response = self.client.post(reverse('voucher-template-list'),
+                                    {'name': 'Umrah 14 nights', 'voucher_id': self.voucher.id})
+        self.assertEqual(response.status_code, 201, response.content)
+        template_id = response.json()['id']
+        self.assertNotIn('mautamers', response.json()['data'])
+        self.assertEqual(self.client.post(reverse('voucher-template-list'), {
+            'name': 'Umrah 14 nights', 'voucher_id': self.voucher.id}).status_code, 400)
+
+        # Later edits or deletion of the voucher don't change the template
+        self.voucher.delete()
+        for departure in ('2026-06-01', '2026-07-01'):
+            response = self.client.post(
+                reverse('voucher-template-apply', args=[template_id]),
+                {'departure_date': departure}, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+            self.assertEqual(response.json()['flight_info']['departure_date'], departure)
+        self.assertEqual(Voucher.objects.filter(user=self.agent).count(), 2)
+
+        response = self.client.patch(
+            reverse('voucher-template-detail', args=[template_id]), {'name': 'Renamed'})
+        self.assertEqual(response.json()['name'], 'Renamed')
+        self.assertEqual(VoucherTemplate.objects.get().data['hotels'][0]['hotel_name'], 'Hotel 0')
+
+        self.login(User.objects.create(username='other'))
+        self.assertEqual(self.client.get(reverse('voucher-template-list')).json(), [])
+        response = self.client.post(reverse('voucher-template-apply', args=[template_id]), {})
+        self.assertEqual(response.status_code, 404)
+
+    def test_shift_dates(self):
+        document = voucher_document({
+            'agentName': 'A', 'groupName': None,
+            'flight_info': {'id': 1, 'departure_date': '2026-12-30', 'depart_time': '09:00:00'},
+            'hotels': [{'id': 2, 'checking_date': '2026-12-31', 'checkout_date': '2027-01-02'}],
+            'transportations': [],
+        })
+        shifted = shift_dates(document, 3)
+        self.assertEqual(shifted['flight_info'], {
+            'departure_date': '2027-01-02', 'depart_time': '09:00:00'})
+        self.assertEqual(shifted['hotels'][0]['checkout_date'], '2027-01-05')
+        self.assertEqual(document['hotels'][0]['checking_date'], '2026-12-31')
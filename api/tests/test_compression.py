@@ -0,0 +1,78 @@
+import gzip
+import json
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.compression import BodyCache, choose_encoding, get_body_cache
+
+from .utils import make_mautamers, make_voucher
+
+
+class CompressedListTests(APITestCase):
+    def setUp(self):
+        get_body_cache().clear()
+        self.agent = User.objects.create(username='agent')
+        admin = User.objects.create(username='admin', is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(admin)}')
+        self.voucher = make_voucher(self.agent)
+
+    def get(self, **headers):
+        return self.client.get(reverse('admin-voucher-list'), HTTP_ACCEPT_ENCODING='gzip', **headers)
+
+    def test_hit_serves_stored_bytes(self):
+        first = self.get()
+        self.assertEqual(first['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', first['Vary'])
+        rows = json.loads(gzip.decompress(first.content))
+        self.assertEqual(rows[0]['vNo'], self.voucher.vNo)
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.get()
+        self.assertEqual(second.content, first.content)
+        # Token user and fingerprint, no list query
+        self.assertEqual(len(queries), 2)
+
+    def test_etag_and_invalidation(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.patch(reverse('voucher-status-update', args=[self.voucher.id]),
+                          {'status': 'approved'}, format='json')
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(gzip.decompress(response.content))[0]['status'], 'approved')
+
+    def test_identity_and_per_agent_scope(self):
+        make_mautamers(self.agent, 2)
+        other = User.objects.create(username='other')
+        make_mautamers(other, 1)
+        for user, count in ((self.agent, 3), (other, 1)):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+            response = self.client.get(reverse('agent-mautamer-list'))
+            self.assertNotIn('Content-Encoding', response)
+            self.assertEqual(len(response.json()), count)
+
+
+class BodyCacheTests(SimpleTestCase):
+    def test_evicts_least_recently_used_by_size(self):
+        cache = BodyCache(max_bytes=10)
+        cache.set('a', b'xxxx')
+        cache.set('b', b'xxxx')
+        cache.get('a')
+        cache.set('c', b'xxxx')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), b'xxxx')
+        self.assertEqual(cache.size, 8)
+        cache.set('huge', b'x' * 11)
+        self.assertIsNone(cache.get('huge'))
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(choose_encoding('gzip;q=0, identity'), 'identity')
+        self.assertEqual(choose_encoding(''), 'identity')
@@ -0,0 +1,119 @@
+from datetime import date
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.conflicts import find_conflicts, overlapping_trips
+from api.journal import get_journal
+from api.models import Voucher, VoucherMautamer
+
+from .utils import make_mautamers, make_voucher, voucher_payload
+
+
+def trip(mautamer_id, voucher_id, departure, returning):
+    return {'mautamer_id': mautamer_id, 'voucher_id': voucher_id,
+            'departure_date': departure, 'return_date': returning}
+
+
+class MautamerConflictTests(APITestCase):
+    def setUp(self):
+        self.agent = User.objects.create(username='agent')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.agent)}')
+        # Booked 2026-03-01 to 2026-03-15
+        self.booked = make_voucher(self.agent)
+        self.pax = self.booked.voucher_mautamers.get().mautamer
+
+    def create(self, mautamer_ids, departure='2026-03-10', returning='2026-03-20'):
+        payload = voucher_payload(None, mautamer_ids, 0)
+        del payload['vNo']
+        payload['flight_info'].update(departure_date=departure, return_date=returning)
+        return self.client.post(reverse('voucher-list-create'), payload, format='json')
+
+    def test_rejects_overlapping_trip(self):
+        free = make_mautamers(self.agent, 1)[0]
+        response = self.create([self.pax.id, free.id])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data['mautamer_ids']), 1)
+        self.assertIn(self.booked.vNo, response.data['mautamer_ids'][0])
+
+        self.assertEqual(self.create([free.id]).status_code, 201)
+
+    def test_back_to_back_trips_allowed(self):
+        response = self.create([self.pax.id], departure='2026-03-15', returning='2026-03-29')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(VoucherMautamer.objects.filter(mautamer=self.pax).count(), 2)
+
+    def test_moving_flight_into_overlap_rejected(self):
+        later = self.create([self.pax.id], departure='2026-04-01', returning='2026-04-10')
+        self.assertEqual(later.status_code, 201)
+
+        response = self.client.patch(
+            reverse('voucher-detail', args=[later.data['id']]),
+            {'flight_info': {'departure_date': '2026-03-05'}}, format='json')
+        self.assertEqual(response.status_code, 400)
+        # Saving its own unchanged window is not a conflict with itself
+        response = self.client.patch(
+            reverse('voucher-detail', args=[later.data['id']]),
+            {'mautamer_ids': [self.pax.id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_audit_endpoint(self):
+        other = make_voucher(self.agent, departure=date(2026, 3, 10))
+        VoucherMautamer.objects.create(voucher=other, mautamer=self.pax)
+        other.refresh_summary()
+        admin = User.objects.create(username='admin', is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(admin)}')
+
+        response = self.client.get(reverse('admin-mautamer-conflicts'))
+        self.assertEqual(response.data['count'], 1)
+        conflict = response.data['conflicts'][0]
+        self.assertEqual(conflict['mautamer']['id'], self.pax.id)
+        self.assertEqual([v['vNo'] for v in conflict['vouchers']], [self.booked.vNo, other.vNo])
+
+        response = self.client.get(
+            reverse('admin-mautamer-conflicts'), {'returning_after': '2026-03-20'})
+        self.assertEqual(response.data['count'], 0)
+
+    def test_find_conflicts_pairs(self):
+        d = lambda day: date(2026, 1, day)
+        trips = [
+            trip(1, 'a', d(1), d(10)),
+            trip(1, 'b', d(2), d(3)),
+            trip(1, 'c', d(4), d(5)),
+            trip(1, 'd', d(10), d(12)),
+            trip(2, 'e', d(1), d(20)),
+        ]
+        trips.sort(key=lambda t: (t['mautamer_id'], t['return_date']))
+        pairs = {(a['voucher_id'], b['voucher_id']) for a, b in find_conflicts(trips)}
+        self.assertEqual(pairs, {('b', 'a'), ('c', 'a')})
+
+
+@override_settings(VOUCHER_JOURNAL_BACKGROUND=False)
+class ConflictCheckTransactionTests(APITransactionTestCase):
+    def test_checked_inside_the_write(self):
+        self.addCleanup(get_journal().flush)
+        agent = User.objects.create(username='agent')
+        pax = make_mautamers(agent, 1)[0]
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(agent)}')
+        seen = []
+
+        def check(*args, **kwargs):
+            # The voucher row is already written when the trips are read, so
+            # a concurrent write with the same passengers waits for this one
+            seen.append((connection.in_atomic_block, Voucher.objects.count()))
+            return overlapping_trips(*args, **kwargs)
+
+        payload = voucher_payload(None, [pax.id], 0)
+        del payload['vNo']
+        with mock.patch('api.serializers.overlapping_trips', check):
+            first = self.client.post(reverse('voucher-list-create'), payload, format='json')
+            second = self.client.post(reverse('voucher-list-create'), payload, format='json')
+        self.assertEqual((first.status_code, second.status_code), (201, 400))
+        self.assertEqual(seen, [(True, 1), (True, 2)])
+        # The rejected voucher was rolled back
+        self.assertEqual(Voucher.objects.count(), 1)
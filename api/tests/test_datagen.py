@@ -0,0 +1,104 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.test import TestCase, override_settings
+
+from api.conflicts import audit_trips, find_conflicts
+from api.datagen import COLUMNS, DataGenerator, MAKKAH_HOTELS
+from api.models import (
+    FlightInformation, Hotel, HotelAllotment, HotelNight, Mautamer, Transportation, Voucher,
+    VoucherMautamer
+)
+from api.stays import stay_errors
+
+
+def generate(seed=1, **options):
+    options = {'vouchers': 40, 'mautamers': 60, 'agents': 4, 'chunk_size': 15, **options}
+    DataGenerator(seed=seed, **options).run()
+
+
+def snapshot():
+    return {
+        model: list(model.objects.order_by('id').values_list(*COLUMNS[model]))
+        for model in COLUMNS
+    }
+
+
+class DataGeneratorTests(TestCase):
+    def test_columns_match_models(self):
+        for model, columns in COLUMNS.items():
+            with self.subTest(model=model.__name__):
+                self.assertEqual(
+                    sorted(columns), sorted(field.name for field in model._meta.concrete_fields))
+
+    def test_row_counts_and_consistency(self):
+        generate()
+
+        self.assertEqual(User.objects.filter(username__startswith='gen1-agent-').count(), 4)
+        self.assertEqual(Voucher.objects.count(), 40)
+        self.assertEqual(FlightInformation.objects.count(), 40)
+        # Mautamers are split by agent weight, rounding down
+        self.assertLessEqual(Mautamer.objects.count(), 60)
+        self.assertGreater(Mautamer.objects.count(), 50)
+        # Summary columns written up front match a refresh
+        before = list(Voucher.objects.order_by('id').values_list(
+            'departure_date', 'return_date', 'nights', 'pax_count'))
+        Voucher.objects.refresh_summaries()
+        self.assertEqual(before, list(Voucher.objects.order_by('id').values_list(
+            'departure_date', 'return_date', 'nights', 'pax_count')))
+        self.assertEqual(VoucherMautamer.objects.count(), sum(row[3] for row in before))
+
+        for voucher in Voucher.objects.prefetch_related('hotels')[:10]:
+            stays = list(voucher.hotels.values('hotel_name', 'checking_date', 'checkout_date',
+                                               'nights'))
+            self.assertEqual(stay_errors(stays), [])
+        # Passengers belong to the voucher's agent
+        self.assertFalse(VoucherMautamer.objects.exclude(
+            mautamer__user=F('voucher__user')).exists())
+        self.assertGreater(Transportation.objects.count(), Hotel.objects.count())
+
+    def test_no_overlapping_trips(self):
+        # Few mautamers for many vouchers, so random passengers would clash
+        generate(vouchers=80, mautamers=12, agents=2, days=60)
+
+        self.assertEqual(list(find_conflicts(audit_trips().iterator())), [])
+        # Mautamers still travel again once back
+        self.assertGreater(VoucherMautamer.objects.count(), Mautamer.objects.count())
+        self.assertEqual(VoucherMautamer.objects.count(), sum(
+            Voucher.objects.values_list('pax_count', flat=True)))
+
+    def test_hotel_nights_rebuilt(self):
+        HotelAllotment.objects.create(
+            hotel_name=MAKKAH_HOTELS[0], start_date=date(2023, 10, 1),
+            end_date=date(2027, 1, 1), rooms=1000)
+        generate()
+
+        nights = list(HotelNight.objects.order_by('night').values_list('night', 'booked'))
+        self.assertEqual(len(nights), (date(2027, 1, 1) - date(2023, 10, 1)).days)
+        self.assertGreater(sum(booked for _, booked in nights), 0)
+
+    def test_same_seed_same_data(self):
+        generate(seed=7)
+        first = snapshot()
+        User.objects.filter(username__startswith='gen7-agent-').delete()
+        self.assertFalse(Voucher.objects.exists())
+
+        generate(seed=7)
+        self.assertEqual(snapshot(), first)
+
+        generate(seed=8)
+        self.assertNotEqual(
+            Voucher.objects.filter(vNo__startswith='gen8-').values_list('status', 'nights')[:20],
+            Voucher.objects.filter(vNo__startswith='gen7-').values_list('status', 'nights')[:20])
+
+    def test_existing_prefix_refused(self):
+        generate()
+        with self.assertRaises(ValueError):
+            generate()
+
+    @override_settings(DATABASE_SHARDS=['default', 'shard2'])
+    def test_refused_when_sharded(self):
+        with self.assertRaises(ValueError):
+            generate()
+        self.assertFalse(User.objects.filter(username__startswith='gen1-agent-').exists())
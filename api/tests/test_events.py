@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.events import STREAM_PATH, Broker, InMemoryBroker, VoucherEventsApp, get_broker
+
+
+def token_for(user_id):
+    return str(AccessToken.for_user(User(id=user_id)))
+
+
+class Stream:
+    """A client of the ASGI app: the messages it was sent and a way to hang up"""
+
+    def __init__(self, app, method='GET', path=STREAM_PATH, headers=(), query_string=b''):
+        self.sent = []
+        self.incoming = asyncio.Queue()
+        scope = {'type': 'http', 'method': method, 'path': path,
+                 'headers': list(headers), 'query_string': query_string}
+        self.task = asyncio.ensure_future(app(scope, self.incoming.get, self.send))
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    @property
+    def status(self):
+        return self.sent[0]['status'] if self.sent else None
+
+    def body(self):
+        return b''.join(message.get('body', b'') for message in self.sent[1:]).decode()
+
+    async def until(self, condition):
+        for _ in range(100):
+            if condition():
+                return
+            await asyncio.sleep(0)
+        raise AssertionError('Timed out')
+
+    async def close(self):
+        await self.incoming.put({'type': 'http.disconnect'})
+        await asyncio.wait_for(self.task, 1)
+
+
+@override_settings(VOUCHER_EVENTS_KEEPALIVE=60)
+class VoucherEventsAppTests(SimpleTestCase):
+    def setUp(self):
+        get_broker.cache_clear()
+        self.addCleanup(get_broker.cache_clear)
+        self.passed_on = []
+
+        async def django_app(scope, receive, send):
+            self.passed_on.append(scope['path'])
+
+        self.app = VoucherEventsApp(django_app)
+
+    async def test_token_in_header_or_query(self):
+        header = Stream(self.app, headers=[(b'authorization', f'Bearer {token_for(5)}'.encode())])
+        query = Stream(self.app, query_string=f'token={token_for(5)}'.encode())
+        for stream in (header, query):
+            await stream.until(lambda: stream.status)
+            self.assertEqual(stream.status, 200)
+            self.assertIn((b'content-type', b'text/event-stream'), stream.sent[0]['headers'])
+            await stream.close()
+
+        rejected = [
+            (Stream(self.app), 401),
+            (Stream(self.app, query_string=b'token=bad'), 401),
+            (Stream(self.app, method='POST', query_string=f'token={token_for(5)}'.encode()), 405),
+        ]
+        for stream, status in rejected:
+            await asyncio.wait_for(stream.task, 1)
+            self.assertEqual(stream.status, status)
+        self.assertEqual(get_broker().connection_count(), 0)
+
+    async def test_events_reach_only_their_user(self):
+        mine = Stream(self.app, query_string=f'token={token_for(5)}'.encode())
+        other = Stream(self.app, query_string=f'token={token_for(6)}'.encode())
+        await mine.until(lambda: get_broker().connection_count() == 2)
+
+        self.assertEqual(get_broker().publish(5, {'type': 'status', 'voucher_id': 1}), 1)
+        await mine.until(lambda: 'event: status' in mine.body())
+        self.assertIn(f'data: {json.dumps({"type": "status", "voucher_id": 1})}\n\n', mine.body())
+        self.assertEqual(other.body(), 'retry: 5000\n\n')
+
+        await mine.close()
+        await other.close()
+        self.assertEqual(get_broker().connection_count(), 0)
+        self.assertEqual(get_broker().publish(5, {'type': 'status'}), 0)
+
+    async def test_other_paths_go_to_django(self):
+        await self.app({'type': 'http', 'method': 'GET', 'path': '/vouchers/'}, None, None)
+        self.assertEqual(self.passed_on, ['/vouchers/'])
+
+
+class InMemoryBrokerTests(SimpleTestCase):
+    async def test_full_queue_drops_new_events(self):
+        broker = InMemoryBroker(queue_size=2)
+        subscription = broker.subscribe(5)
+        for number in range(3):
+            broker.publish('5', {'number': number})
+        await asyncio.sleep(0)
+
+        self.assertEqual(subscription.queue.qsize(), 2)
+        self.assertEqual([(await subscription.get())['number'] for _ in range(2)], [0, 1])
+
+        broker.unsubscribe(subscription)
+        broker.unsubscribe(subscription)
+        self.assertEqual(broker.connection_count(), 0)
+
+    def test_broker_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Broker()
@@ -0,0 +1,127 @@
+import csv
+import io
+import json
+import zipfile
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.archive import archive_batch
+
+from .utils import make_mautamers, make_voucher
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class AgentExportTests(APITestCase):
+    def setUp(self):
+        self.agent = User.objects.create(username='agent')
+        self.vouchers = [make_voucher(self.agent, children=2) for _ in range(4)]
+        make_mautamers(self.agent, 1)
+        other = User.objects.create(username='other')
+        make_voucher(other)
+        self.login(self.agent)
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    def download(self, url=None, **params):
+        response = self.client.get(url or reverse('agent-export'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def records(self, body):
+        return [json.loads(line) for line in body.decode().splitlines()]
+
+    def test_ndjson_has_every_row_of_the_agent(self):
+        response, body = self.download()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('agent-', response['Content-Disposition'])
+
+        records = self.records(body)
+        mautamers = [r['data'] for r in records if r['type'] == 'mautamer']
+        vouchers = [r['data'] for r in records if r['type'] == 'voucher']
+        # Two passengers per voucher plus the unassigned one
+        self.assertEqual(len(mautamers), 9)
+        self.assertEqual([v['vNo'] for v in vouchers], [v.vNo for v in self.vouchers])
+        self.assertEqual(len(vouchers[0]['hotels']), 2)
+        self.assertEqual(len(vouchers[0]['mautamers']), 2)
+        self.assertEqual(vouchers[0]['flight_info']['return_date'], '2026-03-15')
+
+    def test_queries_fixed_per_chunk(self):
+        def count():
+            with CaptureQueriesContext(connection) as queries:
+                self.download()
+            return len(queries)
+
+        before = count()
+        for _ in range(2):
+            make_voucher(self.agent)
+        # One more voucher chunk (4 queries) and one more mautamer chunk (1)
+        self.assertEqual(count(), before + 5)
+
+    def test_archived_vouchers_included(self):
+        archive_batch([self.vouchers[0].id])
+        _, body = self.download()
+        vouchers = [r['data'] for r in self.records(body) if r['type'] == 'voucher']
+        self.assertEqual(len(vouchers), 4)
+        self.assertTrue(vouchers[-1]['archived'])
+        self.assertEqual(vouchers[-1]['vNo'], self.vouchers[0].vNo)
+
+        _, body = self.download(output='csv')
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            vouchers = list(csv.DictReader(io.TextIOWrapper(archive.open('vouchers.csv'))))
+            hotels = list(csv.DictReader(io.TextIOWrapper(archive.open('hotels.csv'))))
+        self.assertEqual([row['archived'] for row in vouchers], ['False'] * 3 + ['True'])
+        self.assertEqual(len(hotels), 8)
+
+    def test_csv_zip_one_file_per_table(self):
+        response, body = self.download(output='csv')
+        self.assertEqual(response['Content-Type'], 'application/zip')
+
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            self.assertEqual(archive.namelist(), [
+                'mautamers.csv', 'vouchers.csv', 'flights.csv', 'voucher_mautamers.csv',
+                'hotels.csv', 'transportations.csv'])
+            tables = {name: list(csv.DictReader(io.TextIOWrapper(archive.open(name))))
+                      for name in archive.namelist()}
+        self.assertEqual(len(tables['mautamers.csv']), 9)
+        self.assertEqual(len(tables['vouchers.csv']), 4)
+        self.assertEqual(len(tables['voucher_mautamers.csv']), 8)
+        flight = tables['flights.csv'][0]
+        self.assertEqual(flight['voucher_id'], str(self.vouchers[0].id))
+        self.assertEqual(flight['departure_date'], date(2026, 3, 1).isoformat())
+
+    def test_admin_exports_any_agent(self):
+        admin = User.objects.create(username='admin', is_staff=True)
+        url = reverse('admin-agent-export', args=[self.agent.id])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.login(admin)
+        _, body = self.download(url)
+        self.assertEqual(sum(r['type'] == 'voucher' for r in self.records(body)), 4)
+        missing = self.client.get(reverse('admin-agent-export', args=[admin.id]))
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_streamed_under_asgi(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.agent)}'}
+        for output in ('ndjson', 'csv'):
+            response = await self.async_client.get(
+                reverse('agent-export'), {'output': output}, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            # Async iterator: ASGI sends chunk by chunk instead of buffering
+            self.assertTrue(response.is_async)
+            parts = [part async for part in response.streaming_content]
+            self.assertGreater(len(parts), 2)
+            if output == 'ndjson':
+                records = self.records(b''.join(parts))
+                self.assertEqual(sum(r['type'] == 'voucher' for r in records), 4)
+
+    def test_unknown_output(self):
+        response = self.client.get(reverse('agent-export'), {'output': 'xml'})
+        self.assertEqual(response.status_code, 400)
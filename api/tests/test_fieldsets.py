@@ -0,0 +1,51 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .utils import make_voucher
+
+
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        self.agent = User.objects.create(username='agent')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.agent)}')
+        self.voucher = make_voucher(self.agent, children=2)
+
+    def get(self, name, args=(), **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name, args=args), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        # First query loads the token's user
+        return response.json(), [q['sql'] for q in queries.captured_queries[1:]]
+
+    def test_detail_header_fields_only(self):
+        data, sql = self.get('voucher-detail', [self.voucher.id], fields='vNo,status')
+        self.assertEqual(data, {'id': self.voucher.id, 'vNo': self.voucher.vNo, 'status': 'pending'})
+        self.assertEqual(len(sql), 1)
+        self.assertNotIn('agentName', sql[0])
+        self.assertNotIn('api_flightinformation', sql[0])
+
+    def test_nested_fields(self):
+        data, sql = self.get('voucher-detail', [self.voucher.id],
+                             fields='vNo,flight_info.return_date,mautamers.pax_name,user')
+        self.assertEqual(data['flight_info'], {'return_date': '2026-03-15'})
+        self.assertEqual(list(data['mautamers'][0]), ['pax_name'])
+        self.assertEqual(data['user'], 'agent')
+        self.assertEqual(len(sql), 2)
+        self.assertNotIn('passport', sql[1])
+
+    def test_list_include(self):
+        data, sql = self.get('voucher-list-create', include='hotels')
+        self.assertEqual(len(data[0]['hotels']), 2)
+        self.assertNotIn('mautamers', data[0])
+        self.assertIn('groupName', data[0])
+        self.assertEqual(len(sql), 2)
+
+    def test_unknown_fields_rejected(self):
+        for params in ({'fields': 'vNo,secret'}, {'fields': 'hotels.secret'},
+                       {'include': 'user'}, {'fields': 'vNo.length'}):
+            response = self.client.get(reverse('voucher-detail', args=[self.voucher.id]), params)
+            self.assertEqual(response.status_code, 400, params)
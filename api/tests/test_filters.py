@@ -0,0 +1,52 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import Voucher
+
+from .utils import make_voucher
+
+
+class VoucherFilterTests(APITestCase):
+    def setUp(self):
+        self.agent = User.objects.create(username='agent')
+        self.other = User.objects.create(username='other')
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.march = make_voucher(self.agent, departure=date(2026, 3, 1))
+        self.april = make_voucher(self.agent, departure=date(2026, 4, 1))
+        self.others = make_voucher(self.other, departure=date(2026, 3, 5))
+        Voucher.objects.filter(pk=self.april.pk).update(status='approved', groupName='G1')
+
+    def get(self, user, name, **params):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return self.client.get(reverse(name), params)
+
+    def vnos(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['vNo'] for row in response.json()]
+
+    def test_admin_pending_departing_in_range(self):
+        response = self.get(self.admin, 'admin-voucher-list', status='pending',
+                            departure_after='2026-03-01', departure_before='2026-03-07',
+                            ordering='departure_date')
+        self.assertEqual(self.vnos(response), [self.march.vNo, self.others.vNo])
+
+    def test_admin_agent_and_group(self):
+        response = self.get(self.admin, 'admin-voucher-list', agent=self.agent.id)
+        self.assertEqual(set(self.vnos(response)), {self.march.vNo, self.april.vNo})
+        response = self.get(self.admin, 'voucher-list-create', group='G1')
+        self.assertEqual(self.vnos(response), [self.april.vNo])
+
+    def test_agent_cannot_widen_scope(self):
+        response = self.get(self.agent, 'voucher-list-create', agent=self.other.id,
+                            ordering='-departure_date')
+        self.assertEqual(self.vnos(response), [self.april.vNo, self.march.vNo])
+
+    def test_rejects_bad_parameters(self):
+        for params in ({'status': 'lost'}, {'ordering': 'agentName'},
+                       {'created_after': '01/03/2026'}):
+            response = self.get(self.admin, 'admin-voucher-list', **params)
+            self.assertEqual(response.status_code, 400, params)
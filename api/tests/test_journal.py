@@ -0,0 +1,84 @@
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.journal import Journal, get_journal
+from api.models import VoucherChange
+
+from .utils import make_mautamers, make_voucher
+
+
+@override_settings(VOUCHER_JOURNAL_BACKGROUND=False)
+class VoucherJournalTests(APITestCase):
+    def setUp(self):
+        get_journal.cache_clear()
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.agent = User.objects.create(username='agent')
+        self.voucher = make_voucher(self.agent)
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    def history(self, voucher_id):
+        return self.client.get(reverse('voucher-history', args=[voucher_id]))
+
+    def test_records_field_level_changes(self):
+        self.login(self.agent)
+        mautamer = make_mautamers(self.agent, 1, prefix='N')[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('voucher-detail', args=[self.voucher.id]), {
+                'groupName': 'Ramadan',
+                'mautamer_ids': [mautamer.id],
+            }, format='json')
+        # Nothing written yet, the entry waits in the buffer
+        self.assertEqual(VoucherChange.objects.count(), 0)
+
+        self.login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('voucher-status-update', args=[self.voucher.id]),
+                              {'status': 'approved'}, format='json')
+
+        response = self.history(self.voucher.id)
+        self.assertEqual(response.status_code, 200)
+        first, second = response.json()['changes']
+        self.assertEqual(first['action'], 'updated')
+        self.assertEqual(first['actor'], 'agent')
+        self.assertEqual(first['changes']['groupName'], [None, 'Ramadan'])
+        self.assertEqual(first['changes']['mautamers']['added'], [mautamer.id])
+        self.assertEqual(len(first['changes']['mautamers']['removed']), 1)
+        self.assertNotIn('hotels', first['changes'])
+        self.assertEqual(second['action'], 'status')
+        self.assertEqual(second['changes'], {'status': ['pending', 'approved']})
+
+    def test_unchanged_update_not_recorded(self):
+        self.login(self.agent)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('voucher-detail', args=[self.voucher.id]),
+                              {'agentName': self.voucher.agentName}, format='json')
+        self.assertEqual(self.history(self.voucher.id).status_code, 404)
+
+    def test_history_survives_delete_and_is_scoped(self):
+        self.login(self.agent)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('voucher-detail', args=[self.voucher.id]))
+
+        response = self.history(self.voucher.id)
+        self.assertEqual(response.json()['vNo'], self.voucher.vNo)
+        self.assertEqual(response.json()['changes'][0]['action'], 'deleted')
+
+        self.login(User.objects.create(username='other'))
+        self.assertEqual(self.history(self.voucher.id).status_code, 404)
+
+    def test_buffer_flushes_in_batches(self):
+        journal = Journal(batch_size=3, flush_interval=60, max_pending=10)
+        for _ in range(4):
+            journal.record(VoucherChange(
+                voucher_id=self.voucher.id, agent=self.agent, vNo=self.voucher.vNo,
+                source=VoucherChange.API, action=VoucherChange.UPDATED,
+                changed_at=self.voucher.updated_at))
+        self.assertEqual(VoucherChange.objects.count(), 3)
+        self.assertEqual(journal.pending(), 1)
+        self.assertEqual(journal.flush(), 1)
+        self.assertEqual(VoucherChange.objects.count(), 4)
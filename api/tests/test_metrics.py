@@ -0,0 +1,129 @@
+import re
+import time
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.metrics import (
+    PROMETHEUS_CONTENT_TYPE, REGISTRY, Histogram, RequestMetrics, current_metrics,
+    serializer_timer
+)
+from api.models import Voucher
+from api.serializers import VoucherDetailSerializer
+
+from .utils import make_voucher
+
+
+class HistogramTests(SimpleTestCase):
+    def test_cumulative_buckets_per_label_set(self):
+        histogram = Histogram('test_seconds', 'Test', (0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(('voucher-detail', 'GET'), value)
+        histogram.observe(('voucher-list-create', 'POST'), 0.2)
+
+        lines = histogram.render().splitlines()
+        self.assertEqual(lines[:2], ['# HELP test_seconds Test', '# TYPE test_seconds histogram'])
+        labels = 'route="voucher-detail",method="GET"'
+        self.assertEqual(lines[2:7], [
+            f'test_seconds_bucket{{{labels},le="0.1"}} 2',
+            f'test_seconds_bucket{{{labels},le="1"}} 3',
+            f'test_seconds_bucket{{{labels},le="+Inf"}} 4',
+            f'test_seconds_sum{{{labels}}} 3.65',
+            f'test_seconds_count{{{labels}}} 4',
+        ])
+        self.assertIn('test_seconds_count{route="voucher-list-create",method="POST"} 1', lines)
+
+
+class SerializerTimeTests(APITestCase):
+    def test_nested_serializers_timed_once(self):
+        voucher = make_voucher(User.objects.create(username='agent'), children=3)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            started = time.perf_counter()
+            data = VoucherDetailSerializer(
+                Voucher.objects.with_details().filter(pk=voucher.pk), many=True).data
+            elapsed = time.perf_counter() - started
+        finally:
+            current_metrics.reset(token)
+        self.assertEqual(len(data[0]['hotels']), 3)
+        # The hotels, flight and passengers inside the voucher's own time
+        self.assertGreater(metrics.serialize_time, 0)
+        self.assertLessEqual(metrics.serialize_time, elapsed)
+        self.assertEqual(metrics.render_time, 0)
+
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            with serializer_timer(), serializer_timer():
+                time.sleep(0.02)
+        finally:
+            current_metrics.reset(token)
+        self.assertTrue(0.02 <= metrics.serialize_time < 0.04, metrics.serialize_time)
+
+
+class PerformanceMiddlewareTests(APITestCase):
+    def setUp(self):
+        for histogram in REGISTRY:
+            histogram.reset()
+        self.addCleanup(lambda: [histogram.reset() for histogram in REGISTRY])
+        self.agent = User.objects.create(username='agent')
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.voucher = make_voucher(self.agent)
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    def test_server_timing(self):
+        self.login(self.agent)
+        response = self.client.get(reverse('voucher-detail', args=[self.voucher.id]))
+        match = re.fullmatch(
+            r'total;dur=([\d.]+), db;dur=([\d.]+);desc="(\d+) queries", '
+            r'serialize;dur=([\d.]+), render;dur=([\d.]+)',
+            response['Server-Timing'])
+        self.assertIsNotNone(match, response['Server-Timing'])
+        total, db, queries, serialize, render = match.groups()
+        self.assertGreater(int(queries), 0)
+        # Each rounded to 0.1 ms; serializing and rendering don't overlap
+        self.assertGreaterEqual(float(total) + 0.2, float(serialize) + float(render))
+        self.assertGreaterEqual(float(total) + 0.2, float(db))
+
+    def test_metrics_admin_only(self):
+        url = reverse('admin-metrics')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.login(self.agent)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.get(reverse('voucher-detail', args=[self.voucher.id]))
+
+        self.login(self.admin)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], PROMETHEUS_CONTENT_TYPE)
+        body = response.content.decode()
+        for name in ('http_request_duration_seconds', 'http_request_db_queries',
+                     'http_request_db_seconds', 'http_request_serialize_seconds',
+                     'http_request_render_seconds',
+                     'http_response_size_bytes'):
+            self.assertIn(f'# TYPE {name} histogram', body)
+        self.assertIn('http_request_duration_seconds_count{route="voucher-detail",method="GET"} 1',
+                      body)
+        # Rejected requests are counted too
+        self.assertIn('http_request_duration_seconds_count{route="admin-metrics",method="GET"} 2',
+                      body)
+
+    def test_slow_query_log_threshold(self):
+        self.login(self.agent)
+        url = reverse('voucher-detail', args=[self.voucher.id])
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=10000), \
+                self.assertNoLogs('api.slow_queries'):
+            self.client.get(url)
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0), \
+                self.assertLogs('api.slow_queries', 'WARNING') as logs:
+            self.client.get(url)
+        # Every query of the request, with its route
+        self.assertGreater(len(logs.output), 1)
+        self.assertTrue(all('route=voucher-detail' in line for line in logs.output))
+        self.assertTrue(any('FROM "api_voucher"' in line for line in logs.output))
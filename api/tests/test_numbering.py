@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import Voucher, VoucherSequence
+from api.numbering import get_allocator
+
+from .utils import make_mautamers, voucher_payload
+
+
+@override_settings(VOUCHER_NUMBER_PREFIX='T', VOUCHER_NUMBER_FORMAT='{prefix}{number:04d}',
+                   VOUCHER_NUMBER_BLOCK_SIZE=3)
+class VoucherNumberTests(APITestCase):
+    def setUp(self):
+        get_allocator.cache_clear()
+        self.addCleanup(get_allocator.cache_clear)
+        self.agent = User.objects.create(username='agent')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.agent)}')
+
+    def create(self, vno=None):
+        mautamer_ids = [m.id for m in make_mautamers(self.agent, 1)]
+        payload = voucher_payload(vno, mautamer_ids, 1)
+        if vno is None:
+            del payload['vNo']
+        response = self.client.post(reverse('voucher-list-create'), payload, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['vNo']
+
+    def test_numbers_come_from_reserved_blocks(self):
+        self.assertEqual([self.create() for _ in range(4)], ['T0001', 'T0002', 'T0003', 'T0004'])
+        # Two blocks of three reserved for four vouchers
+        self.assertEqual(VoucherSequence.objects.get(prefix='T').next_value, 7)
+
+    def test_skips_numbers_already_taken(self):
+        self.create('T0002')
+        self.assertEqual([self.create(), self.create()], ['T0001', 'T0003'])
+
+    def test_retries_when_number_taken_after_reservation(self):
+        self.assertEqual(self.create(), 'T0001')
+        self.create('T0002')
+        self.assertEqual(self.create(), 'T0003')
+        self.assertEqual(Voucher.objects.filter(vNo__startswith='T').count(), 3)
@@ -0,0 +1,90 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import Mautamer, normalize_passport
+from api.passports import duplicate_report
+
+
+class NormalizePassportTests(SimpleTestCase):
+    def test_case_spaces_and_separators(self):
+        for typed in ['AB1234567', 'ab 1234567', ' AB-1234567 ', 'Ab.123 4567', 'ＡＢ１２３４５６７']:
+            self.assertEqual(normalize_passport(typed), 'AB1234567')
+        self.assertEqual(normalize_passport(None), '')
+
+
+class PassportKeyTests(APITestCase):
+    def setUp(self):
+        self.agents = [User.objects.create(username=f'agent{i}') for i in range(3)]
+        admin = User.objects.create(username='admin', is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(admin)}')
+
+    def test_every_write_path_sets_the_key(self):
+        saved = Mautamer.objects.create(user=self.agents[0], pax_name='A', passport='ab 1')
+        bulk = Mautamer.objects.bulk_create([
+            Mautamer(user=self.agents[0], pax_name='B', passport='cd-2')])[0]
+        self.assertEqual(saved.passport_key, 'AB1')
+
+        saved.passport = 'ef 3'
+        saved.save(update_fields=['passport'])
+        Mautamer.objects.filter(pk=bulk.pk).update(passport='gh 4')
+        self.assertEqual(
+            list(Mautamer.objects.order_by('id').values_list('passport_key', flat=True)),
+            ['EF3', 'GH4'])
+
+    def test_upload_skips_differently_typed_duplicates(self):
+        Mautamer.objects.create(user=self.agents[0], pax_name='A', passport='AB1234567')
+        response = self.client.post(
+            reverse('admin-agent-mautamer-upload', args=[self.agents[0].id]),
+            {'mautamers': [{'pax_name': 'A', 'passport': 'ab 1234567'},
+                           {'pax_name': 'B', 'passport': 'cd 7654321'},
+                           {'pax_name': 'B', 'passport': 'CD7654321'}]},
+            format='json')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['skipped'], 2)
+
+    def test_backfill(self):
+        Mautamer.objects.bulk_create([
+            Mautamer(user=self.agents[0], pax_name=f'P{i}', passport=f'x {i}') for i in range(5)])
+        # Rows from before the key existed
+        Mautamer.objects.filter(id__in=Mautamer.objects.values('id')[:3]).update(passport_key='')
+
+        out = StringIO()
+        call_command('backfill_passport_keys', batch_size=2, stdout=out)
+        self.assertIn('Updated 3 passport keys', out.getvalue())
+        self.assertEqual(
+            sorted(Mautamer.objects.values_list('passport_key', flat=True)),
+            [f'X{i}' for i in range(5)])
+
+    def test_duplicate_report(self):
+        for agent, typed in zip(self.agents, ['AB1234567', 'ab 1234567', 'AB-1234567']):
+            Mautamer.objects.create(user=agent, pax_name='Same Pax', passport=typed)
+        # Twice for one agent only, not a cross-agent duplicate
+        for typed in ['CD1', 'cd 1']:
+            Mautamer.objects.create(user=self.agents[0], pax_name='Other', passport=typed)
+        Mautamer.objects.create(user=self.agents[0], pax_name='Two', passport='EF1')
+        Mautamer.objects.create(user=self.agents[1], pax_name='Two', passport='ef1')
+
+        with CaptureQueriesContext(connection) as queries:
+            report = list(duplicate_report())
+        # One grouped query for the keys, one for their rows
+        self.assertEqual(len(queries), 2)
+        self.assertEqual([(d['passport_key'], d['agents']) for d in report],
+                         [('AB1234567', 3), ('EF1', 2)])
+        self.assertEqual([m['agent'] for m in report[0]['mautamers']],
+                         ['agent0', 'agent1', 'agent2'])
+
+        response = self.client.get(reverse('admin-mautamer-duplicates'), {'min_agents': 3})
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['duplicates'][0]['mautamers'][1]['passport'], 'ab 1234567')
+
+        out = StringIO()
+        call_command('report_passport_duplicates', csv=True, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 1 + 3 + 2)
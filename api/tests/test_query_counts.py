@@ -0,0 +1,202 @@
+"""
+Query counts must not grow with data size.
+
+Every view is rendered at a small and a larger size (rows in the table, or
+rows in the nested payload) and the larger run must issue exactly the same
+number of queries as the small one.
+"""
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import Voucher
+
+from .utils import make_mautamers, make_voucher, voucher_payload
+
+SMALL = 2
+LARGE = 12
+
+
+class QueryCountTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(
+            username='admin', is_staff=True)
+        self.agent = User.objects.create(
+            username='agent')
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    def assertConstantQueries(self, request, size_small=SMALL, size_large=LARGE):
+        """
+        `request(size)` prepares data for `size` untimed where needed and
+        returns a callable making the request
+        """
+        call = request(size_small)
+        with CaptureQueriesContext(connection) as small:
+            response = call()
+        self.assertLess(response.status_code, 400, response.content)
+
+        call = request(size_large)
+        with self.assertNumQueries(len(small)):
+            response = call()
+        self.assertLess(response.status_code, 400, response.content)
+        return response
+
+
+class VoucherViewQueryTests(QueryCountTestCase):
+    def grow(self, agent, size):
+        for _ in range(size - Voucher.objects.filter(user=agent).count()):
+            make_voucher(agent)
+
+    def test_voucher_list_agent(self):
+        self.login(self.agent)
+
+        def request(size):
+            self.grow(self.agent, size)
+            return lambda: self.client.get(reverse('voucher-list-create'))
+        response = self.assertConstantQueries(request)
+        self.assertEqual(len(response.data), LARGE)
+
+    def test_voucher_list_admin(self):
+        self.login(self.admin)
+        other = User.objects.create(username='other')
+
+        def request(size):
+            self.grow(self.agent, size)
+            self.grow(other, size)
+            return lambda: self.client.get(reverse('voucher-list-create'))
+        response = self.assertConstantQueries(request)
+        self.assertEqual(len(response.data), 2 * LARGE)
+
+    def test_admin_voucher_list(self):
+        self.login(self.admin)
+
+        def request(size):
+            self.grow(self.agent, size)
+            return lambda: self.client.get(reverse('admin-voucher-list'))
+        response = self.assertConstantQueries(request)
+        self.assertEqual(len(response.json()), LARGE)
+        self.assertEqual(response.json()[0]['mautamers_count'], 1)
+
+    def test_voucher_detail(self):
+        self.login(self.agent)
+
+        def request(size):
+            voucher = make_voucher(self.agent, children=size)
+            return lambda: self.client.get(reverse('voucher-detail', args=[voucher.id]))
+        response = self.assertConstantQueries(request)
+        self.assertEqual(len(response.data['mautamers']), LARGE)
+        self.assertEqual(len(response.data['hotels']), LARGE)
+
+    def test_voucher_create_nested(self):
+        self.login(self.agent)
+
+        def request(size):
+            ids = [m.id for m in make_mautamers(self.agent, size)]
+            payload = voucher_payload(f'C{size}', ids, size)
+            return lambda: self.client.post(
+                reverse('voucher-list-create'), payload, format='json')
+        response = self.assertConstantQueries(request)
+        self.assertEqual(len(response.data['mautamers']), LARGE)
+        self.assertEqual(len(response.data['transportations']), LARGE)
+
+    def test_voucher_update_nested(self):
+        self.login(self.agent)
+
+        def request(size):
+            voucher = make_voucher(self.agent, children=size)
+            ids = [m.id for m in make_mautamers(self.agent, size)]
+            payload = voucher_payload(voucher.vNo, ids, size)
+            return lambda: self.client.put(
+                reverse('voucher-detail', args=[voucher.id]), payload, format='json')
+        response = self.assertConstantQueries(request)
+        self.assertEqual(len(response.data['mautamers']), LARGE)
+        self.assertEqual(len(response.data['hotels']), LARGE)
+
+    def test_voucher_update_ignores_foreign_mautamers(self):
+        self.login(self.agent)
+        other = User.objects.create(username='other')
+        voucher = make_voucher(self.agent)
+        own = make_mautamers(self.agent, 1)[0]
+        foreign = make_mautamers(other, 1, prefix='F')[0]
+
+        response = self.client.patch(
+            reverse('voucher-detail', args=[voucher.id]),
+            {'mautamer_ids': [own.id, foreign.id, own.id]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m['mautamer_id'] for m in response.data['mautamers']], [own.id])
+
+    def test_voucher_delete(self):
+        self.login(self.agent)
+
+        def request(size):
+            voucher = make_voucher(self.agent, children=size)
+            return lambda: self.client.delete(reverse('voucher-detail', args=[voucher.id]))
+        self.assertConstantQueries(request)
+
+    def test_voucher_status_update(self):
+        self.login(self.admin)
+
+        def request(size):
+            voucher = make_voucher(self.agent, children=size)
+            return lambda: self.client.patch(
+                reverse('voucher-status-update', args=[voucher.id]),
+                {'status': 'approved'}, format='json')
+        self.assertConstantQueries(request)
+
+
+class AgentViewQueryTests(QueryCountTestCase):
+    def test_agent_list(self):
+        self.login(self.admin)
+
+        def request(size):
+            for i in range(size - User.objects.filter(is_staff=False).count()):
+                agent = User.objects.create(username=f'agent-{i}-{size}')
+                make_voucher(agent)
+            return lambda: self.client.get(reverse('admin-agent-list'))
+        response = self.assertConstantQueries(request)
+        self.assertEqual(len(response.data), LARGE)
+        self.assertTrue(all(agent['vouchers_count'] == 1 for agent in response.data
+                            if agent['username'] != 'agent'))
+
+    def test_agent_create(self):
+        self.login(self.admin)
+
+        def request(size):
+            payload = {
+                'username': f'new-agent-{size}',
+                'password': 'new-pass-123',
+                'mautamers': [{'pax_name': f'Pax {i}', 'passport': f'N{size}-{i}'}
+                              for i in range(size)],
+            }
+            return lambda: self.client.post(reverse('admin-agent-create'), payload, format='json')
+        response = self.assertConstantQueries(request)
+        self.assertEqual(response.data['mautamers_uploaded'], LARGE)
+
+    def test_agent_mautamer_upload(self):
+        self.login(self.admin)
+
+        def request(size):
+            existing = make_mautamers(self.agent, size)
+            rows = [{'pax_name': m.pax_name, 'passport': m.passport} for m in existing]
+            rows += [{'pax_name': f'New {i}', 'passport': f'U{size}-{i}'} for i in range(size)]
+            rows += [{'pax_name': 'No passport'}]
+            return lambda: self.client.post(
+                reverse('admin-agent-mautamer-upload', args=[self.agent.id]),
+                {'mautamers': rows}, format='json')
+        response = self.assertConstantQueries(request)
+        self.assertEqual(response.data['created'], LARGE)
+        self.assertEqual(response.data['skipped'], LARGE + 1)
+
+    def test_agent_mautamer_list(self):
+        self.login(self.agent)
+
+        def request(size):
+            make_mautamers(self.agent, size)
+            return lambda: self.client.get(reverse('agent-mautamer-list'))
+        self.assertConstantQueries(request)
@@ -0,0 +1,103 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import router
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import resolve, reverse
+from django.http import HttpResponse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.middleware import ReplicaMiddleware
+from api.models import Voucher
+
+from .utils import make_mautamers, make_voucher, voucher_payload
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = User.objects.create(username='agent')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.agent)}'}
+        self.factory = RequestFactory()
+
+    def read_db(self, method, path, status=200):
+        """Database a read would use inside the view, as routed by the middleware"""
+        seen = {}
+
+        def get_response(request):
+            match = resolve(path)
+            middleware.process_view(request, match.func, match.args, match.kwargs)
+            seen['db'] = router.db_for_read(Voucher)
+            return HttpResponse(status=status)
+
+        middleware = ReplicaMiddleware(get_response)
+        middleware(getattr(self.factory, method)(path, **self.auth))
+        return seen['db']
+
+    def test_list_reads_go_to_replica(self):
+        self.assertEqual(self.read_db('get', '/vouchers/'), 'replica')
+        self.assertEqual(self.read_db('get', '/api/admin/agents/'), 'replica')
+        self.assertEqual(self.read_db('get', '/api/agent/mautamers/'), 'replica')
+
+    def test_other_views_and_writes_use_primary(self):
+        self.assertEqual(self.read_db('get', '/vouchers/1/'), 'default')
+        self.assertEqual(self.read_db('post', '/vouchers/', status=400), 'default')
+        # Routing is reset once the request is done
+        self.assertEqual(router.db_for_read(Voucher), 'default')
+
+    def test_reads_stick_to_primary_after_write(self):
+        self.assertEqual(self.read_db('post', '/vouchers/', status=201), 'default')
+        self.assertEqual(self.read_db('get', '/vouchers/'), 'default')
+
+        other = User.objects.create(username='other')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(other)}'}
+        self.assertEqual(self.read_db('get', '/vouchers/'), 'replica')
+
+    def test_failed_write_does_not_pin(self):
+        self.read_db('post', '/vouchers/', status=400)
+        self.assertEqual(self.read_db('get', '/vouchers/'), 'replica')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5,
+                   VOUCHER_JOURNAL_BACKGROUND=False)
+class ReplicaDatabaseTests(APITestCase):
+    """Against a second database that replication hasn't caught up with"""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.agent = self.replicated_user('agent')
+        self.other = self.replicated_user('other')
+        self.voucher = make_voucher(self.agent)
+        make_voucher(self.other)
+
+    def replicated_user(self, username):
+        user = User.objects.create(username=username)
+        User.objects.using('replica').create(id=user.id, username=username)
+        return user
+
+    def list_vouchers(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        response = self.client.get(reverse('voucher-list-create'))
+        self.assertEqual(response.status_code, 200)
+        return [row['vNo'] for row in response.json()]
+
+    def test_list_reads_replica_until_user_writes(self):
+        # Not replicated yet
+        self.assertEqual(self.list_vouchers(self.agent), [])
+        # Detail reads stay on the primary
+        detail = self.client.get(reverse('voucher-detail', args=[self.voucher.id]))
+        self.assertEqual(detail.json()['vNo'], self.voucher.vNo)
+
+        ids = [m.id for m in make_mautamers(self.agent, 2, prefix='N')]
+        response = self.client.post(
+            reverse('voucher-list-create'), voucher_payload('NEW-1', ids, 1), format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        # Pinned to the primary: sees its own write
+        self.assertEqual(len(self.list_vouchers(self.agent)), 2)
+        self.assertIn('NEW-1', self.list_vouchers(self.agent))
+        self.assertEqual(self.list_vouchers(self.other), [])
+
+        cache.clear()
+        self.assertEqual(self.list_vouchers(self.agent), [])
@@ -0,0 +1,242 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.journal import get_journal
+from api.models import AgentShard, Mautamer, Voucher, VoucherMautamer
+from api.pagination import EstimatedCountPaginator
+from api.passports import duplicate_report
+from api.serializers import VoucherDetailSerializer
+from api.sharding import (
+    SHARD_ID_SPAN, copy_user, current_shard, fan_out, get_id_allocator, get_shard_map, move_agent,
+    plan_moves, reserve_id_ranges, using_shard
+)
+
+from .utils import change_form_data, make_mautamers, make_voucher, voucher_payload
+
+
+@override_settings(DATABASE_SHARDS=['default', 'shard2'], SHARD_MAP_CACHE_SECONDS=30)
+class ShardingTests(APITestCase):
+    databases = {'default', 'shard2'}
+
+    def setUp(self):
+        get_shard_map().invalidate()
+        get_id_allocator().clear()
+        reserve_id_ranges('shard2')
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.small = self.agent_on('small', 'default')
+        self.big = self.agent_on('big', 'shard2')
+
+    def agent_on(self, username, alias):
+        agent = User.objects.create(username=username)
+        copy_user(agent.id, alias)
+        AgentShard.objects.create(user=agent, alias=alias)
+        return agent
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    def create_voucher(self, agent, vno):
+        with using_shard(AgentShard.objects.get(user=agent).alias):
+            ids = [m.id for m in make_mautamers(agent, 2, prefix=vno)]
+        self.login(agent)
+        response = self.client.post(
+            reverse('voucher-list-create'), voucher_payload(vno, ids, 1), format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def test_agent_rows_stay_on_their_shard(self):
+        small_id = self.create_voucher(self.small, 'S1')
+        big_id = self.create_voucher(self.big, 'B1')
+
+        self.assertTrue(Voucher.objects.using('default').filter(pk=small_id).exists())
+        self.assertFalse(Voucher.objects.using('default').filter(pk=big_id).exists())
+        self.assertEqual(
+            VoucherMautamer.objects.using('shard2').filter(voucher_id=big_id).count(), 2)
+        # Ids of the second shard come from its own range
+        self.assertGreaterEqual(big_id, SHARD_ID_SPAN)
+
+        self.login(self.big)
+        response = self.client.get(reverse('voucher-list-create'))
+        self.assertEqual([row['id'] for row in response.json()], [big_id])
+        response = self.client.get(reverse('voucher-detail', args=[big_id]))
+        self.assertEqual(response.json()['vNo'], 'B1')
+
+    def test_admin_views_fan_out(self):
+        small_id = self.create_voucher(self.small, 'S1')
+        big_id = self.create_voucher(self.big, 'B1')
+        self.login(self.admin)
+
+        response = self.client.get(reverse('admin-voucher-list'), {'ordering': 'vNo'})
+        self.assertEqual([row['vNo'] for row in response.json()], ['B1', 'S1'])
+        response = self.client.get(reverse('voucher-list-create'), {'ordering': '-vNo'})
+        self.assertEqual([row['id'] for row in response.json()], [small_id, big_id])
+
+        response = self.client.get(reverse('admin-agent-list'))
+        counts = {row['username']: row['vouchers_count'] for row in response.json()}
+        self.assertEqual(counts, {'big': 1, 'small': 1})
+
+        response = self.client.patch(reverse('voucher-status-update', args=[big_id]),
+                                     {'status': 'approved'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Voucher.objects.using('shard2').get(pk=big_id).status, 'approved')
+
+    def test_voucher_numbers_unique_across_shards(self):
+        self.create_voucher(self.small, 'DUP1')
+        with using_shard('shard2'):
+            ids = [m.id for m in make_mautamers(self.big, 1)]
+        self.login(self.big)
+        response = self.client.post(
+            reverse('voucher-list-create'), voucher_payload('DUP1', ids, 1), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('vNo', response.json())
+        self.assertFalse(Voucher.objects.using('shard2').filter(vNo='DUP1').exists())
+
+    def test_staff_copy_checked_on_owner_shard(self):
+        big_id = self.create_voucher(self.big, 'B1')
+        with using_shard('shard2'):
+            passengers = [m.id for m in make_mautamers(self.big, 2, prefix='N')]
+
+        shards = []
+
+        def validate(serializer, attrs):
+            shards.append(current_shard.get())
+            return attrs
+
+        self.login(self.admin)
+        with mock.patch.object(VoucherDetailSerializer, 'validate', validate):
+            response = self.client.post(reverse('voucher-clone', args=[big_id]),
+                                        {'days': 30, 'mautamer_ids': passengers}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(shards, ['shard2'])
+        copy = Voucher.objects.using('shard2').get(pk=response.json()['id'])
+        self.assertEqual(copy.user_id, self.big.id)
+        self.assertEqual(sorted(copy.voucher_mautamers.values_list('mautamer_id', flat=True)),
+                         passengers)
+
+    def test_admin_pages_reach_every_shard(self):
+        small_id = self.create_voucher(self.small, 'S1')
+        big_id = self.create_voucher(self.big, 'B1')
+        self.client.credentials()
+        self.admin.is_superuser = True
+        self.admin.save()
+        self.client.force_login(self.admin)
+
+        def listed(**params):
+            response = self.client.get(reverse('admin:api_voucher_changelist'), params)
+            return [voucher.id for voucher in response.context['cl'].result_list]
+
+        self.assertEqual(listed(), [small_id])
+        self.assertEqual(listed(shard='shard2'), [big_id])
+
+        url = reverse('admin:api_voucher_change', args=[big_id])
+        response = self.client.get(url, {'_changelist_filters': 'shard=shard2'})
+        self.assertEqual(response.status_code, 200)
+        data = change_form_data(response)
+        self.assertEqual(data['hotels-TOTAL_FORMS'], 1)
+        data['status'] = 'approved'
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertEqual(Voucher.objects.using('shard2').get(pk=big_id).status, 'approved')
+
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'api', 'model_name': 'vouchermautamer', 'field_name': 'mautamer',
+            'term': 'B1', 'agent': self.big.id,
+        })
+        self.assertEqual(len(response.json()['results']), 2)
+        # Staff get no shard of their own and don't count as agents
+        self.assertFalse(AgentShard.objects.filter(user=self.admin).exists())
+
+    def test_staff_not_mapped(self):
+        staff = User.objects.create(username='staff', is_staff=True)
+        self.login(staff)
+        self.assertEqual(self.client.get(reverse('voucher-list-create')).status_code, 200)
+        self.assertFalse(AgentShard.objects.filter(user=staff).exists())
+        self.assertEqual(get_shard_map().get(staff.id), (None, False))
+
+        # Mapped before they were staff, still not counted as agents
+        self.agent_on('big2', 'shard2')
+        for username in ('staff2', 'staff3'):
+            AgentShard.objects.create(
+                user=User.objects.create(username=username, is_staff=True), alias='default')
+        newcomer = User.objects.create(username='newcomer')
+        self.assertEqual(get_shard_map().get(newcomer.id), ('default', False))
+
+    def test_new_agent_mautamers_go_to_its_shard(self):
+        self.login(self.admin)
+        response = self.client.post(reverse('admin-agent-create'), {
+            'username': 'new', 'password': 'secret-pass-123',
+            'mautamers': [{'pax_name': 'A', 'passport': 'N1'}],
+        }, format='json')
+        self.assertEqual(response.json()['mautamers_uploaded'], 1)
+        alias = AgentShard.objects.get(user_id=response.json()['agent_id']).alias
+        self.assertEqual(Mautamer.objects.using(alias).filter(passport='N1').count(), 1)
+
+    def test_passport_duplicates_across_shards(self):
+        for agent, alias, typed in ((self.small, 'default', 'AB 1'), (self.big, 'shard2', 'ab1'),
+                                    (self.big, 'shard2', 'CD1')):
+            Mautamer.objects.using(alias).create(user=agent, pax_name='Pax', passport=typed)
+
+        report = list(duplicate_report())
+        self.assertEqual([(d['passport_key'], d['agents']) for d in report], [('AB1', 2)])
+        self.assertEqual([m['agent'] for m in report[0]['mautamers']], ['small', 'big'])
+
+    def test_move_agent(self):
+        big_id = self.create_voucher(self.big, 'B1')
+        self.create_voucher(self.big, 'B2')
+        self.create_voucher(self.small, 'S1')
+        tiny = self.agent_on('tiny', 'shard2')
+        self.create_voucher(tiny, 'T1')
+        # shard2 has 9 rows, default 3: moving tiny (3) evens them, big (6) would not
+        self.assertEqual(plan_moves(tolerance=0.1), [(tiny.id, 'shard2', 'default', 3)])
+
+        copied = move_agent(self.big.id, 'default')
+
+        self.assertGreater(copied, 0)
+        self.assertEqual(AgentShard.objects.get(user=self.big).alias, 'default')
+        self.assertFalse(Voucher.objects.using('shard2').filter(user=self.big).exists())
+        with using_shard('default'):
+            voucher = make_voucher(self.big)
+        self.assertEqual(
+            [v.id for v in fan_out(Voucher.objects.filter(user=self.big).order_by('id'))],
+            sorted([voucher.id, big_id] + list(
+                Voucher.objects.filter(vNo='B2').values_list('id', flat=True))))
+        self.login(self.big)
+        response = self.client.get(reverse('voucher-detail', args=[big_id]))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=0, VOUCHER_JOURNAL_BACKGROUND=False)
+    def test_estimated_counts_per_shard(self):
+        self.addCleanup(get_journal().flush)
+        for agent, vno in ((self.big, 'B1'), (self.big, 'B2'), (self.small, 'S1')):
+            # Released id blocks are reused once the write commits
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_voucher(agent, vno)
+
+        def count(alias):
+            return EstimatedCountPaginator(Voucher.objects.using(alias), 100).count
+
+        # Ids on shard2 start at SHARD_ID_SPAN, not at 1
+        self.assertEqual((count('default'), count('shard2')), (1, 2))
+        # 'default' now has ids from both ranges, counted instead
+        move_agent(self.big.id, 'default')
+        self.assertEqual((count('default'), count('shard2')), (3, 0))
+
+    def test_ids_stay_apart_after_move(self):
+        self.create_voucher(self.big, 'B1')
+        move_agent(self.big.id, 'default')
+
+        # 'default' now holds rows from shard2's range, its new ids don't follow them
+        created = {}
+        for agent, alias in ((self.small, 'default'), (self.big, 'default'), (self.admin, 'shard2')):
+            if alias == 'shard2':
+                copy_user(agent.id, alias)
+            with using_shard(alias):
+                voucher = make_voucher(agent)
+            created.setdefault(alias, []).extend(
+                [voucher.id, voucher.hotels.get().id, voucher.voucher_mautamers.get().mautamer_id])
+        self.assertTrue(all(pk < SHARD_ID_SPAN for pk in created['default']))
+        self.assertTrue(all(pk > SHARD_ID_SPAN for pk in created['shard2']))
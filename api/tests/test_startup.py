@@ -0,0 +1,26 @@
+import os
+
+from django.contrib.auth.models import User
+from django.core.wsgi import get_wsgi_application
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.startup import first_request, memory_kb, warm
+
+
+class StartupTests(TestCase):
+    def test_warm_times_every_step(self):
+        self.assertEqual(
+            set(warm()), {'urls', 'serializers', 'tokens', 'templates', 'databases'})
+
+    @override_settings(ALLOWED_HOSTS=['localhost'])
+    def test_first_request_through_wsgi(self):
+        token = str(AccessToken.for_user(User.objects.create(username='agent')))
+        status = first_request(get_wsgi_application(), '/api/agent/mautamers/', token)
+        self.assertEqual(status, '200 OK')
+
+    def test_memory_of_own_process(self):
+        memory = memory_kb(os.getpid())
+        if memory is None:
+            self.skipTest('No /proc/<pid>/smaps_rollup here')
+        self.assertGreater(memory['pss_kb'], 0)
@@ -0,0 +1,141 @@
+from datetime import date
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.archive import archive_batch
+from api.models import HotelAllotment, HotelNight, Voucher
+from api.stays import rebuild_nights, stay_errors
+
+from .utils import change_form_data, make_mautamers, make_voucher, voucher_payload
+
+
+def stay(name, check_in, checkout, nights=0):
+    return {'hotel_name': name, 'checking_date': date(2026, 3, check_in),
+            'checkout_date': date(2026, 3, checkout), 'nights': nights}
+
+
+class StayConsistencyTests(APITestCase):
+    def test_chained_stays_pass_and_nights_filled_in(self):
+        stays = [stay('A', 1, 8), stay('A', 1, 8, 7), stay('B', 8, 15)]
+        self.assertEqual(stay_errors(stays), [])
+        self.assertEqual(stays[2]['nights'], 7)
+
+    def test_reports_bad_nights_gaps_and_overlaps(self):
+        self.assertEqual(len(stay_errors([stay('A', 1, 8, 6)])), 1)
+        self.assertIn('Gap', stay_errors([stay('A', 1, 8), stay('B', 9, 15)])[0])
+        self.assertIn('overlap', stay_errors([stay('A', 1, 8), stay('B', 7, 15)])[0])
+        self.assertIn('checkout', stay_errors([stay('A', 8, 8)])[0])
+
+
+class HotelCapacityTests(APITestCase):
+    def setUp(self):
+        self.agent = User.objects.create(username='agent')
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.agent)}')
+        # Two rooms at Hotel 0 from 2026-03-05, checkout 2026-03-10
+        HotelAllotment.objects.create(
+            hotel_name='Hotel 0', start_date=date(2026, 3, 5), end_date=date(2026, 3, 10), rooms=2)
+        rebuild_nights('Hotel 0')
+
+    def create(self):
+        # One room at Hotel 0, 2026-03-01 to 2026-03-08
+        payload = voucher_payload(None, [m.id for m in make_mautamers(self.agent, 1)], 1)
+        del payload['vNo']
+        return self.client.post(reverse('voucher-list-create'), payload, format='json')
+
+    def booked(self):
+        return list(HotelNight.objects.values_list('booked', flat=True))
+
+    def test_books_until_full(self):
+        self.assertEqual(self.create().status_code, 201)
+        self.assertEqual(self.booked(), [1, 1, 1, 0, 0])
+        second = self.create()
+        self.assertEqual(second.status_code, 201)
+
+        response = self.create()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('2026-03-05, 2026-03-06, 2026-03-07', response.data['hotels'][0])
+        self.assertEqual(self.booked(), [2, 2, 2, 0, 0])
+
+        # Deleting and rejecting give the rooms back
+        self.client.delete(reverse('voucher-detail', args=[second.data['id']]))
+        self.assertEqual(self.booked(), [1, 1, 1, 0, 0])
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.admin)}')
+        remaining = self.client.get(reverse('admin-voucher-list')).json()[0]['id']
+        self.client.patch(reverse('voucher-status-update', args=[remaining]),
+                          {'status': 'rejected'}, format='json')
+        self.assertEqual(self.booked(), [0, 0, 0, 0, 0])
+
+    def test_update_moves_booking_and_rebuild_matches(self):
+        voucher_id = self.create().data['id']
+        payload = voucher_payload('V-moved', [], 1)
+        payload['hotels'][0].update(checking_date='2026-03-08', checkout_date='2026-03-15')
+        response = self.client.put(
+            reverse('voucher-detail', args=[voucher_id]), payload, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.booked(), [0, 0, 0, 1, 1])
+
+        HotelNight.objects.update(booked=0)
+        call_command('rebuild_hotel_nights', stdout=StringIO())
+        self.assertEqual(self.booked(), [0, 0, 0, 1, 1])
+
+
+@override_settings(VOUCHER_JOURNAL_BACKGROUND=False)
+class AdminCapacityTests(TestCase):
+    """Admin writes and archiving don't go through book(), the nights follow anyway"""
+
+    def setUp(self):
+        self.agent = User.objects.create(username='agent')
+        admin = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        HotelAllotment.objects.create(
+            hotel_name='Hotel 0', start_date=date(2026, 3, 1), end_date=date(2026, 3, 4), rooms=2)
+        rebuild_nights('Hotel 0')
+        # One room at Hotel 0 from 2026-03-01, checkout 2026-03-08
+        self.voucher = make_voucher(self.agent)
+        rebuild_nights('Hotel 0')
+
+    def booked(self):
+        return list(HotelNight.objects.values_list('booked', flat=True))
+
+    def test_voucher_status_and_delete(self):
+        url = reverse('admin:api_voucher_change', args=[self.voucher.id])
+        data = change_form_data(self.client.get(url))
+        data['status'] = 'rejected'
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertEqual(self.booked(), [0, 0, 0])
+
+        data['status'] = 'approved'
+        self.client.post(url, data)
+        self.assertEqual(self.booked(), [1, 1, 1])
+
+        self.client.post(reverse('admin:api_voucher_delete', args=[self.voucher.id]), {'post': 'yes'})
+        self.assertEqual(self.booked(), [0, 0, 0])
+
+    def test_hotel_rows(self):
+        hotel = self.voucher.hotels.get()
+        url = reverse('admin:api_hotel_change', args=[hotel.id])
+        data = change_form_data(self.client.get(url))
+        data['hotel_name'] = 'Hotel 1'
+        self.client.post(url, data)
+        self.assertEqual(self.booked(), [0, 0, 0])
+
+        data['hotel_name'] = 'Hotel 0'
+        self.client.post(url, data)
+        self.assertEqual(self.booked(), [1, 1, 1])
+        self.client.post(reverse('admin:api_hotel_delete', args=[hotel.id]), {'post': 'yes'})
+        self.assertEqual(self.booked(), [0, 0, 0])
+
+    def test_archiving_releases_rooms(self):
+        rejected = make_voucher(self.agent)
+        Voucher.objects.filter(pk=rejected.pk).update(status='rejected')
+        self.assertEqual(self.booked(), [1, 1, 1])
+
+        self.assertEqual(archive_batch([self.voucher.id, rejected.id]), 2)
+        self.assertEqual(self.booked(), [0, 0, 0])
@@ -0,0 +1,61 @@
+from datetime import date
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import Voucher, FlightInformation
+
+from .utils import make_mautamers, make_voucher, voucher_payload
+
+
+class VoucherSummaryTests(APITestCase):
+    def setUp(self):
+        self.agent = User.objects.create(username='agent')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.agent)}')
+
+    def test_create_and_update_keep_summary(self):
+        ids = [m.id for m in make_mautamers(self.agent, 3)]
+        response = self.client.post(
+            reverse('voucher-list-create'), voucher_payload('S1', ids, 1), format='json')
+        self.assertEqual(response.status_code, 201)
+        voucher = Voucher.objects.get(vNo='S1')
+        self.assertEqual(
+            (voucher.departure_date, voucher.return_date, voucher.nights, voucher.pax_count),
+            (date(2026, 3, 1), date(2026, 3, 15), 14, 3))
+
+        payload = voucher_payload('S1', ids[:1], 1)
+        payload['flight_info']['nights'] = 7
+        payload['flight_info']['return_date'] = '2026-03-08'
+        response = self.client.put(
+            reverse('voucher-detail', args=[voucher.id]), payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        voucher.refresh_from_db()
+        self.assertEqual((voucher.return_date, voucher.nights, voucher.pax_count),
+                         (date(2026, 3, 8), 7, 1))
+
+    def test_admin_list_reads_summary(self):
+        make_voucher(self.agent, children=2)
+        admin = User.objects.create(username='admin', is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(admin)}')
+
+        response = self.client.get(reverse('admin-voucher-list'))
+        row = response.json()[0]
+        self.assertEqual(row['mautamers_count'], 2)
+        self.assertEqual(row['nights'], 14)
+        self.assertEqual(row['return_date'], '2026-03-15')
+
+    def test_check_command_finds_and_fixes_drift(self):
+        voucher = make_voucher(self.agent)
+        FlightInformation.objects.filter(voucher=voucher).update(nights=3)
+
+        with self.assertRaises(CommandError):
+            call_command('check_voucher_summaries', stdout=StringIO())
+        call_command('check_voucher_summaries', fix=True, stdout=StringIO())
+        call_command('check_voucher_summaries', stdout=StringIO())
+        voucher.refresh_from_db()
+        self.assertEqual(voucher.nights, 3)
@@ -0,0 +1,101 @@
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.throttling import TokenBuckets, get_buckets, parse_rate
+
+RATES = {'login': '2/min', 'register': '1/min', 'token_refresh': '2/min', 'admin_upload': '1/min'}
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_refill(self):
+        buckets = TokenBuckets(max_keys=10)
+        capacity, refill = parse_rate('3/min')
+        self.assertEqual([buckets.take('a', capacity, refill, now=0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(buckets.take('a', capacity, refill, now=0), 20)
+        # Other clients have their own bucket
+        self.assertEqual(buckets.take('b', capacity, refill, now=0), 0)
+        # One token back every 20 seconds
+        self.assertEqual(buckets.take('a', capacity, refill, now=20), 0)
+        self.assertGreater(buckets.take('a', capacity, refill, now=21), 0)
+
+    def test_bounded(self):
+        buckets = TokenBuckets(max_keys=2)
+        for key in 'abc':
+            buckets.take(key, 1, 1, now=0)
+        # 'a' was dropped and starts over with a full bucket
+        self.assertEqual(buckets.take('a', 1, 1, now=0), 0)
+        self.assertGreater(buckets.take('c', 1, 1, now=0), 0)
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': RATES})
+class ThrottledRouteTests(APITestCase):
+    def setUp(self):
+        get_buckets().clear()
+        self.addCleanup(get_buckets().clear)
+
+    def login(self, **extra):
+        return self.client.post(
+            reverse('login'), {'username': 'nobody', 'password': 'wrong'}, format='json', **extra)
+
+    def test_login_rejected_without_database_or_hasher(self):
+        self.assertEqual(self.login().status_code, 401)
+        self.assertEqual(self.login().status_code, 401)
+
+        with mock.patch('django.contrib.auth.backends.ModelBackend.authenticate') as authenticate, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.login()
+        self.assertEqual(response.status_code, 429)
+        # Refilling since the first request, slow hashing may take a second off
+        self.assertIn(int(response['Retry-After']), range(28, 31))
+        authenticate.assert_not_called()
+        self.assertEqual(len(queries), 0)
+
+        # Another client is not affected
+        self.assertEqual(self.login(REMOTE_ADDR='10.0.0.2').status_code, 401)
+
+    def test_forwarded_for_not_trusted(self):
+        for number in range(2):
+            response = self.login(HTTP_X_FORWARDED_FOR=f'203.0.113.{number}')
+            self.assertEqual(response.status_code, 401)
+        response = self.login(HTTP_X_FORWARDED_FOR='203.0.113.99')
+        self.assertEqual(response.status_code, 429)
+
+        # Behind one proxy its last hop is the client
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1,
+                                               'DEFAULT_THROTTLE_RATES': RATES}):
+            response = self.login(HTTP_X_FORWARDED_FOR='203.0.113.99, 198.51.100.7')
+        self.assertEqual(response.status_code, 401)
+
+    def test_register_and_refresh(self):
+        payload = {'username': 'new-user', 'password': 'pass-123-abc'}
+        self.assertEqual(self.client.post(reverse('register'), payload).status_code, 201)
+        self.assertEqual(self.client.post(reverse('register'), payload).status_code, 429)
+
+        for _ in range(2):
+            self.client.post(reverse('token_refresh'), {'refresh': 'bad'})
+        self.assertEqual(self.client.post(reverse('token_refresh'), {'refresh': 'bad'}).status_code, 429)
+
+    def test_admin_upload_per_user(self):
+        admins = [User.objects.create(username=f'admin{i}', is_staff=True) for i in range(2)]
+        agent = User.objects.create(username='agent')
+        url = reverse('admin-agent-mautamer-upload', args=[agent.id])
+        payload = {'mautamers': [{'pax_name': 'Pax', 'passport': 'AB1'}]}
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(admins[0])}')
+        self.assertEqual(self.client.post(url, payload, format='json').status_code, 201)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, payload, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(queries), 0)
+
+        # Same address, different admin
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(admins[1])}')
+        self.assertEqual(self.client.post(url, payload, format='json').status_code, 201)
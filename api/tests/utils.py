@@ -0,0 +1,76 @@
+"""Factories shared by the api tests"""
+import itertools
+from datetime import date, time, timedelta
+
+from api.models import (
+    Voucher, FlightInformation, Mautamer, VoucherMautamer, Hotel, Transportation
+)
+
+voucher_numbers = itertools.count(1)
+
+
+def make_mautamers(agent, count, prefix='P'):
+    start = Mautamer.objects.count()
+    return Mautamer.objects.bulk_create([
+        Mautamer(user=agent, pax_name=f'Pax {start + i}', passport=f'{prefix}{start + i:07d}')
+        for i in range(count)
+    ])
+
+
+def make_voucher(agent, children=1, departure=date(2026, 3, 1), nights=14):
+    voucher = Voucher.objects.create(
+        user=agent, vNo=f'V{next(voucher_numbers):06d}',
+        agentName=agent.username)
+    FlightInformation.objects.create(
+        voucher=voucher, departure_date=departure, arrival_date=departure,
+        depart_time=time(9), arrival_time=time(14), nights=nights,
+        return_date=departure + timedelta(days=nights), return_time=time(18))
+    for i in range(children):
+        Hotel.objects.create(
+            voucher=voucher, city='Makkah', hotel_name=f'Hotel {i}',
+            checking_date=departure, checkout_date=departure + timedelta(days=7), nights=7)
+        Transportation.objects.create(
+            voucher=voucher, date=departure + timedelta(days=i), from_location='Jeddah')
+    for mautamer in make_mautamers(agent, children):
+        VoucherMautamer.objects.create(voucher=voucher, mautamer=mautamer)
+    voucher.refresh_summary()
+    voucher.refresh_from_db()
+    return voucher
+
+
+def voucher_payload(vno, mautamer_ids, children):
+    return {
+        'vNo': vno,
+        'agentName': 'Agent',
+        'flight_info': {
+            'departure_date': '2026-03-01', 'arrival_date': '2026-03-01',
+            'depart_time': '09:00', 'arrival_time': '14:00', 'nights': 14,
+            'return_date': '2026-03-15', 'return_time': '18:00',
+        },
+        'mautamer_ids': mautamer_ids,
+        'hotels': [
+            {'city': 'Makkah', 'hotel_name': f'Hotel {i}', 'checking_date': '2026-03-01',
+             'checkout_date': '2026-03-08', 'nights': 7}
+            for i in range(children)
+        ],
+        'transportations': [
+            {'date': '2026-03-01', 'from_location': f'Stop {i}'} for i in range(children)
+        ],
+    }
+
+
+def change_form_data(response):
+    """POST data of an admin change form as rendered, inline rows without the extra ones"""
+    forms = [response.context['adminform'].form]
+    totals = {}
+    for inline in response.context['inline_admin_formsets']:
+        formset = inline.formset
+        forms += [formset.management_form, *formset.initial_forms]
+        totals[f'{formset.prefix}-TOTAL_FORMS'] = len(formset.initial_forms)
+    data = {}
+    for form in forms:
+        for name in form.fields:
+            value = form[name].value()
+            if value not in (None, False):
+                data[form.add_prefix(name)] = value
+    return {**data, **totals}
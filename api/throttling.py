@@ -0,0 +1,141 @@
+"""
+Token bucket throttles for the expensive routes.
+
+Login and register run the password hasher and the admin agent create and
+upload routes write thousands of rows, so a burst against them slows down
+everyone. Each scope in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] is read
+as a bucket: '10/min' holds up to 10 requests and refills one every 6
+seconds. Buckets live in this process's memory (a dict behind a lock), so
+a rejection is a dict lookup - no cache round trip, no database query, no
+hashing. With several workers every worker has its own buckets: the limit
+a client sees is at most rate x workers.
+
+ThrottleFirstMixin checks the throttles before DRF authenticates the
+request, so a throttled request never loads its user either; the client is
+its IP address, or the user id inside its access token (read without a
+database lookup, api/tokens.py). The IP is REMOTE_ADDR: X-Forwarded-For is
+only read past REST_FRAMEWORK['NUM_PROXIES'] trusted proxies, else a client
+could get a fresh bucket per request by sending a new one.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .tokens import raw_token_from_header, token_user_id
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'10/min' -> (10 requests, 10 / 60 refilled per second)"""
+    count, period = rate.split('/')
+    return int(count), int(count) / PERIODS[period[0]]
+
+
+class TokenBuckets:
+    """
+    Buckets by key, least recently used dropped past max_keys so a flood
+    of new clients can't grow the dict without bound
+    """
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill, now=None):
+        """Take a token, returns 0 when allowed, else seconds until the next one"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / refill
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+@lru_cache(maxsize=None)
+def get_buckets():
+    return TokenBuckets(settings.THROTTLE_MAX_KEYS)
+
+
+class BucketThrottle(BaseThrottle):
+    """Throttle of one scope, per client IP"""
+    scope = None
+
+    def __init__(self):
+        self.rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        self._wait = 0
+
+    def get_client(self, request):
+        return self.get_ident(request)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        capacity, refill = parse_rate(self.rate)
+        key = f'{self.scope}:{self.get_client(request)}'
+        self._wait = get_buckets().take(key, capacity, refill)
+        return not self._wait
+
+    def wait(self):
+        return self._wait
+
+
+class UserBucketThrottle(BucketThrottle):
+    """Throttle of one scope, per user of the access token (IP without one)"""
+
+    def get_client(self, request):
+        raw_token = raw_token_from_header(request.META.get('HTTP_AUTHORIZATION', ''))
+        user_id = token_user_id(raw_token) if raw_token else None
+        if user_id is None:
+            return self.get_ident(request)
+        return f'user:{user_id}'
+
+
+class LoginThrottle(BucketThrottle):
+    scope = 'login'
+
+
+class RegisterThrottle(BucketThrottle):
+    scope = 'register'
+
+
+class TokenRefreshThrottle(BucketThrottle):
+    scope = 'token_refresh'
+
+
+class AdminUploadThrottle(UserBucketThrottle):
+    scope = 'admin_upload'
+
+
+class ThrottleFirstMixin:
+    """
+    For views with throttle_classes: throttles are checked before the
+    request is authenticated (DRF checks them after), so rejecting costs
+    no user lookup
+    """
+
+    def initial(self, request, *args, **kwargs):
+        self.check_throttles(request)
+        self.throttles_checked = True
+        super().initial(request, *args, **kwargs)
+
+    def check_throttles(self, request):
+        if not getattr(self, 'throttles_checked', False):
+            super().check_throttles(request)
@@ -0,0 +1,22 @@
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+def raw_token_from_header(value):
+    """Token out of an 'Authorization: Bearer <token>' value, or None"""
+    parts = value.split()
+    if len(parts) == 2 and parts[0] in jwt_settings.AUTH_HEADER_TYPES:
+        return parts[1]
+    return None
+
+
+def token_user_id(raw_token):
+    """
+    user_id claim (as a string) of a valid access token, without a database
+    lookup. For routing decisions made before DRF authenticates the request.
+    """
+    try:
+        return str(AccessToken(raw_token)[jwt_settings.USER_ID_CLAIM])
+    except (TokenError, KeyError):
+        return None
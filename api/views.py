@@ -1,20 +1,64 @@
+from collections import Counter
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db.models import Count, Max
+from django.db import router
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
 from .serializers import (
     RegisterSerializer, MyTokenObtainPairSerializer,
     VoucherListSerializer, VoucherDetailSerializer, VoucherStatusUpdateSerializer,
-    MautamerSerializer, AgentCreateSerializer
+    MautamerSerializer, AgentCreateSerializer, VoucherChangeSerializer, VoucherTemplateSerializer
+)
+from .models import Voucher, Mautamer, VoucherChange, VoucherTemplate, normalize_passport
+from .events import notify_voucher
+from .archive import archived_voucher
+from .filters import filter_vouchers, parse_date
+from .stays import book, counted, voucher_stays
+from .compression import CompressedListMixin
+from .fieldsets import SparseFieldsetMixin
+from .conflicts import audit_trips, find_conflicts, conflict_data
+from .metrics import render_metrics, PROMETHEUS_CONTENT_TYPE
+from .journal import get_journal, payload_parts, record_change, snapshot
+from .sharding import AgentShardMixin, atomic, each_shard, fan_out
+from .export import CSV, NDJSON, FORMATS as EXPORT_FORMATS, Exporter, threaded
+from .passports import duplicate_report
+from .batch import Batch, BatchSerializer, render as render_batch
+from .cloning import CopyOptionsSerializer, copy_voucher, source_detail, voucher_document
+from .throttling import (
+    AdminUploadThrottle, LoginThrottle, RegisterThrottle, ThrottleFirstMixin, TokenRefreshThrottle
 )
-from .models import Voucher, Mautamer
 
 
-class RegisterView(APIView):
+def counts_by_user(model):
+    """{user_id: rows of `model`}, summed over the shards when sharded"""
+    counts = Counter()
+    for queryset in each_shard(model.objects.order_by().values_list('user')):
+        counts.update(dict(queryset.annotate(count=Count('id'))))
+    return counts
+
+
+def existing_passports(agent, keys, chunk_size=500):
+    """Passport keys out of `keys` the agent already has"""
+    existing = set()
+    for start in range(0, len(keys), chunk_size):
+        existing.update(agent.mautamers.filter(
+            passport_key__in=keys[start:start + chunk_size]
+        ).values_list('passport_key', flat=True))
+    return existing
+
+
+class RegisterView(ThrottleFirstMixin, APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [RegisterThrottle]
 
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
@@ -29,52 +73,121 @@ class RegisterView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class LoginView(TokenObtainPairView):
+class LoginView(ThrottleFirstMixin, TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
+    throttle_classes = [LoginThrottle]
+
+
+class RefreshView(ThrottleFirstMixin, TokenRefreshView):
+    throttle_classes = [TokenRefreshThrottle]
 
 
 # Voucher CRUD Views
-class VoucherListCreateView(ListCreateAPIView):
+class VoucherListCreateView(SparseFieldsetMixin, ListCreateAPIView):
     """
-    GET: List all vouchers for authenticated user
+    GET: List all vouchers for authenticated user (filters/ordering: api/filters.py,
+         ?fields= / ?include=: api/fieldsets.py)
     POST: Create new voucher
     """
     permission_classes = [IsAuthenticated]
+    read_from_replica = True
+    serializer_class = VoucherListSerializer
+    fieldset_serializer_class = VoucherDetailSerializer
+    default_fields = VoucherListSerializer.Meta.fields
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return VoucherDetailSerializer
-        return VoucherListSerializer
+        return super().get_serializer_class()
 
     def get_queryset(self):
         user = self.request.user
         if user.is_staff:
             # Admin can see all vouchers
-            return Voucher.objects.all()
-        # Normal user can only see their own vouchers
-        return Voucher.objects.filter(user=user)
+            vouchers = Voucher.objects.select_related('user')
+        else:
+            # Normal user can only see their own vouchers
+            vouchers = Voucher.objects.filter(user=user).select_related('user')
+        if self.request.method == 'GET':
+            vouchers = filter_vouchers(
+                vouchers, self.request.query_params, allow_agent=user.is_staff)
+            if self.get_fieldset() is not None:
+                vouchers = self.sparse(vouchers)
+        return vouchers
+
+    def list(self, request, *args, **kwargs):
+        if not (request.user.is_staff and settings.DATABASE_SHARDS):
+            return super().list(request, *args, **kwargs)
+        # Admin sees every agent's vouchers, one query set per shard
+        vouchers = fan_out(self.filter_queryset(self.get_queryset()))
+        return Response(self.get_serializer(vouchers, many=True).data)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        voucher = serializer.save(user=self.request.user)
+        # Reload with joins/prefetches so the response has no per-row queries
+        serializer.instance = Voucher.objects.with_details().get(pk=voucher.pk)
+        record_change(serializer.instance, self.request.user, VoucherChange.CREATED,
+                      after=snapshot(serializer.instance))
 
 
-class VoucherDetailView(RetrieveUpdateDestroyAPIView):
+class VoucherDetailView(AgentShardMixin, SparseFieldsetMixin, RetrieveUpdateDestroyAPIView):
     """
-    GET: Retrieve single voucher with all details
+    GET: Retrieve single voucher with all details (archived ones too),
+         or only ?fields= / ?include= (api/fieldsets.py)
     PUT/PATCH: Update voucher
     DELETE: Delete voucher
     """
     permission_classes = [IsAuthenticated]
     serializer_class = VoucherDetailSerializer
+    fieldset_serializer_class = VoucherDetailSerializer
 
     def get_queryset(self):
         user = self.request.user
         if user.is_staff:
-            return Voucher.objects.all()
-        return Voucher.objects.filter(user=user)
-
-
-class VoucherStatusUpdateView(APIView):
+            vouchers = Voucher.objects.all()
+        else:
+            vouchers = Voucher.objects.filter(user=user)
+        if self.request.method == 'GET':
+            if self.get_fieldset() is not None:
+                return self.sparse(vouchers)
+            return vouchers.with_details()
+        return vouchers
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            # Completed vouchers moved to the archive stay readable
+            archived = archived_voucher(request.user, kwargs['pk'])
+            if archived is None:
+                raise
+            data = archived.as_detail()
+            fieldset = self.get_fieldset()
+            if fieldset is not None:
+                data = {key: value for key, value in data.items()
+                        if key in fieldset or key == 'archived'}
+            return Response(data)
+
+    def perform_destroy(self, instance):
+        with atomic(Voucher):
+            book([], counted(instance.status, voucher_stays(instance)))
+            record_change(instance, self.request.user, VoucherChange.DELETED,
+                          before=snapshot(instance, parts=[]))
+            instance.delete()
+
+    def perform_update(self, serializer):
+        # Only the nested parts the payload replaces are read and compared
+        parts = payload_parts(self.request.data)
+        before = snapshot(serializer.instance, parts)
+        voucher = serializer.save()
+        notify_voucher(voucher, 'updated')
+        # Nested rows were rewritten, reload them for the response
+        serializer.instance = Voucher.objects.with_details().get(pk=voucher.pk)
+        record_change(serializer.instance, self.request.user, VoucherChange.UPDATED,
+                      before, snapshot(serializer.instance, parts))
+
+
+class VoucherStatusUpdateView(AgentShardMixin, APIView):
     """
     Admin only: Update voucher status (Approve/Reject)
     """
@@ -96,7 +209,11 @@ class VoucherStatusUpdateView(APIView):
         )
 
         if serializer.is_valid():
-            serializer.save()
+            previous_status = voucher.status
+            voucher = serializer.save()
+            notify_voucher(voucher, 'status')
+            record_change(voucher, request.user, VoucherChange.STATUS,
+                          {'status': previous_status}, {'status': voucher.status})
             return Response({
                 'message': 'Status updated successfully',
                 'status': serializer.data['status']
@@ -105,57 +222,224 @@ class VoucherStatusUpdateView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class AdminVoucherListView(APIView):
+class VoucherHistoryView(APIView):
     """
-    Admin only: Get all vouchers with additional details for admin panel
+    GET: Change journal of a voucher, oldest first (api/journal.py).
+    Admin sees every voucher, agents their own. Deleted and archived
+    vouchers keep their history.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        # This worker's buffered entries first, so a client reads its own writes
+        get_journal().flush()
+        changes = VoucherChange.objects.filter(voucher_id=pk).select_related('actor')
+        if not request.user.is_staff:
+            changes = changes.filter(agent=request.user)
+        changes = list(changes)
+        if not changes:
+            raise Http404
+        return Response({
+            'voucher_id': pk,
+            'vNo': changes[-1].vNo,
+            'count': len(changes),
+            'changes': VoucherChangeSerializer(changes, many=True).data,
+        })
+
+
+class VoucherCloneView(APIView):
+    """
+    POST: New voucher copied from this one (archived ones too) in one
+    request (api/cloning.py). Optional: days or departure_date to move all
+    dates, vNo, groupName, mautamer_ids. Passengers are not copied.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        owner, detail = source_detail(request.user, pk)
+        options = CopyOptionsSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+        voucher = copy_voucher(voucher_document(detail), options.validated_data, owner, request.user)
+        return Response(VoucherDetailSerializer(voucher).data, status=status.HTTP_201_CREATED)
+
+
+class VoucherTemplateListCreateView(ListCreateAPIView):
+    """
+    GET: Logged-in user's voucher templates
+    POST: Save a voucher as a template: {"name": ..., "voucher_id": ...}
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = VoucherTemplateSerializer
+
+    def get_queryset(self):
+        return VoucherTemplate.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        _, detail = source_detail(self.request.user, serializer.validated_data.pop('voucher_id'))
+        serializer.save(user=self.request.user, data=voucher_document(detail))
+
+
+class VoucherTemplateDetailView(RetrieveUpdateDestroyAPIView):
+    """
+    GET: One template
+    PATCH: Rename, or retake from another voucher with voucher_id
+    DELETE: Delete template
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = VoucherTemplateSerializer
+
+    def get_queryset(self):
+        return VoucherTemplate.objects.filter(user=self.request.user)
+
+    def perform_update(self, serializer):
+        voucher_id = serializer.validated_data.pop('voucher_id', None)
+        if voucher_id is None:
+            serializer.save()
+            return
+        _, detail = source_detail(self.request.user, voucher_id)
+        serializer.save(data=voucher_document(detail))
+
+
+class VoucherTemplateApplyView(APIView):
+    """
+    POST: New voucher from a template, same options as cloning a voucher
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        try:
+            template = VoucherTemplate.objects.get(pk=pk, user=request.user)
+        except VoucherTemplate.DoesNotExist:
+            raise Http404
+        options = CopyOptionsSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+        voucher = copy_voucher(template.data, options.validated_data, request.user, request.user)
+        return Response(VoucherDetailSerializer(voucher).data, status=status.HTTP_201_CREATED)
+
+
+class AdminVoucherListView(CompressedListMixin, APIView):
+    """
+    Admin only: Get all vouchers with additional details for admin panel,
+    filtered and sorted by query parameters (api/filters.py).
+    Compressed body cached until a voucher changes (api/compression.py)
     """
     permission_classes = [IsAdminUser]
+    read_from_replica = True
 
-    def get(self, request):
-        vouchers = Voucher.objects.all().order_by('-created_at')
+    def vouchers(self, request):
+        return filter_vouchers(Voucher.objects.all(), request.query_params, allow_agent=True)
 
-        vouchers_data = []
-        for voucher in vouchers:
-            flight_info = voucher.flight_info if hasattr(
-                voucher, 'flight_info') else None
+    def list_fingerprint(self, request):
+        return [vouchers.order_by().aggregate(count=Count('id'), latest=Max('updated_at'))
+                for vouchers in each_shard(self.vouchers(request))]
+
+    def list_data(self, request):
+        # Summary columns on Voucher, no joins
+        vouchers = self.vouchers(request).only(
+            'id', 'vNo', 'agentName', 'groupName', 'status', 'arrival_date',
+            'return_date', 'nights', 'pax_count', 'created_at', 'updated_at'
+        )
 
+        vouchers_data = []
+        for voucher in fan_out(vouchers):
             vouchers_data.append({
                 'id': voucher.id,
                 'vNo': voucher.vNo,
                 'agentName': voucher.agentName,
                 'groupName': voucher.groupName,
                 'status': voucher.status,
-                'arrival_date': flight_info.arrival_date if flight_info else None,
-                'return_date': flight_info.return_date if flight_info else None,
-                'nights': flight_info.nights if flight_info else 0,
-                'mautamers_count': voucher.voucher_mautamers.count(),
+                'arrival_date': voucher.arrival_date,
+                'return_date': voucher.return_date,
+                'nights': voucher.nights,
+                'mautamers_count': voucher.pax_count,
                 'created_at': voucher.created_at,
                 'updated_at': voucher.updated_at
             })
 
-        return Response(vouchers_data)
+        return vouchers_data
 
 
 # Mautamer Views
-class AgentMautamerListView(APIView):
+class AgentMautamerListView(CompressedListMixin, APIView):
     """
     Agent apne mautamers ki list dekhne ke liye
-    GET: Returns all mautamers for logged-in agent
+    GET: Returns all mautamers for logged-in agent (compressed, cached per agent)
     """
     permission_classes = [IsAuthenticated]
+    read_from_replica = True
 
-    def get(self, request):
+    def cache_scope(self, request):
+        return request.user.id
+
+    def list_fingerprint(self, request):
+        return Mautamer.objects.filter(user=request.user).order_by().aggregate(
+            count=Count('id'), latest=Max('updated_at'))
+
+    def list_data(self, request):
         mautamers = Mautamer.objects.filter(user=request.user)
         serializer = MautamerSerializer(mautamers, many=True)
-        return Response(serializer.data)
+        return serializer.data
 
 
-class AgentCreateView(APIView):
+class AgentExportView(APIView):
+    """
+    GET: Agent apna poora data ek file mein download kare (api/export.py),
+    streamed in chunks. ?output=ndjson (default) or ?output=csv for a zip
+    with one CSV per table.
+    """
+    permission_classes = [IsAuthenticated]
+    read_from_replica = True
+
+    def get(self, request):
+        return self.export(request, request.user)
+
+    def export(self, request, agent):
+        output = request.query_params.get('output', NDJSON)
+        if output not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"output must be one of: {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Picked now, the request's shard/replica is reset before the body streams
+        exporter = Exporter(agent.id, router.db_for_read(Voucher))
+        filename = f'{agent.username}-{timezone.now():%Y%m%d}'
+        if output == CSV:
+            content, content_type = exporter.csv_zip(), 'application/zip'
+            filename += '.zip'
+        else:
+            content, content_type = exporter.ndjson(), 'application/x-ndjson'
+            filename += '.ndjson'
+        if isinstance(request._request, ASGIRequest):
+            # ASGI would read a sync iterator to the end before sending anything
+            content = threaded(content)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class AdminAgentExportView(AgentShardMixin, AgentExportView):
+    """Admin only: the same export for any agent"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, agent_id):
+        try:
+            agent = User.objects.get(id=agent_id, is_staff=False)
+        except User.DoesNotExist:
+            return Response(
+                {'error': 'Agent not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return self.export(request, agent)
+
+
+class AgentCreateView(ThrottleFirstMixin, APIView):
     """
     Admin only: Create agent with mautamers
     POST: Create new agent and upload their mautamers
     """
     permission_classes = [IsAdminUser]
+    throttle_classes = [AdminUploadThrottle]
 
     def post(self, request):
         serializer = AgentCreateSerializer(data=request.data)
@@ -164,7 +448,7 @@ class AgentCreateView(APIView):
             user = serializer.save()
 
             # Get created mautamers count
-            mautamers_count = Mautamer.objects.filter(user=user).count()
+            mautamers_count = user.mautamers.count()
 
             return Response(
                 {
@@ -184,17 +468,21 @@ class AgentListView(APIView):
     Admin only: Get all agents (non-staff users)
     """
     permission_classes = [IsAdminUser]
+    read_from_replica = True
 
     def get(self, request):
         agents = User.objects.filter(is_staff=False).order_by('username')
+        # Grouped counts, they may live on other databases than the users
+        mautamers_counts = counts_by_user(Mautamer)
+        vouchers_counts = counts_by_user(Voucher)
 
         agents_data = []
         for agent in agents:
             agents_data.append({
                 'id': agent.id,
                 'username': agent.username,
-                'mautamers_count': agent.mautamers.count(),
-                'vouchers_count': agent.vouchers.count(),
+                'mautamers_count': mautamers_counts[agent.id],
+                'vouchers_count': vouchers_counts[agent.id],
                 'date_joined': agent.date_joined
             })
 
@@ -253,12 +541,13 @@ class AgentUpdateView(APIView):
         )
 
 
-class AgentMautamerUploadView(APIView):
+class AgentMautamerUploadView(ThrottleFirstMixin, AgentShardMixin, APIView):
     """
     Admin only: Upload mautamers for existing agent
     POST: Bulk upload mautamers for an agent
     """
     permission_classes = [IsAdminUser]
+    throttle_classes = [AdminUploadThrottle]
 
     def post(self, request, agent_id):
         try:
@@ -281,32 +570,37 @@ class AgentMautamerUploadView(APIView):
         replace_existing = request.data.get('replace_existing', False)
 
         if replace_existing:
-            # Delete existing mautamers for this agent
+            # Delete existing mautamers for this agent, their vouchers lose passengers
+            affected = list(Voucher.objects.filter(
+                voucher_mautamers__mautamer__user=agent).values_list('id', flat=True).distinct())
             agent.mautamers.all().delete()
-
-        # Create new mautamers
-        created_count = 0
-        skipped_count = 0
-
-        for mautamer_data in mautamers_data:
-            if 'pax_name' not in mautamer_data or 'passport' not in mautamer_data:
+            Voucher.objects.filter(id__in=affected).refresh_summaries()
+
+        valid_rows = [
+            mautamer_data for mautamer_data in mautamers_data
+            if 'pax_name' in mautamer_data and 'passport' in mautamer_data
+        ]
+        skipped_count = len(mautamers_data) - len(valid_rows)
+
+        # Check for duplicates - agent ke existing passports ek saath fetch,
+        # normalized so "ab 1234567" and "AB1234567" are the same passport
+        keys = [normalize_passport(row['passport']) for row in valid_rows]
+        existing = existing_passports(agent, keys)
+
+        new_mautamers = []
+        for mautamer_data, key in zip(valid_rows, keys):
+            if key in existing:
                 skipped_count += 1
                 continue
-
-            # Check for duplicates
-            if Mautamer.objects.filter(
-                user=agent,
-                passport=mautamer_data['passport']
-            ).exists():
-                skipped_count += 1
-                continue
-
-            Mautamer.objects.create(
+            existing.add(key)
+            new_mautamers.append(Mautamer(
                 user=agent,
                 pax_name=mautamer_data['pax_name'],
                 passport=mautamer_data['passport']
-            )
-            created_count += 1
+            ))
+
+        Mautamer.objects.bulk_create(new_mautamers, batch_size=500)
+        created_count = len(new_mautamers)
 
         return Response(
             {
@@ -317,3 +611,71 @@ class AgentMautamerUploadView(APIView):
             },
             status=status.HTTP_201_CREATED
         )
+
+
+class MautamerConflictAuditView(APIView):
+    """
+    Admin only: Mautamers booked on overlapping trips.
+    ?returning_after=YYYY-MM-DD skips trips already over, ?agent=<id> one agent
+    """
+    permission_classes = [IsAdminUser]
+    read_from_replica = True
+
+    def get(self, request):
+        returning_after = request.query_params.get('returning_after')
+        if returning_after:
+            returning_after = parse_date('returning_after', returning_after)
+        agent = request.query_params.get('agent')
+        if agent and not agent.isdigit():
+            return Response({'agent': ['Agent must be a user id.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        trips = audit_trips(returning_after or None, int(agent) if agent else None)
+        # A mautamer's trips are all on its agent's shard
+        conflicts = [conflict_data(earlier, later)
+                     for shard_trips in each_shard(trips)
+                     for earlier, later in find_conflicts(shard_trips.iterator())]
+        return Response({'count': len(conflicts), 'conflicts': conflicts})
+
+
+class PassportDuplicateReportView(APIView):
+    """
+    Admin only: Same traveller (normalized passport) registered by several
+    agents (api/passports.py). ?min_agents=<n>, default 2
+    """
+    permission_classes = [IsAdminUser]
+    read_from_replica = True
+
+    def get(self, request):
+        min_agents = request.query_params.get('min_agents', '2')
+        if not min_agents.isdigit() or int(min_agents) < 2:
+            return Response({'min_agents': ['Must be a number, 2 or more.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        duplicates = list(duplicate_report(int(min_agents)))
+        return Response({'count': len(duplicates), 'duplicates': duplicates})
+
+
+class BatchView(APIView):
+    """
+    Several API calls in one request, answered together (api/batch.py):
+    {"requests": [{"id", "method", "path", "body"}, ...]}
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['requests']
+        results = Batch(request, items).run()
+        return HttpResponse(render_batch(items, results), content_type='application/json')
+
+
+class MetricsView(APIView):
+    """
+    Admin only: Per-route request metrics in Prometheus text format
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.PerformanceMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -53,6 +54,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ReplicaMiddleware',
+    'api.middleware.ShardMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -82,9 +85,48 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
 }
 
+DATABASE_ROUTERS = [
+    'api.routers.ArchiveRouter', 'api.sharding.ShardRouter', 'api.routers.ReplicaRouter',
+]
+
+# Archived vouchers ka database. Alag SQLite file ke liye DATABASES mein
+# 'archive' add karein, yahan 'archive' likhein aur
+# `python manage.py migrate --database archive` chalayein.
+ARCHIVE_DATABASE = 'default'
+
+# Read replicas - list endpoints ke GET inse parhte hain. Local testing ke
+# liye DATABASES mein e.g.
+#   'replica': {'ENGINE': 'django.db.backends.sqlite3',
+#               'NAME': BASE_DIR / 'replica.sqlite3', 'TEST': {'MIRROR': 'default'}}
+# add karein, yahan ['replica'] likhein aur `python manage.py sync_replica`
+# se db.sqlite3 copy karein.
+DATABASE_REPLICAS = []
+# Write ke baad itne seconds tak us user ki reads primary se hongi
+REPLICA_PIN_SECONDS = 5
+
+# Per-agent sharding (api/sharding.py) - har agent ke mautamers aur vouchers
+# sirf uske shard mein. Local testing:
+#   DATABASE_SHARDS = ['default', 'shard2', 'shard3']
+#   python manage.py migrate --database shard2   (aur shard3)
+#   python manage.py rebalance_shards --init     (purane agents 'default' pe)
+# Sharded models replicas se nahi parhe jate.
+DATABASE_SHARDS = []
+# Local shard files - sirf jab DATABASE_SHARDS mein hon. Tests ke databases
+# backend/test_settings.py mein hain.
+for _alias in ('shard2', 'shard3'):
+    if _alias in DATABASE_SHARDS:
+        DATABASES[_alias] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / f'{_alias}.sqlite3',
+        }
+# Shard map har worker mein itne seconds cache hota hai
+SHARD_MAP_CACHE_SECONDS = 30
+# Sharded tables ki nayi ids har worker itni itni reserve karta hai (ShardIdSequence)
+SHARD_ID_BLOCK_SIZE = 100
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -135,7 +177,24 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    # Token buckets per client (api/throttling.py) - '10/min' matlab 10 ka
+    # burst, phir har 6 second mein ek request. Har worker ki apni buckets.
+    'DEFAULT_THROTTLE_RATES': {
+        'login': '10/min',
+        'register': '5/min',
+        'token_refresh': '30/min',
+        'admin_upload': '30/min',
+    },
+    # Client IP sirf REMOTE_ADDR se - X-Forwarded-For client khud bhej sakta
+    # hai. Reverse proxy ke peeche us se pehle ke proxies ki ginti likhein.
+    'NUM_PROXIES': 0,
 }
+# Itne clients tak ki buckets memory mein, purani pehle nikalti hain
+THROTTLE_MAX_KEYS = 100000
 
 
 # Simple JWT settings
@@ -213,3 +272,45 @@ CORS_ALLOW_HEADERS = [
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+
+
+# Voucher events - agents ko status changes push karne ke liye (SSE, ASGI only)
+VOUCHER_EVENTS_BROKER = 'api.events.InMemoryBroker'
+VOUCHER_EVENTS_QUEUE_SIZE = 100
+# Seconds between keepalive comments on idle streams
+VOUCHER_EVENTS_KEEPALIVE = 15
+
+# Performance metrics - SQL is slow query log mein jati hai agar itne ms se zyada le
+SLOW_QUERY_THRESHOLD_MS = 100
+
+# Voucher numbers - agar client vNo na bheje to server khud deta hai.
+# Har worker ek block reserve karta hai, har voucher pe DB round trip nahi
+VOUCHER_NUMBER_PREFIX = 'TA'
+VOUCHER_NUMBER_FORMAT = '{prefix}-{number:06d}'
+VOUCHER_NUMBER_BLOCK_SIZE = 50
+
+# Badi list responses (admin vouchers, agent mautamers) compress hokar memory
+# mein cache hoti hain, per worker itne bytes tak (api/compression.py)
+COMPRESSED_LIST_CACHE_BYTES = 64 * 1024 * 1024
+
+# Voucher change journal (api/journal.py) - entries memory mein buffer hoti
+# hain aur background thread inhe batches mein likhta hai. Crash pe zyada se
+# zyada itne seconds (ya MAX_PENDING entries) ki history ja sakti hai.
+VOUCHER_JOURNAL_BACKGROUND = True
+VOUCHER_JOURNAL_FLUSH_INTERVAL = 1.0
+VOUCHER_JOURNAL_BATCH_SIZE = 200
+VOUCHER_JOURNAL_MAX_PENDING = 5000
+
+# Admin changelists - itni rows tak exact count, us se upar bari tables ka
+# estimate aur filtered lists ka count yahin ruk jata hai (api/pagination.py)
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# Agent export (api/export.py) - itni rows ek chunk mein parhi aur likhi
+# jati hain, memory isi se bounded hai
+EXPORT_CHUNK_SIZE = 500
+
+# Batch endpoint (api/batch.py) - ek batch mein zyada se zyada itni requests.
+# Workers 1 se zyada hon to lagatar GET requests utne threads par chalti hain,
+# har thread ka apna DB connection - SQLite par 1 hi rakhein
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 1
@@ -0,0 +1,18 @@
+"""
+Settings for the test suite: backend/settings.py plus the databases the
+sharding and replica tests use. They are only ever created as test
+databases (in memory), never opened otherwise.
+
+    python manage.py test api                      (manage.py picks this module)
+    DJANGO_SETTINGS_MODULE=backend.test_settings pytest
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+DATABASES = {
+    **DATABASES,
+    # api/tests/test_sharding.py
+    'shard2': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'shard2.sqlite3'},
+    # api/tests/test_replicas.py - no TEST MIRROR, so it can lag behind 'default'
+    'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'replica.sqlite3'},
+}
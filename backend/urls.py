@@ -1,12 +1,15 @@
 from django.contrib import admin
 from django.urls import path
 from api.views import (
-    RegisterView, LoginView,
-    VoucherListCreateView, VoucherDetailView, VoucherStatusUpdateView,
+    RegisterView, LoginView, RefreshView,
+    VoucherListCreateView, VoucherDetailView, VoucherStatusUpdateView, VoucherHistoryView,
+    VoucherCloneView, VoucherTemplateListCreateView, VoucherTemplateDetailView,
+    VoucherTemplateApplyView,
     AdminVoucherListView, AgentMautamerListView,
-    AgentCreateView, AgentListView, AgentUpdateView, AgentMautamerUploadView
+    AgentCreateView, AgentListView, AgentUpdateView, AgentMautamerUploadView,
+    AgentExportView, AdminAgentExportView, MautamerConflictAuditView,
+    PassportDuplicateReportView, MetricsView, BatchView
 )
-from rest_framework_simplejwt.views import TokenRefreshView
 
 urlpatterns = [
     path('admin/', admin.site.urls),  # Django admin panel
@@ -14,11 +17,24 @@ urlpatterns = [
     # Authentication
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/refresh/', RefreshView.as_view(), name='token_refresh'),
+
+    # Several calls in one request
+    path('api/batch/', BatchView.as_view(), name='batch'),
 
     # Voucher CRUD (for both admin and agents)
     path('vouchers/', VoucherListCreateView.as_view(), name='voucher-list-create'),
     path('vouchers/<int:pk>/', VoucherDetailView.as_view(), name='voucher-detail'),
+    path('vouchers/<int:pk>/history/', VoucherHistoryView.as_view(), name='voucher-history'),
+    path('vouchers/<int:pk>/clone/', VoucherCloneView.as_view(), name='voucher-clone'),
+
+    # Voucher templates
+    path('voucher-templates/', VoucherTemplateListCreateView.as_view(),
+         name='voucher-template-list'),
+    path('voucher-templates/<int:pk>/', VoucherTemplateDetailView.as_view(),
+         name='voucher-template-detail'),
+    path('voucher-templates/<int:pk>/apply/', VoucherTemplateApplyView.as_view(),
+         name='voucher-template-apply'),
 
     # Admin - Voucher Management
     path('api/admin/vouchers/', AdminVoucherListView.as_view(),
@@ -34,8 +50,18 @@ urlpatterns = [
          AgentUpdateView.as_view(), name='admin-agent-update'),  # NEW
     path('api/admin/agents/<int:agent_id>/mautamers/',
          AgentMautamerUploadView.as_view(), name='admin-agent-mautamer-upload'),
+    path('api/admin/agents/<int:agent_id>/export/',
+         AdminAgentExportView.as_view(), name='admin-agent-export'),
+    path('api/admin/mautamers/conflicts/',
+         MautamerConflictAuditView.as_view(), name='admin-mautamer-conflicts'),
+    path('api/admin/mautamers/duplicates/',
+         PassportDuplicateReportView.as_view(), name='admin-mautamer-duplicates'),
+
+    # Admin - Monitoring
+    path('api/admin/metrics/', MetricsView.as_view(), name='admin-metrics'),
 
     # Agent - Mautamer Access
     path('api/agent/mautamers/', AgentMautamerListView.as_view(),
          name='agent-mautamer-list'),
+    path('api/agent/export/', AgentExportView.as_view(), name='agent-export'),
 ]
@@ -0,0 +1,60 @@
+"""
+Production server: gunicorn -c gunicorn.conf.py
+
+The app is loaded and warmed once in the master and the workers are forked
+from it (see api/startup.py), so they start serving immediately and share
+the loaded code. Environment:
+
+    BIND              address, default 0.0.0.0:5000
+    WEB_CONCURRENCY   worker count, default 2 * CPUs + 1
+    SERVER_MODE       wsgi (default) or asgi; asgi serves vouchers/events/
+                      and needs `pip install uvicorn`. With more than one
+                      worker VOUCHER_EVENTS_BROKER must be shared between
+                      processes, the in-memory broker only sees its own worker.
+    THREADS           threads per WSGI worker, default 1
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+
+if os.environ.get('SERVER_MODE', 'wsgi') == 'asgi':
+    wsgi_app = 'backend.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    # Event streams stay open, don't kill the worker under them
+    timeout = 0
+else:
+    wsgi_app = 'backend.wsgi:application'
+    threads = int(os.environ.get('THREADS', 1))
+    worker_class = 'gthread' if threads > 1 else 'sync'
+    timeout = 30
+
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then; jitter so they don't all restart together
+max_requests = 2000
+max_requests_jitter = 200
+
+
+def when_ready(server):
+    from api.startup import prepare_fork, warm
+
+    timings = warm()
+    server.log.info('Warmed in %.3fs: %s', sum(timings.values()),
+                    ', '.join(f'{name} {seconds:.3f}s' for name, seconds in timings.items()))
+    prepare_fork()
+
+
+def post_fork(server, worker):
+    from api.startup import after_fork
+
+    after_fork()
+
+
+def worker_exit(server, worker):
+    from api.journal import get_journal
+
+    # Buffered journal entries of a worker going away
+    get_journal().flush()